@@ -0,0 +1,132 @@
+"""Extracción y validación de las acciones estructuradas de las respuestas.
+
+El modelo agrega al final de su respuesta bloques JSON entre marcadores:
+`###TASK_JSON###` (tareas programadas de /chat) y `###ACTION_JSON###`
+(transferencias, contactos y pagos de /transaction-chat). Un solo
+`ExtractorAcciones` sirve para la respuesta completa y para el stream:
+recorre el texto una vez (`FiltroMarcadores`), separa el texto visible de
+los bloques y valida cada bloque contra su esquema Pydantic.
+
+Se aceptan varios bloques por respuesta. Los bloques mal formados o que no
+cumplen el esquema se registran en el log con el motivo y no se devuelven.
+"""
+import json
+import re
+from typing import Annotated, Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
+
+from streaming import FiltroMarcadores
+
+MARCADOR_TAREA = "###TASK_JSON###"
+MARCADOR_ACCION = "###ACTION_JSON###"
+# El modelo a veces envuelve el JSON en un bloque de código markdown
+CERCO_CODIGO = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+class Esquema(BaseModel):
+    # Montos como número o texto; los campos extra que agregue el modelo se conservan
+    model_config = ConfigDict(coerce_numbers_to_str=True, extra="allow")
+
+
+class DatosTransferencia(Esquema):
+    amount: str
+    token: str
+    network: Optional[str] = None
+    recipient_name: str
+    recipient_email: Optional[str] = None
+    description: Optional[str] = None
+
+
+class DatosContacto(Esquema):
+    name: str
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    wallet_address: Optional[str] = None
+
+
+class DatosPagoServicio(Esquema):
+    service_name: str
+    amount: str
+    token: str
+    network: Optional[str] = None
+    description: Optional[str] = None
+
+
+class Transferencia(Esquema):
+    id: str
+    type: Literal["transfer"]
+    data: DatosTransferencia
+
+
+class RegistroContacto(Esquema):
+    id: str
+    type: Literal["contact_register"]
+    data: DatosContacto
+
+
+class PagoServicio(Esquema):
+    id: str
+    type: Literal["service_payment"]
+    data: DatosPagoServicio
+
+
+class Tarea(Esquema):
+    id: str
+    title: str
+    type: Literal["buy", "sell", "transfer", "stake"]
+    amount: str
+    token: str
+    network: Optional[str] = None
+    gasEstimate: Optional[str] = None
+
+
+ESQUEMA_ACCION = TypeAdapter(Annotated[
+    Union[Transferencia, RegistroContacto, PagoServicio], Field(discriminator="type")
+])
+ESQUEMA_TAREA = TypeAdapter(Tarea)
+
+
+def validar_bloque(texto, esquema):
+    """Dict validado del bloque, o None (el motivo va al log)"""
+    texto = CERCO_CODIGO.sub("", texto.strip())
+    try:
+        modelo = esquema.validate_python(json.loads(texto))
+    except json.JSONDecodeError as e:
+        print(f"Bloque de acción con JSON inválido: {e}")
+        return None
+    except ValidationError as e:
+        errores = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        print(f"Bloque de acción fuera de esquema: {errores}")
+        return None
+    return modelo.model_dump(exclude_none=True)
+
+
+class ExtractorAcciones(FiltroMarcadores):
+    """FiltroMarcadores que además valida los bloques al terminar"""
+
+    def __init__(self, marcador, esquema):
+        super().__init__(marcador)
+        self.esquema = esquema
+        self.bloques = []
+
+    @classmethod
+    def tareas(cls):
+        return cls(MARCADOR_TAREA, ESQUEMA_TAREA)
+
+    @classmethod
+    def acciones(cls):
+        return cls(MARCADOR_ACCION, ESQUEMA_ACCION)
+
+    def terminar(self):
+        restante = super().terminar()
+        self.bloques = [
+            bloque for bloque in (validar_bloque(seccion, self.esquema) for seccion in self.secciones)
+            if bloque is not None
+        ]
+        return restante
+
+    def extraer(self, texto):
+        """Respuesta completa de una pasada: (texto visible, bloques válidos)"""
+        visible = self.alimentar(texto) + self.terminar()
+        return visible.strip(), self.bloques
@@ -0,0 +1,79 @@
+"""Recepción de audio para /transcribe sin copias completas en memoria.
+
+El cuerpo de la petición se lee por fragmentos y se acumula en un buffer
+acotado: mientras es chico vive en memoria y, al pasar de
+`TRANSCRIPCION_SPOOL_KB`, se vuelca a un archivo temporal. Si supera
+`TRANSCRIPCION_MAX_MB` se corta la lectura y se responde 413 sin haber
+guardado el resto. El archivo resultante se pasa tal cual al cliente de
+Whisper, que lo envía por partes.
+
+Para multipart, `limitar_receive` cuenta los bytes del cuerpo conforme los
+lee el parser de Starlette, así el límite también aplica a las subidas sin
+`Content-Length` (transfer-encoding chunked).
+"""
+import io
+import os
+import tempfile
+
+TRANSCRIPCION_MAX_MB = float(os.getenv("TRANSCRIPCION_MAX_MB", "25"))
+TRANSCRIPCION_SPOOL_KB = int(os.getenv("TRANSCRIPCION_SPOOL_KB", "1024"))
+LIMITE_BYTES = int(TRANSCRIPCION_MAX_MB * 1024 * 1024)
+
+
+class AudioDemasiadoGrande(Exception):
+    def __init__(self, limite=LIMITE_BYTES):
+        super().__init__(f"El audio supera el límite de {limite / 1024 / 1024:.0f} MB")
+        self.limite = limite
+
+
+def limitar_receive(receive, limite=LIMITE_BYTES):
+    """`receive` ASGI que lanza AudioDemasiadoGrande en cuanto el cuerpo supera `limite` bytes"""
+    total = 0
+
+    async def recibir():
+        nonlocal total
+        mensaje = await receive()
+        if mensaje["type"] == "http.request":
+            total += len(mensaje.get("body", b""))
+            if total > limite:
+                raise AudioDemasiadoGrande(limite)
+        return mensaje
+
+    return recibir
+
+
+async def acumular_audio(fragmentos, limite=LIMITE_BYTES, en_memoria=TRANSCRIPCION_SPOOL_KB * 1024):
+    """Lee un iterador asíncrono de bytes a un buffer acotado; devuelve (archivo, tamaño)"""
+    archivo = io.BytesIO()
+    total = 0
+    try:
+        async for fragmento in fragmentos:
+            total += len(fragmento)
+            if total > limite:
+                raise AudioDemasiadoGrande(limite)
+            if isinstance(archivo, io.BytesIO) and total > en_memoria:
+                # Pasa del umbral: lo ya recibido y lo que falte van a disco
+                disco = tempfile.TemporaryFile()
+                disco.write(archivo.getbuffer())
+                archivo = disco
+            archivo.write(fragmento)
+    except BaseException:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo, total
+
+
+# Subtipo MIME -> extensión que acepta Whisper
+EXTENSIONES = {
+    "webm": "webm", "ogg": "ogg", "wav": "wav", "x-wav": "wav", "wave": "wav",
+    "mpeg": "mp3", "mp3": "mp3", "mp4": "mp4", "m4a": "m4a", "x-m4a": "m4a", "flac": "flac",
+}
+
+
+def nombre_audio(nombre, tipo_contenido):
+    """Nombre con extensión para que Whisper reconozca el formato"""
+    if nombre and "." in nombre:
+        return os.path.basename(nombre)
+    subtipo = (tipo_contenido or "").split(";")[0].split("/")[-1].strip().lower()
+    return f"audio.{EXTENSIONES.get(subtipo, 'webm')}"
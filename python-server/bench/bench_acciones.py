@@ -0,0 +1,180 @@
+"""Fuzzing y microbenchmark del extractor de acciones (`acciones.py`).
+
+Fuzzing: genera respuestas aleatorias con texto, bloques válidos, JSON roto,
+bloques fuera de esquema, bloques en ```json, marcadores parciales y
+bloques sin cerrar. Para cada una verifica que el extractor no falle, que
+el resultado sea idéntico en una pasada y alimentándolo por fragmentos
+aleatorios (como llega el stream), que no quede ningún marcador en el
+texto visible y que salgan exactamente los bloques válidos.
+
+Microbenchmark: respuestas grandes con la extracción anterior (split +
+json.loads) contra el extractor en una pasada y en streaming.
+
+Uso (desde python-server/):
+    python -m bench.bench_acciones --casos 5000
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+
+from acciones import MARCADOR_ACCION, ExtractorAcciones
+
+PALABRAS = "listo voy a preparar la transferencia de 100 pesos a Ana por Polygon # ## ### { } ACTION".split()
+
+ACCION_VALIDA = {
+    "id": "action-1",
+    "type": "transfer",
+    "data": {"amount": 100, "token": "USDT", "network": "Polygon", "recipient_name": "Ana"},
+}
+CONTACTO_VALIDO = {
+    "id": "action-2",
+    "type": "contact_register",
+    "data": {"name": "Luis", "email": "luis@example.com"},
+}
+FUERA_DE_ESQUEMA = {"id": "action-3", "type": "transfer", "data": {"amount": "5"}}
+
+
+def texto_aleatorio(rng):
+    return " ".join(rng.choice(PALABRAS) for _ in range(rng.randint(0, 30)))
+
+
+def respuesta_aleatoria(rng):
+    """(respuesta, bloques válidos esperados)"""
+    partes = [texto_aleatorio(rng)]
+    esperados = []
+    for _ in range(rng.randint(0, 3)):
+        tipo = rng.choice(["valida", "contacto", "cerco", "rota", "esquema"])
+        if tipo == "valida":
+            cuerpo = json.dumps(ACCION_VALIDA)
+            esperados.append(ACCION_VALIDA)
+        elif tipo == "contacto":
+            cuerpo = json.dumps(CONTACTO_VALIDO, indent=2)
+            esperados.append(CONTACTO_VALIDO)
+        elif tipo == "cerco":
+            cuerpo = "```json\n" + json.dumps(ACCION_VALIDA) + "\n```"
+            esperados.append(ACCION_VALIDA)
+        elif tipo == "rota":
+            cuerpo = json.dumps(ACCION_VALIDA)[:rng.randint(1, 40)]
+        else:
+            cuerpo = json.dumps(FUERA_DE_ESQUEMA)
+        partes.append(f"{MARCADOR_ACCION}\n{cuerpo}\n{MARCADOR_ACCION}")
+        partes.append(texto_aleatorio(rng))
+    if rng.random() < 0.2:
+        # Respuesta cortada a mitad de un bloque
+        partes.append(MARCADOR_ACCION + json.dumps(ACCION_VALIDA)[:20])
+    if rng.random() < 0.2:
+        partes.append(MARCADOR_ACCION[:rng.randint(1, len(MARCADOR_ACCION) - 1)])
+    separador = rng.choice(["", " ", "\n"])
+    return separador.join(partes), esperados
+
+
+def normalizar_bloque(bloque):
+    return json.loads(json.dumps(bloque))
+
+
+def esperado_normalizado(bloque):
+    """Lo que debe devolver el esquema: montos como texto"""
+    resultado = json.loads(json.dumps(bloque))
+    if "amount" in resultado.get("data", {}):
+        resultado["data"]["amount"] = str(resultado["data"]["amount"])
+    return resultado
+
+
+def en_fragmentos(texto, rng):
+    i = 0
+    while i < len(texto):
+        largo = rng.randint(1, 12)
+        yield texto[i:i + largo]
+        i += largo
+
+
+def verificar(respuesta, esperados, rng):
+    """Lanza AssertionError si el extractor se equivoca con `respuesta`"""
+    # Los bloques inválidos se registran con print: se silencian aquí
+    with contextlib.redirect_stdout(io.StringIO()):
+        visible, bloques = ExtractorAcciones.acciones().extraer(respuesta)
+        extractor = ExtractorAcciones.acciones()
+        partes = [extractor.alimentar(f) for f in en_fragmentos(respuesta, rng)]
+        partes.append(extractor.terminar())
+    visible_stream = "".join(partes).strip()
+
+    assert visible == visible_stream, "una pasada y streaming difieren en el texto"
+    assert bloques == extractor.bloques, "una pasada y streaming difieren en los bloques"
+    assert MARCADOR_ACCION not in visible, "marcador en el texto visible"
+    assert [normalizar_bloque(b) for b in bloques] == [esperado_normalizado(b) for b in esperados], \
+        "bloques válidos distintos de los esperados"
+
+
+def fuzz(casos, semilla):
+    rng = random.Random(semilla)
+    fallas = 0
+    for caso in range(casos):
+        respuesta, esperados = respuesta_aleatoria(rng)
+        try:
+            verificar(respuesta, esperados, rng)
+        except AssertionError as e:
+            fallas += 1
+            if fallas <= 3:
+                print(f"Caso {caso}: {e}\n{respuesta!r}\n")
+    print(f"Fuzzing: {casos} casos, {fallas} fallas")
+    return fallas
+
+
+def extraer_anterior(ai_response):
+    """Implementación previa de /transaction-chat, para comparar"""
+    action_json = None
+    if MARCADOR_ACCION in ai_response:
+        try:
+            parts = ai_response.split(MARCADOR_ACCION)
+            if len(parts) >= 3:
+                action_json = json.loads(parts[1].strip())
+                ai_response = parts[0].strip() + (parts[2].strip() if len(parts) > 2 else "")
+        except Exception as e:
+            print(f"Error parseando action JSON: {e}")
+    return ai_response, action_json
+
+
+def microbenchmark(kb, repeticiones):
+    rng = random.Random(0)
+    texto = " ".join(rng.choice(PALABRAS[:12]) for _ in range(kb * 1024 // 6))
+    respuesta = f"{texto}\n{MARCADOR_ACCION}\n{json.dumps(ACCION_VALIDA)}\n{MARCADOR_ACCION}\n{texto}"
+    fragmentos = list(en_fragmentos(respuesta, rng))
+    print(f"Respuesta de {len(respuesta) / 1024:.0f} KB, {len(fragmentos)} fragmentos de stream")
+
+    def streaming():
+        extractor = ExtractorAcciones.acciones()
+        for fragmento in fragmentos:
+            extractor.alimentar(fragmento)
+        extractor.terminar()
+
+    for nombre, funcion in (
+        ("anterior", lambda: extraer_anterior(respuesta)),
+        ("una pasada", lambda: ExtractorAcciones.acciones().extraer(respuesta)),
+        ("streaming", streaming),
+    ):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion()
+        ms = (time.perf_counter() - inicio) / repeticiones * 1000
+        print(f"{nombre:>11}: {ms:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--casos", type=int, default=5000)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--kb", type=int, default=64)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    fallas = fuzz(args.casos, args.semilla)
+    microbenchmark(args.kb, args.repeticiones)
+    if fallas:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
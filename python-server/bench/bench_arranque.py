@@ -0,0 +1,79 @@
+"""Benchmark de arranque: importación de `main` y calentamiento del worker.
+
+Cada medición corre en un proceso nuevo (como un worker recién creado):
+
+- importación total de `main` y la parte propia (con fastapi y httpx ya
+  importados, que son el piso del framework)
+- que importar no dejó I/O hecho: sin SDK de openai, sin clientes HTTP,
+  sin archivos abiertos, portafolio, índice ni prompts construidos
+- ms de cada etapa del calentamiento del lifespan (`/ready` los reporta)
+
+Uso (desde python-server/):
+    python -m bench.bench_arranque --repeticiones 5
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MEDIR = r"""
+import json, sys, time
+inicio = time.perf_counter()
+if PRECARGAR:
+    import fastapi, fastapi.middleware.cors, fastapi.responses, httpx, pydantic
+base = time.perf_counter()
+import main
+fin = time.perf_counter()
+efectos = {
+    "openai_importado": "openai" in sys.modules,
+    "cliente_llm": main.llm._cliente is not None,
+    "cliente_precios": main.precios._http is not None,
+    "sqlite_usuarios": getattr(main.contexto_usuarios.almacen, "_conexion", None) is not None,
+    "almacen_compartido": getattr(main.almacen_compartido, "_conexion", None) is not None,
+    "portafolio": main.gestor_portafolio._snapshot is not None,
+    "indice_conocimiento": main.indice_conocimiento._indice is not None,
+    "prompts": bool(main.registro_prompts._compilados),
+}
+calentamiento = None
+if CALENTAR:
+    import asyncio
+
+    async def arrancar():
+        async with main.app.router.lifespan_context(main.app):
+            return dict(main.estado_servicio["arranque_ms"])
+
+    calentamiento = asyncio.run(arrancar())
+print(json.dumps({"total_ms": (fin - inicio) * 1000, "propio_ms": (fin - base) * 1000,
+                  "efectos": efectos, "calentamiento": calentamiento}))
+"""
+
+
+def medir(precargar, calentar):
+    codigo = f"PRECARGAR = {precargar}\nCALENTAR = {calentar}\n" + MEDIR
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    total = [medir(False, False)["total_ms"] for _ in range(args.repeticiones)]
+    propio = [medir(True, False)["propio_ms"] for _ in range(args.repeticiones)]
+    con_calentamiento = medir(False, True)
+
+    print(f"Importar main (total):         {statistics.median(total):7.1f} ms (mediana de {args.repeticiones})")
+    print(f"Importar main (sin framework): {statistics.median(propio):7.1f} ms")
+    efectos = [nombre for nombre, hecho in con_calentamiento["efectos"].items() if hecho]
+    print(f"I/O al importar:               {', '.join(efectos) if efectos else 'ninguno'}")
+    print("Calentamiento (lifespan):")
+    for etapa, ms in con_calentamiento["calentamiento"].items():
+        print(f"  {etapa:<28} {ms:7.1f} ms")
+    if efectos:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,222 @@
+"""Prueba de carga de los endpoints principales contra proveedores falsos.
+
+Levanta `main.app` en proceso (con su lifespan) y lo recorre con
+`httpx.ASGITransport`; Hicap y CoinGecko los sustituye el servidor falso
+(`fake_upstream`), con latencia y jitter configurables y respuestas
+plausibles según el prompt (`conversaciones.responder`). Cada endpoint se
+mide en su propia fase con `--concurrencia` peticiones a la vez:
+
+- throughput (req/s), latencia p50/p95/p99 y errores
+- llamadas al modelo y a CoinGecko por petición
+- RSS pico del proceso (incluye el servidor falso, que corre en otro hilo)
+
+Por defecto cada petición lleva un sufijo distinto para medir sin aciertos
+de caché; `--con-cache` repite los mensajes tal cual. `--json` guarda el
+reporte y `--comparar` lo contrasta con uno anterior (sale con código 1
+si throughput o p95/p99 empeoran más de `--tolerancia`).
+
+Uso (desde python-server/):
+    python -m bench.bench_carga --peticiones 200 --concurrencia 16 --json carga.json
+    python -m bench.bench_carga --comparar carga.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from bench import conversaciones, fake_upstream
+
+ENDPOINTS = ("chat", "transacciones", "educacion", "transcribe")
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+
+def rss_pico_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def con_sufijo(mensajes, i, variar):
+    """Copia de la conversación; con `variar`, el último mensaje lleva un sufijo único"""
+    if not variar:
+        return mensajes
+    copia = [dict(m) for m in mensajes]
+    copia[-1]["content"] = f"{copia[-1]['content']} (consulta {i})"
+    return copia
+
+
+def constructor(endpoint, variar, audio_b64):
+    """Función i -> (ruta, cuerpo JSON) para el endpoint"""
+    if endpoint == "chat":
+        return lambda i: ("/chat", {
+            "messages": con_sufijo(conversaciones.CHAT[i % len(conversaciones.CHAT)], i, variar),
+        })
+    if endpoint == "transacciones":
+        return lambda i: ("/transaction-chat", {
+            "messages": con_sufijo(conversaciones.TRANSACCIONES[i % len(conversaciones.TRANSACCIONES)], i, variar),
+        })
+    if endpoint == "educacion":
+        def educacion(i):
+            ejemplo = conversaciones.EDUCACION[i % len(conversaciones.EDUCACION)]
+            mensaje = f"{ejemplo['message']} (consulta {i})" if variar else ejemplo["message"]
+            return "/education-chat", {"message": mensaje, "history": ejemplo["history"]}
+        return educacion
+    return lambda i: ("/transcribe", {"audio": audio_b64})
+
+
+async def fase(http, endpoint, construir, peticiones, concurrencia, desde=0):
+    semaforo = asyncio.Semaphore(concurrencia)
+    latencias = []
+    errores = 0
+
+    async def una(i):
+        nonlocal errores
+        ruta, cuerpo = construir(i)
+        async with semaforo:
+            inicio = time.perf_counter()
+            respuesta = await http.post(ruta, json=cuerpo)
+            latencias.append(time.perf_counter() - inicio)
+        if respuesta.status_code != 200 or "error" in respuesta.json():
+            errores += 1
+
+    llm_antes = fake_upstream.config.llamadas
+    precios_antes = fake_upstream.config.llamadas_precios
+    inicio = time.perf_counter()
+    await asyncio.gather(*(una(i) for i in range(desde, desde + peticiones)))
+    duracion = time.perf_counter() - inicio
+    return {
+        "peticiones": peticiones,
+        "errores": errores,
+        "req_s": round(peticiones / duracion, 2),
+        "p50_ms": round(percentil(latencias, 0.50) * 1000, 1),
+        "p95_ms": round(percentil(latencias, 0.95) * 1000, 1),
+        "p99_ms": round(percentil(latencias, 0.99) * 1000, 1),
+        "llm_por_peticion": round((fake_upstream.config.llamadas - llm_antes) / peticiones, 2),
+        "precios_por_peticion": round((fake_upstream.config.llamadas_precios - precios_antes) / peticiones, 2),
+        "rss_pico_mb": round(rss_pico_mb(), 1),
+    }
+
+
+async def correr(args):
+    import httpx
+    import main
+
+    audio_b64 = base64.b64encode(fake_upstream.wav_sintetico(args.segundos_audio)).decode()
+    fases = {}
+    async with main.app.router.lifespan_context(main.app):
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://app", timeout=300) as http:
+            for endpoint in args.endpoints:
+                construir = constructor(endpoint, not args.con_cache, audio_b64)
+                # Calentamiento: importaciones perezosas, índices y conexiones del pool
+                # (con índices propios para no calentar la caché de la fase medida)
+                await fase(http, endpoint, construir, min(args.concurrencia, args.peticiones),
+                           args.concurrencia, desde=args.peticiones)
+                fases[endpoint] = await fase(http, endpoint, construir, args.peticiones, args.concurrencia)
+    return fases
+
+
+def imprimir(reporte):
+    print(f"{'endpoint':>14} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>5} "
+          f"{'llm/req':>8} {'cg/req':>7} {'rss MB':>7}")
+    for endpoint, r in reporte["fases"].items():
+        print(f"{endpoint:>14} {r['req_s']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+              f"{r['errores']:>5} {r['llm_por_peticion']:>8.2f} {r['precios_por_peticion']:>7.2f} "
+              f"{r['rss_pico_mb']:>7.1f}")
+
+
+def comparar(reporte, base, tolerancia):
+    """Imprime los cambios contra `base`; True si algo empeoró más de la tolerancia"""
+    print(f"\nContra {base.get('commit') or 'base'} (tolerancia {tolerancia:.0%}):")
+    empeoro = False
+    for endpoint, actual in reporte["fases"].items():
+        anterior = base.get("fases", {}).get(endpoint)
+        if not anterior:
+            continue
+        cambios = []
+        for metrica, mayor_es_mejor in (("req_s", True), ("p95_ms", False), ("p99_ms", False)):
+            if not anterior[metrica]:
+                continue
+            delta = (actual[metrica] - anterior[metrica]) / anterior[metrica]
+            peor = -delta if mayor_es_mejor else delta
+            marca = " ⚠️" if peor > tolerancia else ""
+            empeoro |= peor > tolerancia
+            cambios.append(f"{metrica} {delta:+.1%}{marca}")
+        print(f"{endpoint:>14}: " + ", ".join(cambios))
+    return empeoro
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        type=lambda v: [e for e in v.split(",") if e in ENDPOINTS])
+    parser.add_argument("--peticiones", type=int, default=200, help="por endpoint")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--latencia", type=float, default=0.2, help="latencia del modelo falso (s)")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--latencia-token", type=float, default=0.005)
+    parser.add_argument("--latencia-precios", type=float, default=0.05)
+    parser.add_argument("--segundos-audio", type=int, default=5)
+    parser.add_argument("--con-cache", action="store_true", help="repetir mensajes (permite aciertos de caché)")
+    parser.add_argument("--json", help="guardar el reporte en este archivo")
+    parser.add_argument("--comparar", help="reporte anterior para comparar")
+    parser.add_argument("--tolerancia", type=float, default=0.25)
+    parser.add_argument("--semilla", type=int, default=1, help="jitter reproducible entre corridas")
+    args = parser.parse_args()
+
+    random.seed(args.semilla)
+    fake_upstream.config.latencia = args.latencia
+    fake_upstream.config.jitter = args.jitter
+    fake_upstream.config.latencia_token = args.latencia_token
+    fake_upstream.config.latencia_precios = args.latencia_precios
+    fake_upstream.config.responder = conversaciones.responder
+    servidor, url = fake_upstream.iniciar()
+    os.environ["HICAP_BASE_URL"] = f"{url}/v1"
+    os.environ["HICAP_API_KEY"] = "fake"
+    os.environ["COINGECKO_URL"] = f"{url}/api/v3"
+    os.environ["CACHE_COMPARTIDA"] = ""
+
+    try:
+        fases = asyncio.run(correr(args))
+    finally:
+        servidor.should_exit = True
+
+    reporte = {
+        "commit": commit_actual(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "comparar")},
+        "fases": fases,
+        "rss_pico_mb": round(rss_pico_mb(), 1),
+    }
+    imprimir(reporte)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"\nReporte guardado en {args.json}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        if comparar(reporte, base, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_bench()
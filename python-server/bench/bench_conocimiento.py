@@ -0,0 +1,79 @@
+"""Benchmark de recuperación de conocimiento: latencia y tamaño del contexto.
+
+Compara el filtro anterior por palabras clave (que devolvía toda la base
+cuando no había coincidencia) con el índice BM25.
+
+Uso (desde python-server/):
+    python -m bench.bench_conocimiento --repeticiones 2000
+"""
+import argparse
+import statistics
+import time
+
+import main
+from conocimiento import estimar_tokens
+
+CONSULTAS = [
+    "¿Cómo puedo ahorrar más dinero cada mes?",
+    "Quiero pagar mis deudas de tarjeta más rápido",
+    "¿Qué es el gas fee y cómo lo reduzco?",
+    "¿Cómo funciona el staking en Ethereum?",
+    "¿Me conviene invertir en cripto si soy principiante?",
+    "Ayúdame a armar un presupuesto mensual",
+    "¿Qué es DCA?",
+    "cómo junto dinero para un viaje",
+    "¿Es seguro compartir mi seed phrase?",
+    "hola",
+]
+
+
+def extraer_anterior(query):
+    """Implementación previa de extract_relevant_knowledge, para comparar"""
+    query_lower = query.lower()
+    sections = main.FINANCIAL_KNOWLEDGE_BASE.split('\n## ')
+    relevant_sections = [
+        section for section in sections
+        if any(keyword in section.lower() for keyword in [
+            'ahorro' if 'ahorro' in query_lower else '',
+            'gasto' if 'gasto' in query_lower else '',
+            'inversión' if 'inversión' in query_lower else '',
+            'deuda' if 'deuda' in query_lower else '',
+            'presupuesto' if 'presupuesto' in query_lower else '',
+            'crypto' if 'crypto' in query_lower else ''
+        ]) if any(keyword in section.lower() for keyword in ['ahorro', 'gasto', 'inversión', 'deuda', 'presupuesto', 'crypto'])
+    ]
+    return '## ' + '\n## '.join(relevant_sections) if relevant_sections else main.FINANCIAL_KNOWLEDGE_BASE
+
+
+def medir(funcion, repeticiones):
+    latencias = []
+    tokens = []
+    for consulta in CONSULTAS:
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            contexto = funcion(consulta)
+        latencias.append((time.perf_counter() - inicio) / repeticiones * 1e6)
+        tokens.append(estimar_tokens(contexto))
+    return latencias, tokens
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    indice = main.indice_conocimiento.construir()
+    construccion_ms = (time.perf_counter() - inicio) * 1000
+    print(f"Índice: {len(indice.secciones)} secciones, {len(indice.postings)} términos, "
+          f"construido en {construccion_ms:.1f} ms")
+
+    for nombre, funcion in (("anterior", extraer_anterior), ("bm25", main.extract_relevant_knowledge)):
+        latencias, tokens = medir(funcion, args.repeticiones)
+        print(f"{nombre:>9}: latencia media {statistics.mean(latencias):.1f} µs "
+              f"(máx {max(latencias):.1f} µs), contexto medio {statistics.mean(tokens):.0f} tokens "
+              f"(máx {max(tokens)})")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,81 @@
+"""Benchmark de throughput de /chat contra un servidor OpenAI falso.
+
+Compara el patrón anterior (cliente OpenAI síncrono llamado dentro de un
+handler async, que bloquea el event loop) con el cliente asíncrono actual.
+Cada petición lleva un mensaje distinto para que la caché de respuestas y
+el single-flight no la sirvan sin llamar al modelo, y los precios salen
+del mismo servidor falso.
+
+Uso (desde python-server/):
+    python -m bench.bench_llm --peticiones 50 --latencia 0.2
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from bench import fake_upstream
+
+
+def mensaje(i):
+    return {"messages": [{"role": "user", "content": f"Cuéntame algo interesante (petición {i})"}]}
+
+
+async def antes(url_base, peticiones):
+    from openai import OpenAI
+    cliente = OpenAI(api_key="fake", base_url=url_base)
+
+    async def handler(i):
+        # Clasificador + respuesta principal, igual que /chat, pero síncrono
+        for _ in range(2):
+            cliente.chat.completions.create(model="fake", messages=mensaje(i)["messages"])
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(handler(i) for i in range(peticiones)))
+    return time.perf_counter() - inicio
+
+
+async def despues(peticiones):
+    import httpx
+    import main
+
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://app") as http:
+        inicio = time.perf_counter()
+        respuestas = await asyncio.gather(
+            *(http.post("/chat", json=mensaje(i)) for i in range(peticiones))
+        )
+        duracion = time.perf_counter() - inicio
+    errores = sum(1 for r in respuestas if r.status_code != 200)
+    if errores:
+        print(f"⚠️  {errores} peticiones fallaron")
+    await main.llm.cerrar()
+    return duracion
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--peticiones", type=int, default=50)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    fake_upstream.config.latencia = args.latencia
+    servidor, url = fake_upstream.iniciar()
+    os.environ["HICAP_BASE_URL"] = f"{url}/v1"
+    os.environ["HICAP_API_KEY"] = "fake"
+    os.environ["COINGECKO_URL"] = f"{url}/api/v3"
+    os.environ["CACHE_COMPARTIDA"] = ""
+
+    try:
+        t_antes = asyncio.run(antes(f"{url}/v1", args.peticiones))
+        t_despues = asyncio.run(despues(args.peticiones))
+    finally:
+        servidor.should_exit = True
+
+    print(f"Peticiones concurrentes: {args.peticiones}, latencia upstream: {args.latencia}s")
+    print(f"Antes (cliente síncrono):  {t_antes:.2f}s -> {args.peticiones / t_antes:.1f} req/s")
+    print(f"Después (AsyncOpenAI):     {t_despues:.2f}s -> {args.peticiones / t_despues:.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Benchmark de /batch contra llamar /chat y /education-chat uno por uno.
+
+Simula un proceso nocturno que atiende N usuarios: primero en serie, una
+petición HTTP por usuario (como lo hacen hoy los jobs), y luego en un solo
+lote. Reporta tiempo total, llamadas al modelo y a CoinGecko. Cada
+conversación lleva un sufijo distinto para que la caché de respuestas no
+sirva nada; las preguntas se repiten entre usuarios, como en la práctica.
+
+Uso (desde python-server/):
+    python -m bench.bench_lotes --usuarios 60 --concurrencia 8
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bench import conversaciones, fake_upstream
+
+
+def elementos(usuarios):
+    lista = []
+    for i in range(usuarios):
+        if i % 3 == 2:
+            ejemplo = conversaciones.EDUCACION[i % len(conversaciones.EDUCACION)]
+            lista.append({"id": f"u{i}", "endpoint": "educacion", "message": ejemplo["message"],
+                          "history": ejemplo["history"] + [{"role": "user", "content": f"(usuario {i})"}]})
+        else:
+            mensajes = [dict(m) for m in conversaciones.CHAT[i % len(conversaciones.CHAT)]]
+            mensajes.insert(0, {"role": "assistant", "content": f"(usuario {i})"})
+            lista.append({"id": f"u{i}", "endpoint": "chat", "messages": mensajes})
+    return lista
+
+
+def contadores():
+    return fake_upstream.config.llamadas, fake_upstream.config.llamadas_precios
+
+
+async def en_serie(http, lista):
+    errores = 0
+    for elemento in lista:
+        if elemento["endpoint"] == "educacion":
+            r = await http.post("/education-chat", json={"message": elemento["message"], "history": elemento["history"]})
+        else:
+            r = await http.post("/chat", json={"messages": elemento["messages"]})
+        errores += r.status_code != 200 or "error" in r.json()
+    return errores
+
+
+async def en_lote(http, lista, concurrencia):
+    r = await http.post("/batch", json={"items": lista, "concurrencia": concurrencia})
+    lineas = [json.loads(linea) for linea in r.text.splitlines()]
+    return lineas[-1]["errores"], lineas[-1]
+
+
+async def correr(args):
+    import httpx
+    import main
+
+    resultados = {}
+    async with main.app.router.lifespan_context(main.app):
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://app", timeout=600) as http:
+            # Calentamiento con otro sufijo para no adelantar aciertos de caché
+            await en_lote(http, elementos(4), args.concurrencia)
+            for nombre in ("serie", "lote"):
+                # Cada modo con sus propias conversaciones y sin precios en caché
+                lista = [
+                    {**e, "id": f"{nombre}-{e['id']}"} for e in elementos(args.usuarios)
+                ]
+                for e in lista:
+                    if e["endpoint"] == "chat":
+                        e["messages"][0]["content"] += f" {nombre}"
+                    else:
+                        e["history"][-1]["content"] += f" {nombre}"
+                main.precios._cache.clear()
+                llm_antes, precios_antes = contadores()
+                inicio = time.perf_counter()
+                if nombre == "serie":
+                    errores, resumen = await en_serie(http, lista), None
+                else:
+                    errores, resumen = await en_lote(http, lista, args.concurrencia)
+                segundos = time.perf_counter() - inicio
+                llm, cg = contadores()
+                resultados[nombre] = {
+                    "segundos": segundos, "errores": errores,
+                    "llm": llm - llm_antes, "precios": cg - precios_antes, "resumen": resumen,
+                }
+    return resultados
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--usuarios", type=int, default=60)
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--latencia-precios", type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake_upstream.config.latencia = args.latencia
+    fake_upstream.config.latencia_precios = args.latencia_precios
+    fake_upstream.config.responder = conversaciones.responder
+    servidor, url = fake_upstream.iniciar()
+    os.environ.update({
+        "HICAP_BASE_URL": f"{url}/v1", "HICAP_API_KEY": "fake", "COINGECKO_URL": f"{url}/api/v3",
+        "CACHE_COMPARTIDA": "", "PRECIOS_TTL": "0.5",
+        "LOTE_CONCURRENCIA": str(args.concurrencia),
+    })
+    try:
+        resultados = asyncio.run(correr(args))
+    finally:
+        servidor.should_exit = True
+
+    print(f"\n{args.usuarios} conversaciones, latencia del modelo {args.latencia}s")
+    for nombre, r in resultados.items():
+        print(f"  {nombre:>5}: {r['segundos']:6.2f}s  {args.usuarios / r['segundos']:6.1f} conv/s  "
+              f"llm {r['llm']:4d}  coingecko {r['precios']:3d}  errores {r['errores']}")
+    resumen = resultados["lote"]["resumen"]
+    print(f"  reutilizados en el lote: {resumen['compartidos']}")
+
+
+if __name__ == "__main__":
+    main_bench()
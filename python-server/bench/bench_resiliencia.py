@@ -0,0 +1,131 @@
+"""Benchmark de la capa de resiliencia (`resiliencia.py`) contra el servidor falso.
+
+Tres escenarios sobre `ClienteLLM.completar` con mensajes distintos (sin
+single-flight):
+
+- errores: una fracción de las llamadas devuelve 503; éxito sin y con reintentos.
+- cola: una fracción tarda `--latencia-lenta` s; p50/p99 sin y con cobertura.
+- caído: todas devuelven 503; latencia por llamada una vez abierto el disyuntor.
+
+Uso (desde python-server/):
+    python -m bench.bench_resiliencia --llamadas 200
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from bench import fake_upstream
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+
+async def rafaga(cliente, llamadas, etiqueta, concurrencia=16):
+    """(exitos, latencias) de `llamadas` completions distintas, `concurrencia` a la vez.
+
+    Por debajo del semáforo del cliente, para medir al proveedor y no la cola local.
+    """
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def una(i):
+        async with semaforo:
+            return await medir(i)
+
+    async def medir(i):
+        inicio = time.perf_counter()
+        try:
+            await cliente.completar(model="fake", messages=[{"role": "user", "content": f"{etiqueta} {i}"}])
+            return True, time.perf_counter() - inicio
+        except Exception:
+            return False, time.perf_counter() - inicio
+
+    resultados = await asyncio.gather(*(una(i) for i in range(llamadas)))
+    return sum(ok for ok, _ in resultados), [t for _, t in resultados]
+
+
+def nuevo_cliente(url, **resiliencia):
+    from llm import ClienteLLM
+    from resiliencia import Resiliente
+    cliente = ClienteLLM(api_key="fake", base_url=url)
+    cliente.resiliencias["fake"] = Resiliente("fake", **resiliencia)
+    return cliente
+
+
+async def escenario_errores(url, llamadas, tasa):
+    fake_upstream.config.tasa_error = tasa
+    print(f"\nerrores: {tasa:.0%} de 503")
+    for reintentos in (0, 2):
+        cliente = nuevo_cliente(url, reintentos=reintentos, espera_base=0.05)
+        # El disyuntor no debe abrirse con errores aislados
+        resiliencia = cliente.resiliencia("fake")
+        resiliencia.disyuntor.fallos_para_abrir = llamadas
+        exitos, _ = await rafaga(cliente, llamadas, f"errores {reintentos}")
+        print(f"  {reintentos} reintentos: {exitos}/{llamadas} exitosas "
+              f"({resiliencia.conteos['reintentos']} reintentos)")
+        await cliente.cerrar()
+    fake_upstream.config.tasa_error = 0.0
+
+
+async def escenario_cola(url, llamadas, tasa, latencia_lenta):
+    fake_upstream.config.tasa_lenta = tasa
+    fake_upstream.config.latencia_lenta = latencia_lenta
+    print(f"\ncola: {tasa:.0%} de llamadas tardan {latencia_lenta} s extra")
+    for cobertura in (False, True):
+        cliente = nuevo_cliente(url, cobertura=cobertura)
+        # Calentamiento: latencias de referencia para el p95
+        await rafaga(cliente, 40, f"calentar {cobertura}")
+        _, latencias = await rafaga(cliente, llamadas, f"cola {cobertura}")
+        conteos = cliente.resiliencia("fake").conteos
+        print(f"  cobertura {'sí' if cobertura else 'no'}: p50 {percentil(latencias, 0.5) * 1000:.0f} ms, "
+              f"p99 {percentil(latencias, 0.99) * 1000:.0f} ms "
+              f"({conteos['coberturas']} coberturas, {conteos['coberturas_ganadas']} ganadas)")
+        await cliente.cerrar()
+    fake_upstream.config.tasa_lenta = 0.0
+
+
+async def escenario_caido(url, llamadas):
+    fake_upstream.config.tasa_error = 1.0
+    print("\ncaído: todas las llamadas devuelven 503")
+    cliente = nuevo_cliente(url, espera_base=0.05)
+    disyuntor = cliente.resiliencia("fake").disyuntor
+    await rafaga(cliente, llamadas, "caido")
+    antes = fake_upstream.config.llamadas
+    rechazos = disyuntor.rechazos
+    _, latencias = await rafaga(cliente, llamadas, "caido despues")
+    print(f"  con el disyuntor {disyuntor.estado}: p50 "
+          f"{percentil(latencias, 0.5) * 1000:.2f} ms, "
+          f"{fake_upstream.config.llamadas - antes} llamadas al proveedor, "
+          f"{disyuntor.rechazos - rechazos} rechazadas al instante")
+    await cliente.cerrar()
+    fake_upstream.config.tasa_error = 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llamadas", type=int, default=200)
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--tasa-error", type=float, default=0.2)
+    parser.add_argument("--tasa-lenta", type=float, default=0.05)
+    parser.add_argument("--latencia-lenta", type=float, default=1.0)
+    args = parser.parse_args()
+
+    fake_upstream.config.latencia = args.latencia
+    servidor, url = fake_upstream.iniciar()
+    os.environ.setdefault("HICAP_API_KEY", "fake")
+
+    async def correr():
+        await escenario_errores(f"{url}/v1", args.llamadas, args.tasa_error)
+        await escenario_cola(f"{url}/v1", args.llamadas, args.tasa_lenta, args.latencia_lenta)
+        await escenario_caido(f"{url}/v1", args.llamadas)
+
+    try:
+        asyncio.run(correr())
+    finally:
+        servidor.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark de transcripción por segmentos de notas de voz largas.
+
+Genera un WAV sintético (una "palabra" por segundo) y lo transcribe contra
+el Whisper falso, cuya demora crece con la duración del audio: completo en
+una sola llamada, por segmentos en paralelo y por segmentos en streaming
+(tiempo hasta el primer resultado parcial). Verifica además que el texto
+unido sea exactamente el esperado, sin palabras repetidas por el solape.
+
+Uso (desde python-server/):
+    python -m bench.bench_segmentos --segundos 600 --latencia-audio 0.01
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from bench import fake_upstream
+
+
+async def correr(audio, esperado):
+    import httpx
+    import main
+
+    # Servidor real: ASGITransport junta toda la respuesta y no deja ver los parciales
+    servidor, url_app = fake_upstream.iniciar(main.app)
+    cabeceras = {"Content-Type": "audio/wav"}
+    async with httpx.AsyncClient(base_url=url_app, timeout=600) as http:
+        for nombre, url in (("completo", "/transcribe/upload"),
+                            ("segmentos", "/transcribe/upload?segmentar=true")):
+            llamadas = fake_upstream.config.llamadas
+            inicio = time.perf_counter()
+            respuesta = await http.post(url, content=audio, headers=cabeceras)
+            segundos = time.perf_counter() - inicio
+            texto = respuesta.json().get("text", "")
+            print(f"{nombre:>10}: {segundos:6.2f} s, {fake_upstream.config.llamadas - llamadas} llamadas, "
+                  f"texto {'correcto' if texto == esperado else 'INCORRECTO'}")
+
+        inicio = time.perf_counter()
+        primero = None
+        final = None
+        async with http.stream("POST", "/transcribe/upload?segmentar=true&stream=true",
+                               content=audio, headers=cabeceras) as respuesta:
+            evento = None
+            async for linea in respuesta.aiter_lines():
+                if linea.startswith("event: "):
+                    evento = linea[7:]
+                elif linea.startswith("data: "):
+                    if evento == "segmento" and primero is None:
+                        primero = time.perf_counter() - inicio
+                    elif evento == "done":
+                        final = json.loads(linea[6:])
+        total = time.perf_counter() - inicio
+        print(f"{'stream':>10}: primer parcial en {primero:.2f} s, total {total:.2f} s, "
+              f"texto {'correcto' if final and final['text'] == esperado else 'INCORRECTO'}")
+
+    servidor.should_exit = True
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--segundos", type=int, default=600)
+    parser.add_argument("--latencia-audio", type=float, default=0.01,
+                        help="segundos de procesamiento del Whisper falso por segundo de audio")
+    args = parser.parse_args()
+
+    fake_upstream.config.latencia = 0.05
+    fake_upstream.config.transcribir_wav = True
+    fake_upstream.config.latencia_audio_s = args.latencia_audio
+    _, url = fake_upstream.iniciar()
+    os.environ["HICAP_BASE_URL"] = url + "/v1"
+    # La nota de voz completa puede pasar del límite por defecto de Whisper
+    os.environ.setdefault("TRANSCRIPCION_MAX_MB", "200")
+
+    audio = fake_upstream.wav_sintetico(args.segundos)
+    print(f"Audio: {args.segundos} s ({len(audio) / 1e6:.1f} MB)")
+    asyncio.run(correr(audio, fake_upstream.texto_sintetico(args.segundos)))
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,91 @@
+"""Benchmark de memoria de /transcribe con grabaciones grandes.
+
+Compara el contrato base64 en JSON con la subida en streaming de
+`/transcribe/upload` (cuerpo crudo y multipart). Mide con tracemalloc el
+pico de memoria de Python durante cada petición por encima de lo que ya
+ocupaba el cliente, contra un Whisper falso que consume el audio por
+fragmentos. Con `--mb` sobre `TRANSCRIPCION_MAX_MB` muestra además que
+la subida cruda se corta con 413 sin leer el resto.
+
+Uso (desde python-server/):
+    python -m bench.bench_transcripcion --mb 20
+"""
+import argparse
+import asyncio
+import base64
+import os
+import tempfile
+import time
+import tracemalloc
+
+from bench import fake_upstream
+
+FRAGMENTO = 64 * 1024
+
+
+async def leer_por_fragmentos(ruta):
+    with open(ruta, "rb") as f:
+        while True:
+            fragmento = f.read(FRAGMENTO)
+            if not fragmento:
+                return
+            yield fragmento
+
+
+async def medir(nombre, enviar):
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    inicio = time.perf_counter()
+    respuesta = await enviar()
+    segundos = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1] - base
+    print(f"{nombre:>10}: HTTP {respuesta.status_code}, pico {pico / 1e6:7.1f} MB, {segundos * 1000:7.1f} ms")
+
+
+async def correr(ruta):
+    import httpx
+    import main
+
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://app", timeout=120) as http:
+        with open(ruta, "rb") as f:
+            cuerpo_json = {"audio": base64.b64encode(f.read()).decode("ascii")}
+        await medir("base64", lambda cuerpo=cuerpo_json: http.post("/transcribe", json=cuerpo))
+        # Se libera antes de medir los demás modos para no inflar su pico de memoria
+        del cuerpo_json
+
+        await medir("crudo", lambda: http.post(
+            "/transcribe/upload?nombre=nota.webm",
+            content=leer_por_fragmentos(ruta),
+            headers={"Content-Type": "audio/webm"},
+        ))
+
+        async def multipart():
+            with open(ruta, "rb") as f:
+                return await http.post("/transcribe/upload", files={"audio": ("nota.webm", f, "audio/webm")})
+        await medir("multipart", multipart)
+
+    await main.llm.cerrar()
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=20)
+    args = parser.parse_args()
+
+    fake_upstream.config.latencia = 0.0
+    _, url = fake_upstream.iniciar()
+    os.environ["HICAP_BASE_URL"] = url + "/v1"
+
+    tamano = int(args.mb * 1024 * 1024)
+    with tempfile.NamedTemporaryFile(suffix=".webm") as f:
+        f.write(os.urandom(tamano))
+        f.flush()
+        print(f"Audio de {tamano / 1e6:.1f} MB")
+        tracemalloc.start()
+        asyncio.run(correr(f.name))
+        tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,73 @@
+"""Benchmark del índice vectorial: apertura por mmap y latencia de consulta.
+
+Genera un índice sintético de N fragmentos (vectores aleatorios
+normalizados, la latencia no depende del contenido), lo guarda en un
+directorio temporal, lo abre con mmap y mide el top-k por consulta.
+
+Uso (desde python-server/):
+    python -m bench.bench_vectores --fragmentos 50000
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from vectores import VECTORES_DIMENSION, IndiceVectorial, embeber
+
+CONSULTAS = [
+    "cómo junto dinero para un viaje",
+    "¿qué es el gas fee?",
+    "quiero pagar mis deudas",
+    "¿es seguro invertir en ethereum?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fragmentos", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=VECTORES_DIMENSION)
+    parser.add_argument("--repeticiones", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matriz_t = rng.standard_normal((args.dimension, args.fragmentos), dtype=np.float32)
+    matriz_t /= np.linalg.norm(matriz_t, axis=0, keepdims=True)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "sintetico")
+        IndiceVectorial(matriz_t, {"tipo": "sintetico", "total": args.fragmentos}).guardar(ruta)
+        del matriz_t
+
+        inicio = time.perf_counter()
+        indice = IndiceVectorial.abrir(ruta)
+        apertura_ms = (time.perf_counter() - inicio) * 1000
+
+        # Primera pasada para traer las páginas del mmap
+        indice.buscar(CONSULTAS[0], minimo=-1.0)
+
+        embedding_us = []
+        busqueda_us = []
+        for consulta in CONSULTAS:
+            inicio = time.perf_counter()
+            for _ in range(args.repeticiones):
+                embeber(consulta, args.dimension)
+            embedding_us.append((time.perf_counter() - inicio) / args.repeticiones * 1e6)
+
+            inicio = time.perf_counter()
+            for _ in range(args.repeticiones):
+                indice.buscar(consulta, minimo=-1.0)
+            busqueda_us.append((time.perf_counter() - inicio) / args.repeticiones * 1e6)
+
+    tamano_mb = args.fragmentos * args.dimension * 4 / 1e6
+    print(f"Fragmentos: {args.fragmentos}, dimensión: {args.dimension} ({tamano_mb:.1f} MB)")
+    print(f"Apertura con mmap: {apertura_ms:.2f} ms")
+    print(f"Embedding de la consulta: {statistics.mean(embedding_us):.1f} µs")
+    print(f"Consulta completa (embedding + top-k): {statistics.mean(busqueda_us):.1f} µs "
+          f"(máx {max(busqueda_us):.1f} µs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Conversaciones de ejemplo en español para las pruebas de carga.
+
+Cada lista tiene peticiones como las que envía el frontend: historial de
+varios turnos, preguntas de mercado, portafolio y educación, y órdenes de
+transferencia, registro de contactos y pago de servicios.
+"""
+import json
+
+CHAT = [
+    [
+        {"role": "user", "content": "Hola, ¿cómo va mi portafolio esta semana?"},
+        {"role": "assistant", "content": "¡Hola! Tu portafolio subió 3.2% esta semana, impulsado por Bitcoin."},
+        {"role": "user", "content": "¿Me conviene vender algo de ETH?"},
+    ],
+    [{"role": "user", "content": "¿A cuánto está el bitcoin hoy en pesos?"}],
+    [
+        {"role": "user", "content": "Quiero empezar a ahorrar 2,000 pesos al mes"},
+        {"role": "assistant", "content": "¡Excelente meta! Podemos repartirlo entre USDC y un poco de BTC."},
+        {"role": "user", "content": "¿Y si mejor lo pongo todo en stablecoins?"},
+        {"role": "assistant", "content": "Es una opción más estable; tendrías menos volatilidad."},
+        {"role": "user", "content": "Programa la compra de 500 pesos de USDC cada semana"},
+    ],
+    [{"role": "user", "content": "¿Cómo se ha movido solana en las últimas 24 horas?"}],
+    [
+        {"role": "user", "content": "Analiza mis últimas transacciones"},
+        {"role": "assistant", "content": "Veo 12 compras pequeñas de BTC y 2 ventas de ETH este mes."},
+        {"role": "user", "content": "¿Estoy gastando mucho en comisiones?"},
+    ],
+    [{"role": "user", "content": "Dame un consejo para diversificar mis inversiones"}],
+]
+
+TRANSACCIONES = [
+    [{"role": "user", "content": "Envía 500 pesos a Ana por Polygon"}],
+    [
+        {"role": "user", "content": "Quiero mandarle dinero a mi hermano"},
+        {"role": "assistant", "content": "Claro, ¿cuánto y en qué cripto quieres enviarle?"},
+        {"role": "user", "content": "200 USDT, su correo es luis@example.com"},
+    ],
+    [{"role": "user", "content": "Registra a María López, maria@example.com, teléfono 5512345678"}],
+    [{"role": "user", "content": "Paga mi recibo de luz de CFE, son 850 pesos"}],
+    [{"role": "user", "content": "¿Cuánto cuesta el gas en Ethereum ahorita?"}],
+    [{"role": "user", "content": "¿Qué red me conviene para mandar 50 dólares?"}],
+]
+
+EDUCACION = [
+    {"message": "¿Qué es una stablecoin?", "history": []},
+    {"message": "Explícame qué es DeFi como si tuviera 10 años", "history": []},
+    {
+        "message": "¿Y qué riesgos tiene?",
+        "history": [
+            {"role": "user", "content": "¿Qué es el staking?"},
+            {"role": "assistant", "content": "Es bloquear tus criptos para ayudar a validar la red a cambio de recompensas."},
+        ],
+    },
+    {"message": "¿Cuál es la diferencia entre una wallet custodial y una no custodial?", "history": []},
+    {"message": "¿Qué son las comisiones de gas?", "history": []},
+]
+
+RESPUESTA_CHAT = (
+    "Tu portafolio va bien: Bitcoin representa el 45% y subió 2.1% en 24 horas. Si quieres reducir "
+    "riesgo, podrías mover una parte a USDC. Te recomiendo revisar tus metas de ahorro cada mes."
+)
+RESPUESTA_EDUCACION = (
+    "Una stablecoin es una criptomoneda cuyo valor está ligado a un activo estable, como el dólar. "
+    "Sirve para guardar valor y enviar dinero sin la volatilidad de Bitcoin o Ethereum."
+)
+ACCION_TRANSFERENCIA = {
+    "id": "action-1",
+    "type": "transfer",
+    "data": {"amount": "500", "token": "USDC", "network": "Polygon", "recipient_name": "Ana"},
+}
+RESPUESTA_TRANSACCION = (
+    "Listo, preparé la transferencia de 500 pesos (~27 USDC) a Ana por Polygon; la comisión "
+    "estimada es menor a $0.01.\n###ACTION_JSON###\n" + json.dumps(ACCION_TRANSFERENCIA) + "\n###ACTION_JSON###"
+)
+
+
+def responder(body):
+    """Respuesta plausible del modelo según el tipo de prompt (para el servidor falso)"""
+    sistema = " ".join(m.get("content", "") for m in body.get("messages", []) if m.get("role") == "system")
+    ultimo = body["messages"][-1].get("content", "").lower() if body.get("messages") else ""
+    if "clasificación de intenciones" in sistema:
+        if "transacciones de criptomonedas" in sistema:
+            for palabras, categoria in ((("envía", "manda"), "TRANSFERENCIA"), (("registra",), "REGISTRO_CONTACTO"),
+                                        (("paga",), "PAGO_SERVICIO"), (("gas", "red"), "MERCADO")):
+                if any(p in ultimo for p in palabras):
+                    return categoria
+            return "CONSULTA"
+        return "MERCADO" if any(p in ultimo for p in ("precio", "cuánto", "bitcoin", "solana")) else "TRANSACCIONES"
+    if sistema.startswith("Resume"):
+        return "- El usuario quiere ahorrar 2,000 pesos al mes\n- Prefiere stablecoins"
+    if "###ACTION_JSON###" in sistema:
+        return RESPUESTA_TRANSACCION
+    if "CONOCIMIENTO RELEVANTE" in sistema:
+        return RESPUESTA_EDUCACION
+    return RESPUESTA_CHAT
@@ -0,0 +1,211 @@
+"""Servidor falso compatible con OpenAI y CoinGecko para benchmarks locales.
+
+Responde /v1/chat/completions, /v1/audio/transcriptions y
+/api/v3/simple/price con una latencia configurable, sin llamar a ningún
+proveedor real.
+"""
+import asyncio
+import io
+import random
+import socket
+import threading
+import time
+import wave
+
+import json
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class ConfigFalsa:
+    latencia = 0.2
+    jitter = 0.0
+    respuesta = "PORTAFOLIO"
+    llamadas = 0
+    # Pausa entre fragmentos cuando se pide stream=True
+    latencia_token = 0.01
+    latencia_precios = 0.05
+    llamadas_precios = 0
+    bytes_audio = 0
+    # Transcripción sintética de WAVs generados con wav_sintetico (ver abajo)
+    transcribir_wav = False
+    # Demora extra por segundo de audio, como un Whisper real
+    latencia_audio_s = 0.0
+    # Fallas inyectadas en /v1/chat/completions: fracción de 503 y de respuestas lentas
+    tasa_error = 0.0
+    tasa_lenta = 0.0
+    latencia_lenta = 2.0
+    errores = 0
+    # Modelos que siempre responden 503 (para probar las cadenas de respaldo)
+    modelos_caidos = set()
+    # Función opcional body -> texto; si no, todas las completions devuelven `respuesta`
+    responder = None
+
+
+PRECIOS_USD = {
+    "bitcoin": 67000.0,
+    "ethereum": 3500.0,
+    "tether": 1.0,
+    "usd-coin": 1.0,
+    "solana": 150.0,
+    "matic-network": 0.7,
+}
+USD_MXN = 18.5
+TASA_WAV = 16000
+
+
+config = ConfigFalsa()
+app = FastAPI()
+
+
+async def _esperar():
+    config.llamadas += 1
+    demora = config.latencia + random.uniform(0, config.jitter)
+    await asyncio.sleep(demora)
+
+
+def _uso(body, texto):
+    """Tokens aproximados (~4 caracteres por token), como los reportaría el proveedor"""
+    entrada = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4 + 1
+    salida = len(texto) // 4 + 1
+    return {"prompt_tokens": entrada, "completion_tokens": salida, "total_tokens": entrada + salida}
+
+
+def _fragmentos(texto, modelo):
+    for i, palabra in enumerate(texto.split(" ")):
+        delta = palabra if i == 0 else " " + palabra
+        yield {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": modelo,
+            "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+        }
+
+
+async def _stream(texto, modelo):
+    for fragmento in _fragmentos(texto, modelo):
+        yield f"data: {json.dumps(fragmento)}\n\n"
+        await asyncio.sleep(config.latencia_token)
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await _esperar()
+    if random.random() < config.tasa_error or body.get("model") in config.modelos_caidos:
+        config.errores += 1
+        return JSONResponse({"error": {"message": "sobrecargado"}}, status_code=503)
+    if random.random() < config.tasa_lenta:
+        await asyncio.sleep(config.latencia_lenta)
+    texto = config.responder(body) if config.responder else config.respuesta
+    if body.get("stream"):
+        return StreamingResponse(
+            _stream(texto, body.get("model", "fake")),
+            media_type="text/event-stream",
+        )
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": texto},
+            "finish_reason": "stop",
+        }],
+        "usage": _uso(body, texto),
+    }
+
+
+def wav_sintetico(segundos, tasa=TASA_WAV):
+    """WAV mono de 16 bits: cada segundo i es una "palabra" (onda cuadrada de
+    amplitud 1000 + 4 * i durante 0.8 s) seguida de 0.2 s de silencio"""
+    import numpy as np
+    voz = int(tasa * 0.8)
+    muestras = np.zeros(segundos * tasa, dtype="<i2")
+    signo = np.where(np.arange(voz) % 2 == 0, 1, -1)
+    for i in range(segundos):
+        muestras[i * tasa:i * tasa + voz] = signo * (1000 + 4 * i)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as escritor:
+        escritor.setnchannels(1)
+        escritor.setsampwidth(2)
+        escritor.setframerate(tasa)
+        escritor.writeframes(muestras.tobytes())
+    return buffer.getvalue()
+
+
+def texto_sintetico(segundos):
+    return " ".join(f"palabra{i}" for i in range(segundos))
+
+
+def transcribir_sintetico(datos):
+    """Inversa de wav_sintetico: una palabra por cada tramo de voz, según su amplitud"""
+    import numpy as np
+    with wave.open(io.BytesIO(datos), "rb") as lector:
+        muestras = np.frombuffer(lector.readframes(lector.getnframes()), dtype="<i2")
+        duracion = lector.getnframes() / lector.getframerate()
+    amplitudes = np.abs(muestras.astype(np.int32))
+    hay_voz = amplitudes > 0
+    inicios = np.flatnonzero(hay_voz & ~np.concatenate(([False], hay_voz[:-1])))
+    palabras = [f"palabra{(int(amplitudes[i]) - 1000) // 4}" for i in inicios]
+    return " ".join(palabras), duracion
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    if config.transcribir_wav:
+        formulario = await request.form()
+        datos = await formulario["file"].read()
+        config.bytes_audio += len(datos)
+        texto, duracion = transcribir_sintetico(datos)
+        await formulario.close()
+        await asyncio.sleep(duracion * config.latencia_audio_s)
+        await _esperar()
+        return {"text": texto}
+
+    # Se consume por fragmentos para no sumar la copia del servidor falso a las mediciones
+    async for fragmento in request.stream():
+        config.bytes_audio += len(fragmento)
+    await _esperar()
+    return {"text": "hola, quiero enviar cien pesos a Ana"}
+
+
+@app.get("/api/v3/simple/price")
+async def simple_price(ids: str, vs_currencies: str, include_24hr_change: str = "false"):
+    config.llamadas_precios += 1
+    await asyncio.sleep(config.latencia_precios)
+    data = {}
+    for activo in ids.split(","):
+        if activo not in PRECIOS_USD:
+            continue
+        data[activo] = {}
+        for moneda in vs_currencies.split(","):
+            tasa = USD_MXN if moneda == "mxn" else 1.0
+            data[activo][moneda] = PRECIOS_USD[activo] * tasa
+            if include_24hr_change == "true":
+                data[activo][f"{moneda}_24h_change"] = 1.25
+    return data
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar(aplicacion=app, puerto=None):
+    """Levanta la app en un hilo y devuelve (servidor, url_base)"""
+    puerto = puerto or puerto_libre()
+    servidor = uvicorn.Server(uvicorn.Config(
+        aplicacion, host="127.0.0.1", port=puerto, log_level="warning"
+    ))
+    hilo = threading.Thread(target=servidor.run, daemon=True)
+    hilo.start()
+    while not servidor.started:
+        time.sleep(0.01)
+    return servidor, f"http://127.0.0.1:{puerto}"
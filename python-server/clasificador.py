@@ -0,0 +1,224 @@
+"""Clasificación de intenciones por niveles.
+
+1. Caché LRU por texto normalizado (minúsculas, sin acentos ni puntuación).
+2. Puntuador local de palabras clave que resuelve los casos obvios
+   ("precio", "envía", "pagar la luz") sin llamar a la red.
+3. El LLM, solo cuando la confianza local es baja. Mensajes iguales
+   (ya normalizados) que llegan a la vez comparten una sola llamada.
+
+Con varios workers, las respuestas del LLM también se guardan en el
+almacén compartido (espacio `clasificacion:<nombre>`) y se consultan ahí
+antes de llamarlo: un mensaje se clasifica con el LLM una vez por
+despliegue y no una vez por worker.
+
+Cada clasificador cuenta cuántas consultas resolvió cada nivel para poder
+medir cuántas llamadas al LLM (y cuánta latencia) se ahorran.
+"""
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+
+from vuelos import GrupoVuelos
+
+CLASIFICADOR_CACHE = int(os.getenv("CLASIFICADOR_CACHE", "2048"))
+CLASIFICADOR_CACHE_TTL = float(os.getenv("CLASIFICADOR_CACHE_TTL", "86400"))
+# Puntaje mínimo de la mejor categoría y margen sobre la segunda para decidir localmente.
+# Una sola palabra débil (peso < 2, ej. "servicios", "agenda", "vender") no basta: hace falta
+# una señal fuerte o dos que coincidan; si no, decide el LLM
+UMBRAL_PUNTAJE = 2.0
+UMBRAL_CONFIANZA = 0.6
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos, sin puntuación y con espacios colapsados"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return " ".join(texto.split())
+
+
+def compilar_reglas(reglas):
+    """{categoria: [(patron, peso)]} -> {categoria: [(regex, peso)]} sobre texto normalizado"""
+    return {
+        categoria: [(re.compile(rf"\b{patron}\b"), peso) for patron, peso in patrones]
+        for categoria, patrones in reglas.items()
+    }
+
+
+# Reglas del asesor de inversiones (/chat)
+REGLAS_CHAT = compilar_reglas({
+    "MERCADO": [
+        (r"precios?", 2.0),
+        (r"cotiza\w*", 2.0),
+        (r"cuanto (vale|cuesta|esta)", 2.0),
+        (r"mercados?", 1.5),
+        (r"(sube|subiendo|baja|bajando|cayendo)", 1.0),
+        (r"noticias", 1.0),
+        (r"capitalizacion", 1.0),
+    ],
+    "PORTAFOLIO": [
+        (r"portafolios?", 2.0),
+        (r"mis (inversiones|activos|criptos|monedas)", 2.0),
+        (r"distribucion", 1.5),
+        (r"(rentabilidad|rendimiento)", 1.5),
+        (r"(balance|composicion)", 1.0),
+        (r"cuanto tengo", 2.0),
+    ],
+    "TRANSACCIONES": [
+        (r"(deberia|recomiendas?|recomendacion\w*|sugieres|sugerencia\w*|consejos?)", 2.0),
+        (r"(comprar|compro|vender|vendo)", 1.5),
+        (r"(estrategia|dca)", 1.5),
+        (r"(programa\w*|recurrente\w*)", 1.5),
+        (r"que (hago|me conviene)", 2.0),
+    ],
+})
+
+# Reglas del asistente de transacciones (/transaction-chat)
+REGLAS_TRANSACCIONES = compilar_reglas({
+    "TRANSFERENCIA": [
+        (r"envi\w*", 2.0),
+        (r"manda\w*", 2.0),
+        (r"transfer\w*", 2.0),
+        (r"pasale", 1.5),
+    ],
+    "REGISTRO_CONTACTO": [
+        (r"(registra|guarda|agrega|anade)\w* (a |el |un )?(nuevo )?contacto", 3.0),
+        (r"nuevo contacto", 2.0),
+        (r"contactos?", 1.0),
+        (r"agenda\w*", 1.0),
+    ],
+    "PAGO_SERVICIO": [
+        (r"pag(ar|a|o|ue)", 1.5),
+        (r"(luz|agua|internet|telefono|cfe|telmex|netflix|spotify|renta|predial)", 1.5),
+        (r"(recibo|servicios?)", 1.0),
+    ],
+    "MERCADO": [
+        (r"precios?", 2.0),
+        (r"cotiza\w*", 2.0),
+        (r"cuanto (vale|cuesta|esta)", 2.0),
+        (r"(conver\w*|equivale\w*|tipo de cambio)", 2.0),
+        (r"cuantos (pesos|dolares)", 1.5),
+    ],
+})
+
+
+def puntuar(texto_normalizado, reglas):
+    """Devuelve (categoria, confianza) del puntuador local; categoria es None si no hay señal"""
+    puntajes = {}
+    for categoria, patrones in reglas.items():
+        puntaje = sum(peso for regex, peso in patrones if regex.search(texto_normalizado))
+        if puntaje:
+            puntajes[categoria] = puntaje
+    if not puntajes:
+        return None, 0.0
+    ordenados = sorted(puntajes.values(), reverse=True)
+    mejor = ordenados[0]
+    segundo = ordenados[1] if len(ordenados) > 1 else 0.0
+    if mejor < UMBRAL_PUNTAJE:
+        return None, 0.0
+    categoria = max(puntajes, key=puntajes.get)
+    return categoria, (mejor - segundo) / mejor
+
+
+class ClasificadorEscalonado:
+    """Caché LRU -> reglas locales -> almacén compartido -> LLM"""
+
+    def __init__(self, nombre, reglas, clasificar_llm, categoria_defecto,
+                 tamano_cache=CLASIFICADOR_CACHE, compartido=None, ttl_compartido=CLASIFICADOR_CACHE_TTL):
+        self.nombre = nombre
+        self.reglas = reglas
+        self.clasificar_llm = clasificar_llm
+        self.categoria_defecto = categoria_defecto
+        self.tamano_cache = tamano_cache
+        self._cache = OrderedDict()
+        self.compartido = compartido
+        self.ttl_compartido = ttl_compartido
+        self.espacio = f"clasificacion:{nombre}"
+        # "vuelo": esperó la llamada al LLM que otra petición igual ya tenía en curso
+        self.aciertos = {"cache": 0, "local": 0, "compartida": 0, "vuelo": 0, "llm": 0, "error": 0}
+        self._ms_llm_total = 0.0
+        self.vuelos = GrupoVuelos(nombre)
+
+    def _guardar(self, clave, categoria):
+        self._cache[clave] = categoria
+        self._cache.move_to_end(clave)
+        if len(self._cache) > self.tamano_cache:
+            self._cache.popitem(last=False)
+
+    async def clasificar(self, texto):
+        clave = normalizar(texto)
+
+        categoria = self._cache.get(clave)
+        if categoria is not None:
+            self._cache.move_to_end(clave)
+            self.aciertos["cache"] += 1
+            return categoria
+
+        categoria, confianza = puntuar(clave, self.reglas)
+        if categoria and confianza >= UMBRAL_CONFIANZA:
+            self.aciertos["local"] += 1
+            self._guardar(clave, categoria)
+            return categoria
+
+        if self.compartido:
+            try:
+                entrada = self.compartido.leer(self.espacio, clave)
+            except sqlite3.Error as e:
+                print(f"Error leyendo clasificación compartida: {e}")
+                entrada = None
+            if entrada is not None:
+                self.aciertos["compartida"] += 1
+                self._guardar(clave, entrada[0])
+                return entrada[0]
+
+        propia = False
+
+        def llamar():
+            # Solo se invoca para quien lanza la llamada; los demás esperan la misma
+            nonlocal propia
+            propia = True
+            return self.clasificar_llm(texto)
+
+        inicio = time.perf_counter()
+        try:
+            categoria = await self.vuelos.ejecutar(clave, llamar)
+        except Exception as e:
+            # No se cachea: la próxima vez se vuelve a intentar con el LLM
+            print(f"Error clasificando intención: {e}")
+            self.aciertos["error"] += 1
+            return self.categoria_defecto
+        self._guardar(clave, categoria)
+        if not propia:
+            self.aciertos["vuelo"] += 1
+            return categoria
+        self._ms_llm_total += (time.perf_counter() - inicio) * 1000
+        self.aciertos["llm"] += 1
+        if self.compartido:
+            try:
+                self.compartido.guardar(self.espacio, clave, categoria, self.ttl_compartido)
+            except sqlite3.Error as e:
+                print(f"Error guardando clasificación compartida: {e}")
+        return categoria
+
+    def estadisticas(self):
+        total = sum(self.aciertos.values())
+        # Cada consulta resuelta sin llamar al LLM (incluidas las que esperaron una en vuelo) ahorró una
+        ahorradas = (self.aciertos["cache"] + self.aciertos["local"] + self.aciertos["compartida"]
+                     + self.aciertos["vuelo"])
+        ms_llm_promedio = self._ms_llm_total / self.aciertos["llm"] if self.aciertos["llm"] else 0.0
+        return {
+            "total": total,
+            "aciertos": dict(self.aciertos),
+            "tasa_por_nivel": {
+                nivel: round(n / total, 4) if total else 0.0
+                for nivel, n in self.aciertos.items()
+            },
+            "llamadas_llm_ahorradas": ahorradas,
+            "ms_llm_promedio": round(ms_llm_promedio, 1),
+            "ms_ahorrados_estimados": round(ahorradas * ms_llm_promedio, 1),
+            "entradas_cache": len(self._cache),
+            "vuelos": self.vuelos.estadisticas(),
+        }
@@ -0,0 +1,164 @@
+"""Almacén compartido entre workers, sin servicios externos.
+
+Un archivo SQLite en modo WAL (`CACHE_COMPARTIDA`) con entradas clave/valor
+JSON por espacio (`respuestas`, `precios`, `clasificacion:chat`...), cada
+una con su momento de actualización y de expiración en tiempo de reloj
+para que coincidan entre procesos. Los lectores de un worker no bloquean
+al que escribe.
+
+Nada de esto bloquea el event loop por más de unos milisegundos: las
+lecturas (en la ruta de la petición) usan su propia conexión con una
+espera corta (`COMPARTIDO_ESPERA_S`); si el archivo está ocupado fallan
+con `sqlite3.Error` y quien llama lo trata como un fallo de caché. Las
+escrituras van a un hilo escritor propio del proceso, que sí espera su
+turno (`COMPARTIDO_ESPERA_ESCRITURA_S`) sin detener las peticiones.
+
+Las conexiones y el hilo se crean en el primer uso y se recrean si el
+proceso cambió (fork de gunicorn con `--preload`): ni una conexión SQLite
+ni un hilo cruzan un fork.
+
+`tomar_liderazgo(nombre)` elige con un lock de archivo un solo worker para
+las tareas que no deben repetirse (ej. el ticker de precios); el lock se
+libera solo si ese proceso muere.
+"""
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_COMPARTIDA = os.getenv("CACHE_COMPARTIDA", "")
+# Espera máxima de una lectura si otro worker tiene el archivo ocupado (corre en el event loop)
+COMPARTIDO_ESPERA_S = float(os.getenv("COMPARTIDO_ESPERA_S", "0.05"))
+# Espera máxima de una escritura (corre en el hilo escritor)
+COMPARTIDO_ESPERA_ESCRITURA_S = float(os.getenv("COMPARTIDO_ESPERA_ESCRITURA_S", "5"))
+# Cada cuántas escrituras se borran las entradas vencidas
+PURGA_CADA = 200
+
+
+class AlmacenCompartido:
+    def __init__(self, ruta, espera=COMPARTIDO_ESPERA_S, espera_escritura=COMPARTIDO_ESPERA_ESCRITURA_S):
+        self.ruta = ruta
+        self.espera = espera
+        self.espera_escritura = espera_escritura
+        # Conexión de lectura (event loop) y de escritura (solo el hilo escritor)
+        self._conexion = None
+        self._conexion_escritura = None
+        self._escritor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._escrituras = 0
+        self.escrituras_fallidas = 0
+        self._liderazgos = {}
+
+    def _conectar_escritura(self):
+        conexion = sqlite3.connect(self.ruta, check_same_thread=False, timeout=self.espera_escritura)
+        with conexion:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute(
+                "CREATE TABLE IF NOT EXISTS entradas (espacio TEXT, clave TEXT, valor TEXT, "
+                "actualizado REAL, expira REAL, PRIMARY KEY (espacio, clave))"
+            )
+        return conexion
+
+    def _abrir(self):
+        """Conexión de lectura del proceso actual, con su escritor (llamar con el lock tomado)"""
+        if self._conexion is None or self._pid != os.getpid():
+            # La tabla y el modo WAL se preparan con la conexión de escritura, que puede esperar
+            # a otro worker; pasa una vez por proceso, normalmente al calentar
+            self._conexion_escritura = self._conectar_escritura()
+            self._conexion = sqlite3.connect(self.ruta, check_same_thread=False, timeout=self.espera)
+            self._escritor = ThreadPoolExecutor(1, thread_name_prefix="compartido")
+            self._pid = os.getpid()
+        return self._conexion
+
+    def abrir(self):
+        """Abre (o reabre tras un fork) las conexiones por adelantado, ej. al calentar el worker"""
+        with self._lock:
+            self._abrir()
+
+    def leer_varios(self, espacio, claves):
+        """{clave: (valor, actualizado)} de las entradas vigentes"""
+        claves = list(claves)
+        if not claves:
+            return {}
+        marcas = ",".join("?" * len(claves))
+        with self._lock:
+            filas = self._abrir().execute(
+                f"SELECT clave, valor, actualizado FROM entradas "
+                f"WHERE espacio = ? AND clave IN ({marcas}) AND expira > ?",
+                (espacio, *claves, time.time()),
+            ).fetchall()
+        return {clave: (json.loads(valor), actualizado) for clave, valor, actualizado in filas}
+
+    def leer(self, espacio, clave):
+        """(valor, actualizado) o None"""
+        return self.leer_varios(espacio, [clave]).get(clave)
+
+    def _escribir(self, filas):
+        """Corre en el hilo escritor: el único que usa la conexión de escritura"""
+        conexion = self._conexion_escritura
+        with conexion:
+            conexion.executemany(
+                "INSERT OR REPLACE INTO entradas (espacio, clave, valor, actualizado, expira) "
+                "VALUES (?, ?, ?, ?, ?)", filas,
+            )
+            self._escrituras += 1
+            if self._escrituras % PURGA_CADA == 0:
+                conexion.execute("DELETE FROM entradas WHERE expira <= ?", (time.time(),))
+
+    def _revisar_escritura(self, futuro):
+        error = futuro.exception()
+        if error is not None:
+            self.escrituras_fallidas += 1
+            print(f"Error escribiendo en el almacén compartido: {error}")
+
+    def guardar_varios(self, espacio, valores, ttl, actualizado=None):
+        """Encola {clave: valor}; vencen `ttl` segundos después de `actualizado` (ahora por defecto).
+
+        Vuelve sin esperar a SQLite: la escritura la hace el hilo escritor.
+        """
+        actualizado = actualizado or time.time()
+        filas = [
+            (espacio, clave, json.dumps(valor, ensure_ascii=False), actualizado, actualizado + ttl)
+            for clave, valor in valores.items()
+        ]
+        with self._lock:
+            self._abrir()
+            escritor = self._escritor
+        escritor.submit(self._escribir, filas).add_done_callback(self._revisar_escritura)
+
+    def guardar(self, espacio, clave, valor, ttl, actualizado=None):
+        self.guardar_varios(espacio, {clave: valor}, ttl, actualizado)
+
+    def tomar_liderazgo(self, nombre):
+        """True si este proceso queda como el único que ejecuta `nombre`"""
+        if nombre in self._liderazgos:
+            return True
+        archivo = open(f"{self.ruta}.{nombre}.lock", "w")
+        try:
+            fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            archivo.close()
+            return False
+        self._liderazgos[nombre] = archivo
+        return True
+
+    def cerrar(self):
+        with self._lock:
+            if self._conexion is not None and self._pid == os.getpid():
+                # Termina las escrituras encoladas antes de cerrar
+                self._escritor.shutdown(wait=True)
+                self._conexion_escritura.close()
+                self._conexion.close()
+            self._conexion = self._conexion_escritura = self._escritor = None
+        for archivo in self._liderazgos.values():
+            archivo.close()
+        self._liderazgos.clear()
+
+
+def abrir_almacen(ruta=CACHE_COMPARTIDA):
+    """AlmacenCompartido si hay ruta configurada; None en modo de un solo proceso"""
+    return AlmacenCompartido(ruta) if ruta else None
@@ -0,0 +1,221 @@
+"""Recuperación de conocimiento para el chat educativo (RAG).
+
+Un índice invertido con puntuación BM25 sobre la base de conocimientos
+financieros y los archivos JSON de `public/`. Se construye una vez y se
+reutiliza hasta que cambia alguno de esos archivos (mtime y tamaño,
+revisados como mucho cada `PROMPTS_INTERVALO_REVISION` segundos, igual que
+las entradas de los prompts). Cada consulta devuelve las mejores secciones
+sin pasar de un presupuesto de tokens.
+
+La tokenización es insensible a acentos y mayúsculas, descarta palabras
+vacías y recorta cada palabra a sus primeras letras (stemming por prefijo),
+así "ahorro", "ahorrar" y "ahorrando" cuentan como el mismo término.
+
+Si numpy está disponible, se combina además con el índice vectorial de
+`vectores.py` (fusión por rango recíproco) para cubrir paráfrasis que no
+comparten palabras con el texto.
+"""
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import NamedTuple
+
+from clasificador import normalizar
+from prompts import PROMPTS_INTERVALO_REVISION, huella_archivos
+
+CONOCIMIENTO_TOP_K = int(os.getenv("CONOCIMIENTO_TOP_K", "4"))
+CONOCIMIENTO_MAX_TOKENS = int(os.getenv("CONOCIMIENTO_MAX_TOKENS", "600"))
+LARGO_RAIZ = 5
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Constante de la fusión por rango recíproco (RRF)
+RRF_K = 60
+
+PALABRAS_VACIAS = set("""
+a al algo algun alguna como con cual cuales cuando de del desde donde el ella en entre
+es esa ese esta este esto estos hay la las le les lo los mas me mi mis muy no nos o
+para pero por que quiero se si sin sobre su sus te tengo ti tu tus un una uno unos y ya yo
+""".split())
+
+
+def tokenizar(texto):
+    """Términos normalizados: sin acentos, sin palabras vacías y recortados a su raíz"""
+    return [
+        palabra[:LARGO_RAIZ]
+        for palabra in normalizar(texto).split()
+        if palabra not in PALABRAS_VACIAS and len(palabra) > 1
+    ]
+
+
+def estimar_tokens(texto):
+    """Aproximación barata: ~4 caracteres por token"""
+    return len(texto) // 4 + 1
+
+
+class Seccion(NamedTuple):
+    titulo: str
+    texto: str
+    fuente: str
+
+
+def secciones_markdown(texto, fuente):
+    """Parte un documento markdown por encabezados `## `"""
+    secciones = []
+    for bloque in texto.split("\n## ")[1:]:
+        titulo = bloque.split("\n", 1)[0].strip()
+        secciones.append(Seccion(titulo, "## " + bloque.strip(), fuente))
+    return secciones
+
+
+def _renderizar(valor, sangria=""):
+    if isinstance(valor, dict):
+        lineas = []
+        for clave, sub in valor.items():
+            if isinstance(sub, (dict, list)):
+                lineas.append(f"{sangria}- {clave.replace('_', ' ')}:")
+                lineas.append(_renderizar(sub, sangria + "  "))
+            else:
+                lineas.append(f"{sangria}- {clave.replace('_', ' ')}: {sub}")
+        return "\n".join(lineas)
+    if isinstance(valor, list):
+        return "\n".join(
+            _renderizar(item, sangria) if isinstance(item, (dict, list)) else f"{sangria}- {item}"
+            for item in valor
+        )
+    return f"{sangria}{valor}"
+
+
+def secciones_json(ruta):
+    """Una sección por cada entrada de segundo nivel del JSON (o por elemento si es lista)"""
+    with open(ruta, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    fuente = os.path.basename(ruta)
+    secciones = []
+    for grupo, contenido in data.items():
+        if isinstance(contenido, dict):
+            elementos = list(contenido.items())
+        elif isinstance(contenido, list):
+            elementos = [(str(i + 1), item) for i, item in enumerate(contenido)]
+        else:
+            elementos = [(grupo, contenido)]
+        for clave, valor in elementos:
+            titulo = f"{grupo.replace('_', ' ')} / {clave.replace('_', ' ')}"
+            if isinstance(valor, dict) and valor.get("titulo"):
+                titulo = valor["titulo"]
+            secciones.append(Seccion(titulo, f"## {titulo}\n{_renderizar(valor)}", fuente))
+    return secciones
+
+
+class IndiceBM25:
+    def __init__(self, secciones):
+        self.secciones = list(secciones)
+        self.tokens = [estimar_tokens(s.texto) for s in self.secciones]
+        # termino -> [(id_seccion, frecuencia)]
+        self.postings = defaultdict(list)
+        self.largos = []
+        for i, seccion in enumerate(self.secciones):
+            terminos = tokenizar(seccion.titulo + " " + seccion.texto)
+            self.largos.append(len(terminos))
+            for termino, frecuencia in Counter(terminos).items():
+                self.postings[termino].append((i, frecuencia))
+        total = len(self.secciones)
+        self.largo_promedio = sum(self.largos) / total if total else 0.0
+        self.idf = {
+            termino: math.log(1 + (total - len(lista) + 0.5) / (len(lista) + 0.5))
+            for termino, lista in self.postings.items()
+        }
+
+    def buscar(self, consulta, top_k=CONOCIMIENTO_TOP_K):
+        """[(puntaje, id_seccion)] ordenado de mayor a menor, solo secciones con puntaje > 0"""
+        puntajes = defaultdict(float)
+        for termino in set(tokenizar(consulta)):
+            idf = self.idf.get(termino)
+            if idf is None:
+                continue
+            for i, frecuencia in self.postings[termino]:
+                norma = BM25_K1 * (1 - BM25_B + BM25_B * self.largos[i] / self.largo_promedio)
+                puntajes[i] += idf * frecuencia * (BM25_K1 + 1) / (frecuencia + norma)
+        mejores = sorted(puntajes.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(puntaje, i) for i, puntaje in mejores]
+
+
+def seleccionar(secciones, max_tokens):
+    """Texto de las secciones en orden, saltando las que ya no caben en `max_tokens`"""
+    elegidas = []
+    usados = 0
+    for seccion in secciones:
+        costo = estimar_tokens(seccion.texto)
+        if usados + costo > max_tokens:
+            continue
+        elegidas.append(seccion.texto)
+        usados += costo
+    return "\n\n".join(elegidas)
+
+
+class IndiceConocimiento:
+    """Construye los índices en el arranque (o en el primer uso) y los rehace si cambian los JSON"""
+
+    def __init__(self, texto_base, rutas_json, intervalo_revision=PROMPTS_INTERVALO_REVISION):
+        self.texto_base = texto_base
+        self.rutas_json = rutas_json
+        self.intervalo_revision = intervalo_revision
+        self._indice = None
+        self.vectorial = None
+        self._huella = None
+        self._revisado_en = 0.0
+        self._lock = threading.Lock()
+        self.construcciones = 0
+
+    def construir(self):
+        huella = huella_archivos(self.rutas_json)
+        with self._lock:
+            if self._indice is None or self._huella != huella:
+                secciones = secciones_markdown(self.texto_base, "base")
+                for ruta in self.rutas_json:
+                    try:
+                        secciones.extend(secciones_json(ruta))
+                    except Exception as e:
+                        print(f"Error cargando conocimiento de {ruta}: {e}")
+                indice = IndiceBM25(secciones)
+                vectorial = self._cargar_vectorial(secciones)
+                # Se sustituyen juntos: una búsqueda nunca mezcla secciones de dos versiones
+                self._indice, self.vectorial = indice, vectorial
+                self._huella = huella
+                self.construcciones += 1
+            self._revisado_en = time.monotonic()
+        return self._indice
+
+    @staticmethod
+    def _cargar_vectorial(secciones):
+        try:
+            import vectores
+        except ImportError:
+            # numpy es opcional: sin él se usa solo BM25
+            return None
+        return vectores.cargar_o_construir([s.texto for s in secciones])
+
+    @property
+    def indice(self):
+        if self._indice is None or time.monotonic() - self._revisado_en >= self.intervalo_revision:
+            return self.construir()
+        return self._indice
+
+    def buscar(self, consulta, top_k=CONOCIMIENTO_TOP_K):
+        """Secciones más relevantes: BM25 fusionado por rango con el índice vectorial"""
+        indice, vectorial = self.indice, self.vectorial
+        listas = [indice.buscar(consulta, top_k * 2)]
+        if vectorial is not None:
+            listas.append(vectorial.buscar(consulta, top_k * 2))
+        fusion = defaultdict(float)
+        for lista in listas:
+            for rango, (_, i) in enumerate(lista):
+                fusion[i] += 1.0 / (RRF_K + rango + 1)
+        mejores = sorted(fusion, key=fusion.get, reverse=True)[:top_k]
+        return [indice.secciones[i] for i in mejores]
+
+    def contexto(self, consulta, top_k=CONOCIMIENTO_TOP_K, max_tokens=CONOCIMIENTO_MAX_TOKENS):
+        """Texto de las mejores secciones sin pasar de `max_tokens`"""
+        return seleccionar(self.buscar(consulta, top_k), max_tokens)
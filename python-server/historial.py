@@ -0,0 +1,150 @@
+"""Compactación del historial de conversación con presupuesto de tokens.
+
+Antes de llamar al modelo, cada endpoint pasa el historial que envió el
+cliente por `GestorHistorial.compactar`:
+
+1. Se quitan los mensajes repetidos (mismo rol y contenido), que suelen
+   ser contextos de sistema reenviados en cada turno.
+2. Si el historial cabe en el presupuesto del endpoint, se envía tal cual.
+3. Si no, se conservan al menos los últimos N mensajes y los anteriores
+   se reemplazan por un resumen. El corte avanza en pasos fijos para que
+   un mismo resumen sirva a varios turnos seguidos. Los resúmenes se cachean por hash del
+   prefijo de la conversación: cuando la ventana avanza solo se resumen
+   los mensajes nuevos a partir del último resumen conocido.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+from conocimiento import estimar_tokens
+
+HISTORIAL_RECIENTES = int(os.getenv("HISTORIAL_RECIENTES", "6"))
+# El corte avanza de PASO en PASO mensajes: el mismo resumen sirve varios turnos
+HISTORIAL_PASO = int(os.getenv("HISTORIAL_PASO", "4"))
+HISTORIAL_CACHE = int(os.getenv("HISTORIAL_CACHE", "1024"))
+PRESUPUESTOS = {
+    "chat": int(os.getenv("HISTORIAL_PRESUPUESTO_CHAT", "3000")),
+    "transacciones": int(os.getenv("HISTORIAL_PRESUPUESTO_TRANSACCIONES", "3000")),
+    "educacion": int(os.getenv("HISTORIAL_PRESUPUESTO_EDUCACION", "2000")),
+}
+# Tokens extra por mensaje (rol y separadores del formato de chat)
+TOKENS_POR_MENSAJE = 4
+
+
+def tokens_mensaje(mensaje):
+    return estimar_tokens(str(mensaje.get("content") or "")) + TOKENS_POR_MENSAJE
+
+
+def tokens_mensajes(mensajes):
+    return sum(tokens_mensaje(m) for m in mensajes)
+
+
+def deduplicar(mensajes):
+    """Quita mensajes de sistema repetidos y turnos idénticos consecutivos"""
+    vistos_sistema = set()
+    resultado = []
+    for mensaje in mensajes:
+        clave = (mensaje.get("role"), mensaje.get("content"))
+        if mensaje.get("role") == "system":
+            if clave in vistos_sistema:
+                continue
+            vistos_sistema.add(clave)
+        elif resultado and (resultado[-1].get("role"), resultado[-1].get("content")) == clave:
+            continue
+        resultado.append(mensaje)
+    return resultado
+
+
+def hashes_prefijos(mensajes):
+    """Hash acumulado de cada prefijo: hashes[k] identifica mensajes[:k + 1]"""
+    h = hashlib.sha256()
+    hashes = []
+    for mensaje in mensajes:
+        h.update(json.dumps([mensaje.get("role"), mensaje.get("content")], ensure_ascii=False).encode("utf-8"))
+        hashes.append(h.copy().hexdigest()[:24])
+    return hashes
+
+
+class GestorHistorial:
+    def __init__(self, resumir, presupuestos=PRESUPUESTOS, recientes=HISTORIAL_RECIENTES,
+                 paso=HISTORIAL_PASO, tamano_cache=HISTORIAL_CACHE):
+        """`resumir(resumen_previo, mensajes)` es una corrutina que devuelve el resumen nuevo"""
+        self.resumir = resumir
+        self.presupuestos = presupuestos
+        self.recientes = recientes
+        self.paso = max(paso, 1)
+        self.tamano_cache = tamano_cache
+        # hash del prefijo resumido -> resumen
+        self._resumenes = OrderedDict()
+        self.estadisticas = {"peticiones": 0, "compactadas": 0, "tokens_ahorrados": 0,
+                             "resumenes_calculados": 0, "resumenes_reutilizados": 0}
+
+    def _guardar_resumen(self, clave, resumen):
+        self._resumenes[clave] = resumen
+        self._resumenes.move_to_end(clave)
+        if len(self._resumenes) > self.tamano_cache:
+            self._resumenes.popitem(last=False)
+
+    async def _resumen(self, antiguos):
+        """Resumen de `antiguos`, reutilizando el del prefijo más largo ya resumido"""
+        hashes = hashes_prefijos(antiguos)
+        if hashes[-1] in self._resumenes:
+            self.estadisticas["resumenes_reutilizados"] += 1
+            self._resumenes.move_to_end(hashes[-1])
+            return self._resumenes[hashes[-1]]
+
+        previo, desde = "", 0
+        for k in range(len(hashes) - 2, -1, -1):
+            if hashes[k] in self._resumenes:
+                previo, desde = self._resumenes[hashes[k]], k + 1
+                break
+        resumen = await self.resumir(previo, antiguos[desde:])
+        self.estadisticas["resumenes_calculados"] += 1
+        self._guardar_resumen(hashes[-1], resumen)
+        return resumen
+
+    async def compactar(self, endpoint, mensajes):
+        """Devuelve (mensajes a enviar, info de tokens)"""
+        self.estadisticas["peticiones"] += 1
+        originales = tokens_mensajes(mensajes)
+        presupuesto = self.presupuestos.get(endpoint)
+        compactados = deduplicar(mensajes)
+
+        resumidos = 0
+        if presupuesto and tokens_mensajes(compactados) > presupuesto and len(compactados) > self.recientes:
+            corte = (len(compactados) - self.recientes) // self.paso * self.paso or len(compactados) - self.recientes
+            antiguos = compactados[:corte]
+            recientes = compactados[corte:]
+            try:
+                resumen = await self._resumen(antiguos)
+                compactados = [{
+                    "role": "system",
+                    "content": f"Resumen de la conversación anterior:\n{resumen}",
+                }] + recientes
+            except Exception as e:
+                # Sin resumen, mejor recortar que exceder el contexto
+                print(f"Error resumiendo historial: {e}")
+                compactados = recientes
+            resumidos = len(antiguos)
+
+        # Último recurso: descartar los más viejos hasta caber (siempre queda el último)
+        while presupuesto and len(compactados) > 1 and tokens_mensajes(compactados) > presupuesto:
+            compactados = compactados[1:]
+
+        enviados = tokens_mensajes(compactados)
+        ahorrados = max(originales - enviados, 0)
+        if ahorrados:
+            self.estadisticas["compactadas"] += 1
+            self.estadisticas["tokens_ahorrados"] += ahorrados
+        return compactados, {
+            "originales": originales,
+            "enviados": enviados,
+            "ahorrados": ahorrados,
+            "resumidos": resumidos,
+        }
+
+
+def cabecera_tokens(info):
+    """Valor de la cabecera X-Historial-Tokens"""
+    return ", ".join(f"{clave}={valor}" for clave, valor in info.items())
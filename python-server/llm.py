@@ -0,0 +1,141 @@
+"""Cliente LLM asíncrono compartido por todos los endpoints.
+
+Todas las llamadas a Hicap (chat y Whisper) pasan por aquí para no bloquear
+el event loop de uvicorn: un solo AsyncOpenAI sobre un pool HTTP compartido,
+un semáforo que acota las llamadas simultáneas y un timeout por llamada.
+
+Las completions idénticas (mismo modelo, mensajes y parámetros) que llegan
+mientras otra igual sigue en vuelo esperan a esa misma llamada en lugar de
+repetirla. Los streams no se comparten.
+
+Los reintentos, el disyuntor y la cobertura (`resiliencia.py`) sustituyen
+a los reintentos internos del SDK (`max_retries=0`). Un stream solo se
+reintenta antes de recibir el primer fragmento.
+
+El SDK y el pool HTTP se construyen en el primer uso (o al calentar el
+worker con `iniciar()`), no al importar: importar `openai` y crear el
+contexto TLS toma cientos de ms que no tienen por qué pagarse en cada
+importación.
+"""
+import asyncio
+import os
+
+import httpx
+
+from resiliencia import Resiliente
+from vuelos import GrupoVuelos, clave_canonica
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_TIMEOUT_TRANSCRIPCION = float(os.getenv("LLM_TIMEOUT_TRANSCRIPCION", "120"))
+LLM_MAX_CONCURRENCIA = int(os.getenv("LLM_MAX_CONCURRENCIA", "32"))
+LLM_MAX_CONEXIONES = int(os.getenv("LLM_MAX_CONEXIONES", "64"))
+LLM_COBERTURA = os.getenv("LLM_COBERTURA", "false").lower() in ("1", "true", "si", "yes")
+
+
+class ClienteLLM:
+    """Envoltura de AsyncOpenAI con pool de conexiones y concurrencia acotada"""
+
+    def __init__(self, api_key, base_url, default_headers=None,
+                 max_concurrencia=LLM_MAX_CONCURRENCIA,
+                 max_conexiones=LLM_MAX_CONEXIONES,
+                 timeout=LLM_TIMEOUT):
+        self.timeout = timeout
+        self._configuracion = {"api_key": api_key, "base_url": base_url, "default_headers": default_headers}
+        self.max_conexiones = max_conexiones
+        self._http = None
+        self._cliente = None
+        self._semaforo = asyncio.Semaphore(max_concurrencia)
+        self.vuelos = GrupoVuelos("llm")
+        # Un disyuntor por modelo: si uno cae, los demás siguen disponibles como respaldo
+        self.resiliencias = {}
+        # Subir el audio dos veces no compensa la cobertura
+        self.resiliencia_audio = Resiliente("whisper")
+
+    @property
+    def cliente(self):
+        """AsyncOpenAI sobre el pool compartido, construido en el primer uso"""
+        if self._cliente is None:
+            from openai import AsyncOpenAI
+
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_conexiones,
+                    max_keepalive_connections=self.max_conexiones,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+            )
+            self._cliente = AsyncOpenAI(**self._configuracion, http_client=self._http, max_retries=0)
+        return self._cliente
+
+    def iniciar(self):
+        """Construye el SDK y el pool por adelantado (calentamiento del worker)"""
+        return self.cliente
+
+    def resiliencia(self, model):
+        if model not in self.resiliencias:
+            self.resiliencias[model] = Resiliente(model, cobertura=LLM_COBERTURA)
+        return self.resiliencias[model]
+
+    async def completar(self, model, messages, timeout=None, **kwargs):
+        """Crea una completion de chat; las llamadas idénticas en vuelo se comparten"""
+        return await self.vuelos.ejecutar(
+            clave_canonica(model, messages, **kwargs),
+            lambda: self._completar(model, messages, timeout, **kwargs),
+        )
+
+    async def _completar(self, model, messages, timeout=None, **kwargs):
+        """Crea una completion de chat respetando el límite de concurrencia"""
+        async with self._semaforo:
+            return await self.resiliencia(model).ejecutar(
+                lambda plazo: self.cliente.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    timeout=plazo,
+                    **kwargs
+                ),
+                timeout or self.timeout,
+            )
+
+    async def completar_stream(self, model, messages, timeout=None, **kwargs):
+        """Itera los fragmentos de texto de una completion en streaming.
+
+        El cupo del semáforo se mantiene mientras dure el stream.
+        """
+        async with self._semaforo:
+            stream = await self.resiliencia(model).ejecutar(
+                lambda plazo: self.cliente.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    timeout=plazo,
+                    **kwargs
+                ),
+                timeout or self.timeout,
+                cubrir=False,
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    async def transcribir(self, file, model="whisper-1", timeout=None):
+        """Transcribe audio con Whisper respetando el límite de concurrencia"""
+        archivo = file[1] if isinstance(file, tuple) else file
+
+        def crear(plazo):
+            # Cada reintento vuelve a subir el audio desde el principio
+            archivo.seek(0)
+            return self.cliente.audio.transcriptions.create(model=model, file=file, timeout=plazo)
+
+        async with self._semaforo:
+            return await self.resiliencia_audio.ejecutar(crear, timeout or LLM_TIMEOUT_TRANSCRIPCION)
+
+    def estadisticas_resiliencia(self):
+        return {
+            **{modelo: r.estadisticas() for modelo, r in self.resiliencias.items()},
+            "whisper": self.resiliencia_audio.estadisticas(),
+        }
+
+    async def cerrar(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = self._cliente = None
@@ -0,0 +1,95 @@
+"""Ejecución de lotes para `/batch`: muchas conversaciones en una sola petición.
+
+Los elementos corren a la vez bajo un semáforo (`LOTE_CONCURRENCIA`) y el
+resultado de cada uno sale como una línea NDJSON en cuanto termina, no en
+el orden de entrada: cada línea lleva su `indice` y su `id`. Un elemento
+que falla produce su línea de error sin afectar a los demás, y cada uno
+tiene su propio plazo (`PETICION_PLAZO_S`), como si fuera una petición
+aparte. La última línea resume el lote.
+
+`Compartidos` deja que los elementos de un lote reutilicen un mismo
+trabajo (el snapshot de mercado, la clasificación de un mismo mensaje): la
+primera vez se lanza la tarea y los demás esperan esa misma.
+"""
+import asyncio
+import json
+import os
+import time
+
+from metricas import REGISTRO
+from resiliencia import PETICION_PLAZO_S, con_plazo
+from vuelos import consumir_excepcion
+
+LOTE_CONCURRENCIA = int(os.getenv("LOTE_CONCURRENCIA", "8"))
+LOTE_MAX_ELEMENTOS = int(os.getenv("LOTE_MAX_ELEMENTOS", "500"))
+
+LOTE_ELEMENTOS = REGISTRO.contador("lote_elementos_total", "Elementos de /batch por resultado", ("resultado",))
+
+
+def linea_ndjson(data):
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+class Compartidos:
+    """Una sola tarea por clave dentro de un lote"""
+
+    def __init__(self):
+        self._tareas = {}
+        self.reutilizados = {}
+
+    def obtener(self, clave, crear):
+        """Awaitable con el resultado de `crear()`; solo la primera llamada con `clave` lo ejecuta"""
+        tarea = self._tareas.get(clave)
+        if tarea is None:
+            tarea = self._tareas[clave] = asyncio.ensure_future(crear())
+            tarea.add_done_callback(consumir_excepcion)
+        else:
+            tipo = clave[0] if isinstance(clave, tuple) else clave
+            self.reutilizados[tipo] = self.reutilizados.get(tipo, 0) + 1
+        # shield: si un elemento descarta su espera (ej. el prefetch especulativo), la tarea sigue para los demás
+        return asyncio.shield(tarea)
+
+    def cancelar(self):
+        for tarea in self._tareas.values():
+            tarea.cancel()
+
+
+async def ejecutar_lote(elementos, procesar, concurrencia=LOTE_CONCURRENCIA,
+                        plazo_elemento=PETICION_PLAZO_S, resumen=None):
+    """Líneas NDJSON con el resultado de `await procesar(elemento)` de cada elemento, conforme terminan"""
+    semaforo = asyncio.Semaphore(concurrencia)
+    inicio = time.perf_counter()
+
+    async def uno(indice, elemento):
+        async with semaforo:
+            desde = time.perf_counter()
+            linea = {"indice": indice, "id": getattr(elemento, "id", None)}
+            try:
+                with con_plazo(plazo_elemento):
+                    linea["resultado"] = await procesar(elemento)
+                linea["ok"] = True
+            except Exception as e:
+                print(f"Error en elemento {indice} del lote: {e}")
+                linea.update(ok=False, error=str(e) or type(e).__name__, tipo=type(e).__name__)
+            linea["ms"] = round((time.perf_counter() - desde) * 1000, 1)
+            LOTE_ELEMENTOS.inc("exito" if linea["ok"] else "error")
+            return linea
+
+    tareas = [asyncio.ensure_future(uno(i, elemento)) for i, elemento in enumerate(elementos)]
+    errores = 0
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            linea = await siguiente
+            errores += not linea["ok"]
+            yield linea_ndjson(linea)
+        yield linea_ndjson({
+            "fin": True,
+            "total": len(elementos),
+            "errores": errores,
+            "ms": round((time.perf_counter() - inicio) * 1000, 1),
+            **(resumen() if resumen else {}),
+        })
+    finally:
+        # Si el cliente se desconecta no se sigue gastando en llamadas al modelo
+        for tarea in tareas:
+            tarea.cancel()
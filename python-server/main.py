@@ -1,14 +1,106 @@
-from fastapi import FastAPI, HTTPException
+import time
+_inicio_importacion = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict
+from starlette.datastructures import UploadFile
+from typing import Literal, Optional
 import os
 import json
-import requests
-from openai import OpenAI
 import base64
 import io
+import asyncio
+from functools import lru_cache
+
+from acciones import ExtractorAcciones
+from audio import LIMITE_BYTES, AudioDemasiadoGrande, acumular_audio, limitar_receive, nombre_audio
+from clasificador import ClasificadorEscalonado, REGLAS_CHAT, REGLAS_TRANSACCIONES, normalizar
+from compartido import abrir_almacen
+from conocimiento import IndiceConocimiento
+from historial import GestorHistorial, cabecera_tokens
+from llm import ClienteLLM
+from mercado import GestorMercado
+from lotes import LOTE_CONCURRENCIA, LOTE_MAX_ELEMENTOS, Compartidos, ejecutar_lote
+from metricas import REGISTRO, MiddlewareMetricas
+from modelos import RouterModelos
+from precios import ServicioPrecios, TickerPrecios, PRECIOS_TICKER
+from portafolio import GestorPortafolio, MENSAJE_SIN_PORTAFOLIO
+from prompts import RegistroPrompts
+from resiliencia import PlazoPeticion, ProveedorNoDisponible
+from respuestas import CacheRespuestas, clave_respuesta
+from streaming import evento_sse, transmitir, transmitir_fijo
+from tiempos import Cronometro
+from transcripcion import (
+    TRANSCRIPCION_MIN_SEGMENTAR_S, abrir_wav, texto_completo, transcribir_segmentos, unir_textos
+)
+from usuarios import ContextoUsuarios, crear_almacen
+
+# Cambia a True cuando el worker terminó de calentar (lo reporta /ready, con los ms de arranque)
+estado_servicio = {"listo": False, "pid": os.getpid(), "arranque_ms": {}}
 
-app = FastAPI()
+def calentar():
+    """Construye lo pesado antes del primer request; devuelve los ms de cada etapa.
+
+    Importar el módulo no hace I/O: clientes HTTP, archivos, índices y prompts
+    se construyen aquí (o en su primer uso si se importa sin lifespan).
+    """
+    def abrir_almacenes():
+        if almacen_compartido:
+            almacen_compartido.abrir()
+        contexto_usuarios.almacen.abrir()
+
+    def abrir_clientes_http():
+        llm.iniciar()
+        precios.iniciar()
+
+    etapas = {}
+    for nombre, paso in (
+        ("almacenes", abrir_almacenes),
+        ("clientes_http", abrir_clientes_http),
+        ("portafolio", gestor_portafolio.iniciar),
+        ("conocimiento", indice_conocimiento.construir),
+        ("prompts", registro_prompts.calentar),
+    ):
+        inicio = time.perf_counter()
+        paso()
+        etapas[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+    return etapas
+
+@asynccontextmanager
+async def lifespan(app):
+    inicio = time.perf_counter()
+    etapas = calentar()
+    ticker = None
+    if PRECIOS_TICKER:
+        # Mantiene caliente la tabla de precios de todos los activos conocidos
+        # (con varios workers, solo en el líder; los demás leen el almacén compartido)
+        inicio_ticker = time.perf_counter()
+        ticker = TickerPrecios(precios, mercado.activos, mercado.monedas)
+        await ticker.iniciar()
+        etapas["ticker"] = round((time.perf_counter() - inicio_ticker) * 1000, 1)
+    estado_servicio["pid"] = os.getpid()
+    estado_servicio["arranque_ms"] = {
+        "importacion": estado_servicio["arranque_ms"].get("importacion"),
+        **etapas,
+        "calentamiento": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+    estado_servicio["listo"] = True
+    print(f"🔥 Worker {os.getpid()} listo: {estado_servicio['arranque_ms']} "
+          f"(almacén compartido: {almacen_compartido.ruta if almacen_compartido else 'no'})")
+    yield
+    estado_servicio["listo"] = False
+    await gestor_portafolio.detener()
+    if ticker:
+        await ticker.detener()
+    await llm.cerrar()
+    await precios.cerrar()
+    if almacen_compartido:
+        almacen_compartido.cerrar()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configurar CORS para desarrollo local
 app.add_middleware(
@@ -18,46 +110,78 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Presupuesto de tiempo de cada petición para las llamadas a Hicap y CoinGecko
+app.add_middleware(PlazoPeticion)
+# Id de traza, duración y estado por endpoint (la más externa: mide todo lo demás)
+app.add_middleware(MiddlewareMetricas)
 
 # Configuración de la API
 HICAP_API_KEY = os.getenv("HICAP_API_KEY", "9c2596c15e3a4b9d9517bd85b13a133d")
-HICAP_BASE_URL = "https://api.hicap.ai/v2/openai"
-MODELO_CHAT = "gemini-2.5-pro"
+HICAP_BASE_URL = os.getenv("HICAP_BASE_URL", "https://api.hicap.ai/v2/openai")
 
 HEADERS = {
     "api-key": HICAP_API_KEY
 }
 
-client = OpenAI(
+# Cliente asíncrono compartido (pool HTTP, concurrencia acotada y timeouts)
+llm = ClienteLLM(
     api_key=HICAP_API_KEY,
     base_url=HICAP_BASE_URL,
     default_headers=HEADERS
 )
 
-# Datos ficticios de usuario
-usuario = {
+# Modelo, respaldos y max_tokens por endpoint y etapa (configurables por entorno)
+router = RouterModelos(llm)
+
+# Almacén SQLite que comparten los workers (precios, clasificaciones y respuestas);
+# None si no hay CACHE_COMPARTIDA: todo queda en memoria del proceso
+almacen_compartido = abrir_almacen()
+
+# Precios de CoinGecko en lote, con caché TTL compartida por todas las peticiones
+precios = ServicioPrecios(compartido=almacen_compartido)
+
+# Símbolos y nombres aceptados -> id de CoinGecko (también son los activos del snapshot de mercado)
+CRIPTO_IDS = {
+    'btc': 'bitcoin',
+    'bitcoin': 'bitcoin',
+    'eth': 'ethereum',
+    'ethereum': 'ethereum',
+    'usdt': 'tether',
+    'tether': 'tether',
+    'usdc': 'usd-coin',
+    'sol': 'solana',
+    'solana': 'solana',
+    'matic': 'matic-network',
+    'polygon': 'matic-network'
+}
+
+# Datos ficticios del usuario demo (se usan cuando la petición no trae userId)
+USUARIO_DEMO = {
     "nombre": "Juan Pérez",
     "perfil_riesgo": "Moderado",
     "objetivo": "Crecimiento moderado en 12-24 meses",
 }
 
-# Transacciones históricas se mantienen igual
-transacciones_historicas = [
+# Transacciones históricas del usuario demo
+TRANSACCIONES_DEMO = [
     {"fecha": "2025-10-10", "activo": "bitcoin", "cantidad": 0.5, "tipo": "compra", "precio_usd": 25000},
     {"fecha": "2025-09-15", "activo": "ethereum", "cantidad": 5, "tipo": "compra", "precio_usd": 3000},
     {"fecha": "2025-08-01", "activo": "stablecoins", "cantidad": 9000, "tipo": "compra", "precio_usd": 1},
 ]
 
-def cargar_portafolio():
-    try:
-        with open("public/portfolio-data.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data
-    except Exception as e:
-        print(f"Error leyendo portafolio dinámico: {e}")
-        return None
+# Ruta absoluta: no depende del directorio desde el que se arranque el servidor
+RUTA_PORTAFOLIO = os.getenv(
+    "PORTAFOLIO_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "public", "portfolio-data.json")
+)
+
+# Cuántas transacciones recientes se incluyen en el contexto
+ULTIMAS_TRANSACCIONES = int(os.getenv("ULTIMAS_TRANSACCIONES", "3"))
+
+def generar_contexto_fijo(portafolio_data, perfil=USUARIO_DEMO, transacciones=TRANSACCIONES_DEMO):
+    if not portafolio_data:
+        return MENSAJE_SIN_PORTAFOLIO
 
-def generar_contexto_fijo(portafolio_data):
     # Mapeamos distribución a objeto para detalle (simplificado)
     distribucion_obj = {}
     for item in portafolio_data.get("distribution", []):
@@ -75,9 +199,9 @@ def generar_contexto_fijo(portafolio_data):
     contexto = f"""
 --- CONTEXTO FIJO DEL USUARIO ---
 Perfil del usuario:
-- Nombre: {usuario['nombre']}
-- Perfil de riesgo: {usuario['perfil_riesgo']} (Recuerda: Moderado = balance entre crecimiento y seguridad)
-- Objetivo: {usuario['objetivo']}
+- Nombre: {perfil.get('nombre', 'Usuario')}
+- Perfil de riesgo: {perfil.get('perfil_riesgo', 'Moderado')} (Recuerda: Moderado = balance entre crecimiento y seguridad)
+- Objetivo: {perfil.get('objetivo', 'No especificado')}
 
 Portafolio Actual:
 - Valor total: ${portafolio_data.get('totalValue', 0):.2f}
@@ -86,24 +210,17 @@ Portafolio Actual:
 - Detalle de la composición (cantidades y precios): {json.dumps(detalle_predeterminado, indent=2)}
 
 Histórico de Transacciones (Recientes):
-{json.dumps(transacciones_historicas[-3:], indent=2)}
+{json.dumps(transacciones[-ULTIMAS_TRANSACCIONES:], indent=2)}
 --- FIN CONTEXTO FIJO ---
 """
     return contexto
 
-# Se genera el contexto fijo una vez cargando datos dinámicos
-portafolio_dinamico = cargar_portafolio()
-if portafolio_dinamico:
-    contexto_fijo = generar_contexto_fijo(portafolio_dinamico)
-else:
-        contexto_fijo = "No se pudo cargar la información del portafolio dinámico."
-
-system_prompt = contexto_fijo + """
-Eres un asesor financiero basado en inteligencia artificial especializado en inversiones Web3. Tu misión es ayudar al usuario a analizar su portafolio, ofrecer recomendaciones de inversión personalizadas, crear y gestionar tareas programadas (como compras recurrentes), y simplificar la experiencia financiera en blockchain. Respondes siempre en español. Actúas como asistente experto pero accesible, simplificando conceptos complejos y eliminando tecnicismos innecesarios. Te comportas como un asesor profesional con enfoque amigable, directo y centrado en resultados.
+# Instrucciones fijas del asesor: van primero para que el prefijo del prompt sea estable
+INSTRUCCIONES_ASESOR = """Eres un asesor financiero basado en inteligencia artificial especializado en inversiones Web3. Tu misión es ayudar al usuario a analizar su portafolio, ofrecer recomendaciones de inversión personalizadas, crear y gestionar tareas programadas (como compras recurrentes), y simplificar la experiencia financiera en blockchain. Respondes siempre en español. Actúas como asistente experto pero accesible, simplificando conceptos complejos y eliminando tecnicismos innecesarios. Te comportas como un asesor profesional con enfoque amigable, directo y centrado en resultados.
 
 --- CONTEXTO DE FUNCIONALIDAD ---
 
-1. Tu principal objetivo es **maximizar la rentabilidad del portafolio del usuario**, considerando todos los datos de su Perfil y Portafolio Actual que tienes arriba.
+1. Tu principal objetivo es **maximizar la rentabilidad del portafolio del usuario**, considerando todos los datos de su Perfil y Portafolio Actual que tienes en el contexto fijo del usuario.
 2. **NO debes hacer recomendaciones sin que el usuario lo solicite**, a menos que haya una alerta crítica que amerite una sugerencia (ej: alta volatilidad o riesgo inminente).
 3. Eres capaz de generar y simular acciones futuras en forma de **tareas programadas**.
 4. **IMPORTANTE**: Cuando el usuario quiera programar una tarea, debes responder con un JSON en este formato EXACTO al final de tu mensaje, entre marcadores ###TASK_JSON###:
@@ -125,26 +242,192 @@ Eres un asesor financiero basado en inteligencia artificial especializado en inv
 Comienza saludando al usuario si es la primera interacción, y espera sus instrucciones. Siempre estás listo para ayudar.
 """
 
+# Portafolio dinámico con recarga en caliente: se re-renderiza solo cuando cambia el archivo
+gestor_portafolio = GestorPortafolio(RUTA_PORTAFOLIO, generar_contexto_fijo)
+
+# Perfil, portafolio y transacciones por usuario, con su contexto renderizado en caché
+contexto_usuarios = ContextoUsuarios(
+    crear_almacen(), generar_contexto_fijo, gestor_portafolio, USUARIO_DEMO, TRANSACCIONES_DEMO
+)
+
+# Prompts compilados una vez y recompilados solo si cambian sus entradas.
+# El contexto de cada usuario va en un mensaje aparte para no romper el prefijo común.
+registro_prompts = RegistroPrompts()
+registro_prompts.registrar("chat", lambda: INSTRUCCIONES_ASESOR)
+
 class ChatRequest(BaseModel):
     messages: list
     isFirstMessage: bool = False
+    stream: bool = False
+    userId: Optional[str] = None
+
+class ElementoDistribucion(BaseModel):
+    # Campos extra (ej. "color" del dashboard) se conservan
+    model_config = ConfigDict(extra="allow")
+    name: str
+    value: float
+
+class PortafolioUsuario(BaseModel):
+    """Misma forma que public/portfolio-data.json; lo que no cumpla responde 422"""
+    model_config = ConfigDict(extra="allow")
+    totalValue: float
+    performance: float = 0
+    distribution: list[ElementoDistribucion] = []
+
+class UsuarioRequest(BaseModel):
+    perfil: Optional[dict] = None
+    transacciones: Optional[list] = None
+    portafolio: Optional[PortafolioUsuario] = None
+
+def respuesta_sse(eventos, crono=None, cabeceras=None):
+    """StreamingResponse de server-sent events sin buffering intermedio"""
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **(cabeceras or {})}
+    if crono:
+        headers["Server-Timing"] = crono.server_timing()
+    return StreamingResponse(eventos, media_type="text/event-stream", headers=headers)
 
 class TranscribeRequest(BaseModel):
     audio: str
 
-def obtener_precio_actual(activo_id="bitcoin", vs_currency="usd"):
-    url = f"https://api.coingecko.com/api/v3/simple/price?ids={activo_id}&vs_currencies={vs_currency}&include_24hr_change=true"
-    try:
-        resp = requests.get(url, timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-        if activo_id in data:
-            return data[activo_id]
-    except Exception as e:
-        print(f"Error al obtener precio: {e}")
+async def obtener_precio_actual(activo_id="bitcoin", vs_currency="usd"):
+    data = await precios.obtener([activo_id], [vs_currency])
+    return data.get(activo_id.lower())
+
+def nota_precios_obsoletos(snapshot):
+    """Aviso para el modelo cuando algún precio viene del último valor conocido"""
+    minutos = snapshot.antiguedad_obsoletos()
+    if minutos is None:
+        return ""
+    hace = f"hace {minutos} min" if minutos else "hace menos de un minuto"
+    return f"\n(Nota: algunos precios no están actualizados, último dato de {hace})\n"
+
+def renderizar_mercado_chat(snapshot):
+    """Fragmento de mercado para /chat"""
+    btc = snapshot.precios.get("bitcoin")
+    eth = snapshot.precios.get("ethereum")
+    mensaje_contexto = "Contexto de mercado actual (información en tiempo real):\n"
+    if btc and 'usd' in btc:
+        mensaje_contexto += f"- Bitcoin: ${btc['usd']:.2f}, cambio 24h: {btc.get('usd_24h_change', 0):.2f}%\n"
+    if eth and 'usd' in eth:
+        mensaje_contexto += f"- Ethereum: ${eth['usd']:.2f}, cambio 24h: {eth.get('usd_24h_change', 0):.2f}%\n"
+    mensaje_contexto += nota_precios_obsoletos(snapshot)
+    return mensaje_contexto
+
+def renderizar_mercado_transacciones(snapshot):
+    """Fragmento de mercado para /transaction-chat (USD, MXN y tipo de cambio del mismo snapshot)"""
+    btc = snapshot.precios.get("bitcoin")
+    eth = snapshot.precios.get("ethereum")
+    usdt = snapshot.precios.get("tether")
+    
+    mensaje_contexto = "Precios de mercado actuales:\n"
+    if btc and 'usd' in btc:
+        mensaje_contexto += f"- Bitcoin (BTC): ${btc['usd']:.2f} USD"
+        if 'mxn' in btc:
+            mensaje_contexto += f" | ${btc['mxn']:.2f} MXN"
+        mensaje_contexto += f" | Cambio 24h: {btc.get('usd_24h_change', 0):.2f}%\n"
+    if eth and 'usd' in eth:
+        mensaje_contexto += f"- Ethereum (ETH): ${eth['usd']:.2f} USD"
+        if 'mxn' in eth:
+            mensaje_contexto += f" | ${eth['mxn']:.2f} MXN"
+        mensaje_contexto += f" | Cambio 24h: {eth.get('usd_24h_change', 0):.2f}%\n"
+    if usdt and 'usd' in usdt:
+        mensaje_contexto += f"- Tether (USDT): ${usdt['usd']:.4f} USD (stablecoin)\n"
+    if snapshot.usd_mxn:
+        mensaje_contexto += f"\nTipo de cambio: 1 USD = {snapshot.usd_mxn:.2f} MXN"
+    mensaje_contexto += nota_precios_obsoletos(snapshot)
+    return mensaje_contexto
+
+# Snapshot de mercado versionado: una consulta por ventana para todos los activos conocidos,
+# con cada fragmento de prompt renderizado una vez por versión
+mercado = GestorMercado(precios, set(CRIPTO_IDS.values()), {
+    "chat": renderizar_mercado_chat,
+    "transacciones": renderizar_mercado_transacciones,
+})
+
+async def construir_contexto_mercado():
+    """Contexto de mercado para /chat"""
+    return (await mercado.snapshot()).fragmento("chat")
+
+async def construir_contexto_mercado_transacciones():
+    """Contexto de mercado para /transaction-chat"""
+    return (await mercado.snapshot()).fragmento("transacciones")
+
+def iniciar_prefetch_mercado(crono, constructor):
+    """Arranca la consulta de mercado en paralelo a la clasificación (especulativa)"""
+    async def prefetch():
+        # La corrutina se crea dentro de la tarea: si se cancela antes de arrancar no queda huérfana
+        return await crono.medir("mercado", constructor())
+    return asyncio.create_task(prefetch())
+
+async def resolver_prefetch_mercado(prefetch, tipo_intencion):
+    """Devuelve el contexto si la intención es MERCADO; si no, descarta el prefetch"""
+    if tipo_intencion == "MERCADO":
+        return await prefetch
+    prefetch.cancel()
     return None
 
-def clasificar_intencion(user_input):
+async def resumir_historial(resumen_previo, mensajes):
+    """Resume los turnos que salen de la ventana, partiendo del resumen anterior"""
+    turnos = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in mensajes)
+    if resumen_previo:
+        turnos = f"Resumen previo:\n{resumen_previo}\n\nNuevos turnos:\n{turnos}"
+    completion = await router.completar(
+        "historial.resumen",
+        [
+            {"role": "system", "content": "Resume en español y en máximo 6 viñetas esta conversación entre un usuario y su asistente financiero. Conserva montos, activos, contactos, fechas y decisiones pendientes."},
+            {"role": "user", "content": turnos},
+        ],
+        temperature=0,
+    )
+    return completion.choices[0].message.content.strip()
+
+# Historial por endpoint: últimos turnos completos + resumen cacheado de los anteriores
+gestor_historial = GestorHistorial(resumir_historial)
+
+# Respuestas reutilizables de prompts idénticos (memoria + disco opcional compartido)
+cache_respuestas = CacheRespuestas(compartido=almacen_compartido)
+
+# Intenciones que producen acciones: repetirlas debe generar una acción nueva, nunca una guardada
+INTENCIONES_CON_ACCION = {"TRANSFERENCIA", "REGISTRO_CONTACTO", "PAGO_SERVICIO"}
+# En /chat, las consultas de TRANSACCIONES son las que programan tareas (TASK_JSON)
+INTENCIONES_CHAT_CON_TAREA = {"TRANSACCIONES"}
+
+def buscar_respuesta(clave, cabeceras):
+    """Respuesta guardada para `clave` (o None), anotando HIT/MISS en las cabeceras.
+
+    Sin clave (turno que no usa la caché) no se consulta nada.
+    """
+    if clave is None:
+        return None
+    guardada = cache_respuestas.leer(clave)
+    cabeceras["X-Cache-Respuesta"] = "HIT" if guardada is not None else "MISS"
+    return guardada
+
+def guardar_respuesta(clave, resultado, bloques):
+    """Guarda la respuesta solo si no trae tareas o acciones"""
+    if clave and not bloques:
+        cache_respuestas.guardar(clave, resultado)
+    return resultado
+
+def respuesta_chat(visible, tareas):
+    """Cuerpo de /chat: `task` es la primera tarea (contrato original) y `tasks` todas"""
+    return {"response": visible, "task": tareas[0] if tareas else None, "tasks": tareas}
+
+def respuesta_transacciones(visible, intencion, acciones):
+    """Cuerpo de /transaction-chat: `action` es la primera acción y `actions` todas"""
+    return {"response": visible, "intencion": intencion,
+            "action": acciones[0] if acciones else None, "actions": acciones}
+
+def historial_chat(messages):
+    """Solo los turnos de usuario y asistente que envió el cliente"""
+    return [
+        {"role": msg['role'], "content": msg['content']}
+        for msg in messages
+        if msg.get('role') in ['user', 'assistant']
+    ]
+
+async def clasificar_intencion_llm(user_input):
+    """Clasificación con el LLM; los errores los maneja el clasificador escalonado"""
     prompt_clasificador = [
         {
             "role": "system",
@@ -163,176 +446,288 @@ def clasificar_intencion(user_input):
         }
     ]
 
-    try:
-        response = client.chat.completions.create(
-            model=MODELO_CHAT,
-            messages=prompt_clasificador
-        )
-        categoria = response.choices[0].message.content.strip().upper()
-        
-        if categoria.startswith("PORTAFOLIO"):
-            return "PORTAFOLIO"
-        elif categoria.startswith("TRANSACCIONES"):
-            return "TRANSACCIONES"
-        elif categoria.startswith("MERCADO"):
-            return "MERCADO"
-        else:
-            return "TRANSACCIONES"
-    except Exception as e:
-        print(f"Error clasificando intención: {e}")
+    response = await router.completar("chat.clasificacion", prompt_clasificador)
+    categoria = response.choices[0].message.content.strip().upper()
+    
+    if categoria.startswith("PORTAFOLIO"):
+        return "PORTAFOLIO"
+    elif categoria.startswith("TRANSACCIONES"):
         return "TRANSACCIONES"
+    elif categoria.startswith("MERCADO"):
+        return "MERCADO"
+    else:
+        return "TRANSACCIONES"
+
+clasificador_chat = ClasificadorEscalonado(
+    "chat", REGLAS_CHAT, clasificar_intencion_llm, "TRANSACCIONES", compartido=almacen_compartido
+)
+
+async def clasificar_intencion(user_input):
+    return await clasificador_chat.clasificar(user_input)
+
+async def preparar_chat(messages, user_id, crono, cabeceras,
+                        clasificar=clasificar_intencion, contexto_mercado=construir_contexto_mercado):
+    """Mensajes para el modelo y clave de caché de un turno de /chat.
+
+    La clave es None si la intención puede programar una tarea: esos turnos no usan la caché.
+    `clasificar` y `contexto_mercado` se sustituyen en /batch para compartirlos entre elementos.
+    """
+    # Obtener el último mensaje del usuario
+    last_user_message = None
+    for msg in reversed(messages):
+        if msg.get('role') == 'user':
+            last_user_message = msg.get('content', '')
+            break
+    
+    if not last_user_message:
+        raise HTTPException(status_code=400, detail="No se encontró mensaje del usuario")
+    
+    # Clasificar intención mientras se consulta el mercado en paralelo
+    # y se compacta el historial
+    prefetch = iniciar_prefetch_mercado(crono, contexto_mercado)
+    tipo_intencion, (historial, info_historial) = await asyncio.gather(
+        crono.medir("clasificacion", clasificar(last_user_message)),
+        crono.medir("historial", gestor_historial.compactar("chat", historial_chat(messages))),
+    )
+    cabeceras["X-Historial-Tokens"] = cabecera_tokens(info_historial)
+    mensaje_contexto = await resolver_prefetch_mercado(prefetch, tipo_intencion)
+    
+    # Construir mensajes para la IA
+    ai_messages = [
+        {"role": "system", "content": registro_prompts.obtener("chat").texto},
+        {"role": "system", "content": contexto_usuarios.contexto(user_id)},
+    ]
+    
+    # Agregar contexto de mercado si es necesario
+    if mensaje_contexto:
+        ai_messages.append({"role": "system", "content": mensaje_contexto})
+    
+    # Agregar historial compactado
+    ai_messages.extend(historial)
+
+    # Repetir una petición de tarea debe generar una tarea nueva, nunca una guardada
+    if tipo_intencion in INTENCIONES_CHAT_CON_TAREA:
+        cache_respuestas.omitir()
+        cabeceras["X-Cache-Respuesta"] = "BYPASS"
+        return ai_messages, None
+    return ai_messages, clave_respuesta("chat", router.ruta("chat.respuesta").modelos, ai_messages)
+
+async def completar_chat(ai_messages, clave_cache, crono):
+    """Respuesta de /chat sin streaming: completion, tareas validadas y caché"""
+    completion = await crono.medir("completion", router.completar("chat.respuesta", ai_messages))
+    
+    ai_response = completion.choices[0].message.content
+    
+    # Separar las tareas programadas (validadas) del texto visible
+    with crono.etapa("extraccion"):
+        ai_response, tareas = ExtractorAcciones.tareas().extraer(ai_response)
+    
+    return guardar_respuesta(clave_cache, respuesta_chat(ai_response, tareas), tareas)
 
 @app.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response):
+    crono = Cronometro("chat")
+    cabeceras = {}
     try:
         messages = request.messages
         
         # Si es el primer mensaje, enviar saludo
         if request.isFirstMessage or len(messages) == 0:
-            return {
-                "response": f"Hola {usuario['nombre']}! Soy tu asistente de inversión. ¿Cómo puedo ayudarte hoy?"
+            nombre = contexto_usuarios.perfil(request.userId).get('nombre')
+            saludo = {
+                "response": f"Hola{' ' + nombre if nombre else ''}! Soy tu asistente de inversión. ¿Cómo puedo ayudarte hoy?"
             }
+            return respuesta_sse(transmitir_fijo(saludo)) if request.stream else saludo
         
-        # Obtener el último mensaje del usuario
-        last_user_message = None
-        for msg in reversed(messages):
-            if msg.get('role') == 'user':
-                last_user_message = msg.get('content', '')
-                break
+        ai_messages, clave_cache = await preparar_chat(messages, request.userId, crono, cabeceras)
         
-        if not last_user_message:
-            raise HTTPException(status_code=400, detail="No se encontró mensaje del usuario")
+        # Un prompt idéntico (mismo contexto de mercado incluido) reutiliza la respuesta guardada
+        guardada = buscar_respuesta(clave_cache, cabeceras)
+        if guardada is not None:
+            return respuesta_sse(transmitir_fijo(guardada), crono, cabeceras) if request.stream else guardada
         
-        # Clasificar intención
-        tipo_intencion = clasificar_intencion(last_user_message)
-        
-        # Construir mensajes para la IA
-        ai_messages = [{"role": "system", "content": system_prompt}]
-        
-        # Agregar contexto de mercado si es necesario
-        if tipo_intencion == "MERCADO":
-            btc = obtener_precio_actual("bitcoin", "usd")
-            eth = obtener_precio_actual("ethereum", "usd")
-            mensaje_contexto = "Contexto de mercado actual (información en tiempo real):\n"
-            if btc:
-                mensaje_contexto += f"- Bitcoin: ${btc.get('usd', 'N/A'):.2f}, cambio 24h: {btc.get('usd_24h_change', 'N/A'):.2f}%\n"
-            if eth:
-                mensaje_contexto += f"- Ethereum: ${eth.get('usd', 'N/A'):.2f}, cambio 24h: {eth.get('usd_24h_change', 'N/A'):.2f}%\n"
-            ai_messages.append({"role": "system", "content": mensaje_contexto})
+        # Modo streaming: los tokens salen conforme llegan y la tarea va en el evento final
+        if request.stream:
+            return respuesta_sse(transmitir(
+                router.completar_stream("chat.respuesta", ai_messages),
+                lambda visible, tareas: guardar_respuesta(
+                    clave_cache, respuesta_chat(visible, tareas), tareas
+                ),
+                ExtractorAcciones.tareas(),
+            ), crono, cabeceras)
         
-        # Agregar historial de mensajes
-        for msg in messages:
-            if msg.get('role') in ['user', 'assistant']:
-                ai_messages.append({
-                    "role": msg['role'],
-                    "content": msg['content']
-                })
-        
-        # Llamar a la IA
-        response = client.chat.completions.create(
-            model=MODELO_CHAT,
-            messages=ai_messages
-        )
-        
-        ai_response = response.choices[0].message.content
-        
-        # Detectar si hay una tarea programada en la respuesta
-        task_json = None
-        if "###TASK_JSON###" in ai_response:
-            try:
-                parts = ai_response.split("###TASK_JSON###")
-                if len(parts) >= 3:
-                    json_str = parts[1].strip()
-                    task_json = json.loads(json_str)
-                    # Remover el JSON de la respuesta visible
-                    ai_response = parts[0].strip() + (parts[2].strip() if len(parts) > 2 else "")
-            except Exception as e:
-                print(f"Error parseando task JSON: {e}")
-        
-        return {
-            "response": ai_response,
-            "task": task_json
-        }
+        return await completar_chat(ai_messages, clave_cache, crono)
     
+    except ProveedorNoDisponible as e:
+        print(f"Proveedor no disponible en chat: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error en chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        response.headers.update(cabeceras)
+        response.headers["Server-Timing"] = crono.server_timing()
+
+@app.put("/usuarios/{user_id}")
+async def actualizar_usuario(user_id: str, request: UsuarioRequest):
+    """Guarda perfil, transacciones y/o portafolio de un usuario e invalida su contexto"""
+    # En un hilo: con SQLite la escritura puede esperar a otro worker
+    guardado = await asyncio.to_thread(
+        contexto_usuarios.actualizar,
+        user_id,
+        perfil=request.perfil,
+        transacciones=request.transacciones,
+        portafolio=request.portafolio.model_dump() if request.portafolio else None,
+    )
+    return {"userId": user_id, "campos": sorted(guardado)}
+
+async def transcribir_texto(nombre, archivo):
+    """Transcribe con Whisper un archivo ya recibido (en memoria o en disco)"""
+    transcription = await llm.transcribir(
+        file=(nombre, archivo),
+        model="whisper-1"
+    )
+    return transcription.text
+
+async def transcribir_archivo(nombre, archivo):
+    return {
+        "text": await transcribir_texto(nombre, archivo)
+    }
+
+async def transcribir_wav_por_segmentos(lector):
+    textos = {}
+    async for indice, _, texto in transcribir_segmentos(lector, transcribir_texto):
+        textos[indice] = texto
+    return {"text": texto_completo(textos[i] for i in sorted(textos)), "segmentos": len(textos)}
+
+async def eventos_transcripcion(lector, nombre, archivo, liberar):
+    """Eventos SSE: `segmento` conforme termina cada uno (con el texto continuo hasta ahí) y `done`"""
+    try:
+        if lector is None:
+            texto = await transcribir_texto(nombre, archivo)
+            yield evento_sse("segmento", {"indice": 0, "inicio_s": 0.0, "texto": texto, "parcial": texto})
+            yield evento_sse("done", {"text": texto, "segmentos": 1})
+            return
+
+        textos = {}
+        parcial = ""
+        continuos = 0
+        async for indice, inicio_s, texto in transcribir_segmentos(lector, transcribir_texto):
+            textos[indice] = texto
+            # Solo se une lo que ya no tiene huecos antes
+            while continuos in textos:
+                parcial = unir_textos(parcial, textos[continuos]) if parcial else textos[continuos].strip()
+                continuos += 1
+            yield evento_sse("segmento", {
+                "indice": indice, "inicio_s": round(inicio_s, 2), "texto": texto, "parcial": parcial,
+            })
+        yield evento_sse("done", {"text": parcial, "segmentos": len(textos)})
+    except Exception as e:
+        print(f"Error en transcripción por segmentos: {e}")
+        yield evento_sse("error", {"detail": str(e)})
+    finally:
+        await liberar()
 
 @app.post("/transcribe")
 async def transcribe(request: TranscribeRequest):
+    # Base64 ocupa 4/3 del audio: se rechaza antes de decodificar
+    if len(request.audio) * 3 // 4 > LIMITE_BYTES:
+        raise HTTPException(status_code=413, detail=str(AudioDemasiadoGrande()))
     try:
         # Decodificar audio de base64
         audio_data = base64.b64decode(request.audio)
         
-        # Crear archivo temporal en memoria
-        audio_file = io.BytesIO(audio_data)
-        audio_file.name = "audio.webm"
-        
-        # Transcribir con Whisper
-        transcription = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file
-        )
-        
-        return {
-            "text": transcription.text
-        }
+        # BytesIO reutiliza el buffer de los bytes decodificados (sin otra copia)
+        return await transcribir_archivo("audio.webm", io.BytesIO(audio_data))
     
+    except ProveedorNoDisponible as e:
+        print(f"Proveedor no disponible en transcripción: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error en transcripción: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def convertir_moneda(cantidad, de, a="mxn"):
+@app.post("/transcribe/upload")
+async def transcribe_upload(request: Request, nombre: Optional[str] = None,
+                            segmentar: bool = False, stream: bool = False):
+    """Audio en multipart (campo `audio` o `file`) o como cuerpo crudo, sin base64.
+
+    Con `segmentar=true` los WAV largos se transcriben por segmentos en paralelo y con
+    `stream=true` los resultados parciales llegan como server-sent events.
+    """
+    tipo = request.headers.get("content-type", "")
+    largo = request.headers.get("content-length")
+    # Margen para los encabezados del multipart
+    limite_multipart = LIMITE_BYTES + 64 * 1024
+    if largo and largo.isdigit() and int(largo) > limite_multipart:
+        raise HTTPException(status_code=413, detail=str(AudioDemasiadoGrande()))
+
+    archivo = None
+    formulario = None
+    entregado = False
+
+    async def liberar():
+        if formulario is not None:
+            await formulario.close()
+        elif archivo is not None:
+            archivo.close()
+
+    try:
+        if tipo.startswith("multipart/form-data"):
+            # Starlette guarda la parte del archivo en un temporal que pasa a disco al crecer;
+            # los bytes se cuentan al leerlos, así el límite aplica aunque no haya Content-Length
+            limitada = Request(request.scope, limitar_receive(request.receive, limite_multipart))
+            formulario = await limitada.form(max_files=1, max_fields=5)
+            subido = formulario.get("audio") or formulario.get("file")
+            if not isinstance(subido, UploadFile):
+                raise HTTPException(status_code=400, detail="Falta el archivo de audio (campo 'audio')")
+            if subido.size is not None and subido.size > LIMITE_BYTES:
+                raise AudioDemasiadoGrande()
+            archivo = subido.file
+            nombre_archivo = nombre_audio(subido.filename, subido.content_type)
+        else:
+            archivo, _ = await acumular_audio(request.stream())
+            nombre_archivo = nombre_audio(nombre, tipo)
+
+        lector = abrir_wav(archivo) if segmentar else None
+        if lector is not None and lector.getnframes() < TRANSCRIPCION_MIN_SEGMENTAR_S * lector.getframerate():
+            # Audio corto: una sola llamada es más rápida
+            lector = None
+            archivo.seek(0)
+
+        if stream:
+            # El generador cierra el archivo al terminar
+            entregado = True
+            return respuesta_sse(eventos_transcripcion(lector, nombre_archivo, archivo, liberar))
+        if lector is not None:
+            return await transcribir_wav_por_segmentos(lector)
+        return await transcribir_archivo(nombre_archivo, archivo)
+
+    except AudioDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except HTTPException:
+        raise
+    except ProveedorNoDisponible as e:
+        print(f"Proveedor no disponible en transcripción: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"Error en transcripción: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not entregado:
+            await liberar()
+
+async def convertir_moneda(cantidad, de, a="mxn"):
     """Convierte entre criptomonedas y monedas fiat"""
-    cripto_ids = {
-        'btc': 'bitcoin',
-        'bitcoin': 'bitcoin',
-        'eth': 'ethereum',
-        'ethereum': 'ethereum',
-        'usdt': 'tether',
-        'tether': 'tether',
-        'usdc': 'usd-coin',
-        'sol': 'solana',
-        'solana': 'solana',
-        'matic': 'matic-network',
-        'polygon': 'matic-network'
-    }
-    
-    de_id = cripto_ids.get(de.lower(), de.lower())
-    precio = obtener_precio_actual(de_id, a.lower())
+    de_id = CRIPTO_IDS.get(de.lower(), de.lower())
+    precio = await obtener_precio_actual(de_id, a.lower())
     
     if precio and a.lower() in precio:
         return cantidad * precio[a.lower()]
     return None
 
-@app.post("/transaction-chat")
-async def transaction_chat(request: ChatRequest):
-    """Endpoint para el chatbot de transacciones"""
-    try:
-        messages = request.messages
-        
-        # Si es el primer mensaje, enviar saludo
-        if request.isFirstMessage or len(messages) == 0:
-            return {
-                "response": "¡Hola! Soy tu asistente de transacciones. Puedo ayudarte a enviar dinero, registrar contactos y pagar servicios. ¿Qué necesitas hacer hoy?",
-                "intencion": None
-            }
-        
-        # Obtener el último mensaje del usuario
-        last_user_message = None
-        for msg in reversed(messages):
-            if msg.get('role') == 'user':
-                last_user_message = msg.get('content', '')
-                break
-        
-        if not last_user_message:
-            raise HTTPException(status_code=400, detail="No se encontró mensaje del usuario")
-        
-        # Clasificar intención para transacciones
-        tipo_intencion = clasificar_intencion_transacciones(last_user_message)
-        
-        # System prompt específico para transacciones
-        transaction_system_prompt = """Eres un asistente experto en transferencias de criptomonedas. Tu misión es hacer que las transacciones sean simples, seguras y sin fricción para el usuario.
+# System prompt específico para transacciones
+TRANSACTION_SYSTEM_PROMPT = """Eres un asistente experto en transferencias de criptomonedas. Tu misión es hacer que las transacciones sean simples, seguras y sin fricción para el usuario.
 
 PRINCIPIOS CLAVE:
 1. **Simplicidad**: Usa lenguaje claro, evita tecnicismos innecesarios
@@ -408,76 +803,102 @@ Para PAGO SERVICIO:
 ###ACTION_JSON###
 
 Responde siempre en español de manera amigable y profesional."""
+
+registro_prompts.registrar("transacciones", lambda: TRANSACTION_SYSTEM_PROMPT)
+
+@app.post("/transaction-chat")
+async def transaction_chat(request: ChatRequest, response: Response):
+    """Endpoint para el chatbot de transacciones"""
+    crono = Cronometro("transacciones")
+    cabeceras = {}
+    try:
+        messages = request.messages
+        
+        # Si es el primer mensaje, enviar saludo
+        if request.isFirstMessage or len(messages) == 0:
+            saludo = {
+                "response": "¡Hola! Soy tu asistente de transacciones. Puedo ayudarte a enviar dinero, registrar contactos y pagar servicios. ¿Qué necesitas hacer hoy?",
+                "intencion": None
+            }
+            return respuesta_sse(transmitir_fijo(saludo)) if request.stream else saludo
+        
+        # Obtener el último mensaje del usuario
+        last_user_message = None
+        for msg in reversed(messages):
+            if msg.get('role') == 'user':
+                last_user_message = msg.get('content', '')
+                break
+        
+        if not last_user_message:
+            raise HTTPException(status_code=400, detail="No se encontró mensaje del usuario")
+        
+        # Clasificar intención para transacciones mientras se consulta el mercado en paralelo
+        # y se compacta el historial
+        prefetch = iniciar_prefetch_mercado(crono, construir_contexto_mercado_transacciones)
+        tipo_intencion, (historial, info_historial) = await asyncio.gather(
+            crono.medir("clasificacion", clasificar_intencion_transacciones(last_user_message)),
+            crono.medir("historial", gestor_historial.compactar("transacciones", historial_chat(messages))),
+        )
+        cabeceras["X-Historial-Tokens"] = cabecera_tokens(info_historial)
+        mensaje_contexto = await resolver_prefetch_mercado(prefetch, tipo_intencion)
+        
         
         # Construir mensajes para la IA
-        ai_messages = [{"role": "system", "content": transaction_system_prompt}]
+        ai_messages = [{"role": "system", "content": registro_prompts.obtener("transacciones").texto}]
         
         # Agregar contexto de mercado si es necesario
-        if tipo_intencion == "MERCADO":
-            btc = obtener_precio_actual("bitcoin", "usd")
-            eth = obtener_precio_actual("ethereum", "usd")
-            usdt = obtener_precio_actual("tether", "usd")
-            mxn_btc = obtener_precio_actual("bitcoin", "mxn")
-            mxn_eth = obtener_precio_actual("ethereum", "mxn")
-            
-            mensaje_contexto = "Precios de mercado actuales:\n"
-            if btc:
-                mensaje_contexto += f"- Bitcoin (BTC): ${btc.get('usd', 'N/A'):.2f} USD"
-                if mxn_btc and 'mxn' in mxn_btc:
-                    mensaje_contexto += f" | ${mxn_btc['mxn']:.2f} MXN"
-                mensaje_contexto += f" | Cambio 24h: {btc.get('usd_24h_change', 0):.2f}%\n"
-            if eth:
-                mensaje_contexto += f"- Ethereum (ETH): ${eth.get('usd', 'N/A'):.2f} USD"
-                if mxn_eth and 'mxn' in mxn_eth:
-                    mensaje_contexto += f" | ${mxn_eth['mxn']:.2f} MXN"
-                mensaje_contexto += f" | Cambio 24h: {eth.get('usd_24h_change', 0):.2f}%\n"
-            if usdt:
-                mensaje_contexto += f"- Tether (USDT): ${usdt.get('usd', 'N/A'):.4f} USD (stablecoin)\n"
-            mensaje_contexto += "\nTasas de cambio aprox: 1 USD = 20 MXN"
-            
+        if mensaje_contexto:
             ai_messages.append({"role": "system", "content": mensaje_contexto})
         
-        # Agregar historial de mensajes
-        for msg in messages:
-            if msg.get('role') in ['user', 'assistant']:
-                ai_messages.append({
-                    "role": msg['role'],
-                    "content": msg['content']
-                })
+        # Agregar historial compactado
+        ai_messages.extend(historial)
+        
+        # Las intenciones con acción nunca usan la caché de respuestas
+        clave_cache = None
+        if tipo_intencion in INTENCIONES_CON_ACCION:
+            cache_respuestas.omitir()
+            cabeceras["X-Cache-Respuesta"] = "BYPASS"
+        else:
+            clave_cache = clave_respuesta("transacciones", router.ruta("transacciones.respuesta").modelos, ai_messages)
+            guardada = buscar_respuesta(clave_cache, cabeceras)
+            if guardada is not None:
+                return respuesta_sse(transmitir_fijo(guardada), crono, cabeceras) if request.stream else guardada
+        
+        # Modo streaming: los tokens salen conforme llegan y la acción va en el evento final
+        if request.stream:
+            return respuesta_sse(transmitir(
+                router.completar_stream("transacciones.respuesta", ai_messages),
+                lambda visible, acciones: guardar_respuesta(
+                    clave_cache, respuesta_transacciones(visible, tipo_intencion, acciones), acciones
+                ),
+                ExtractorAcciones.acciones(),
+            ), crono, cabeceras)
         
         # Llamar a la IA
-        response = client.chat.completions.create(
-            model=MODELO_CHAT,
-            messages=ai_messages
-        )
+        completion = await crono.medir("completion", router.completar("transacciones.respuesta", ai_messages))
         
-        ai_response = response.choices[0].message.content
+        ai_response = completion.choices[0].message.content
         
-        # Detectar si hay una acción en la respuesta
-        action_json = None
-        if "###ACTION_JSON###" in ai_response:
-            try:
-                parts = ai_response.split("###ACTION_JSON###")
-                if len(parts) >= 3:
-                    json_str = parts[1].strip()
-                    action_json = json.loads(json_str)
-                    # Remover el JSON de la respuesta visible
-                    ai_response = parts[0].strip() + (parts[2].strip() if len(parts) > 2 else "")
-            except Exception as e:
-                print(f"Error parseando action JSON: {e}")
+        # Separar las acciones (validadas) del texto visible
+        with crono.etapa("extraccion"):
+            ai_response, acciones = ExtractorAcciones.acciones().extraer(ai_response)
         
-        return {
-            "response": ai_response,
-            "intencion": tipo_intencion,
-            "action": action_json
-        }
+        return guardar_respuesta(
+            clave_cache, respuesta_transacciones(ai_response, tipo_intencion, acciones), acciones
+        )
     
+    except ProveedorNoDisponible as e:
+        print(f"Proveedor no disponible en transaction-chat: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Error en transaction-chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        response.headers.update(cabeceras)
+        response.headers["Server-Timing"] = crono.server_timing()
 
-def clasificar_intencion_transacciones(user_input):
-    """Clasificador de intenciones específico para transacciones"""
+async def clasificar_intencion_transacciones_llm(user_input):
+    """Clasificador de intenciones específico para transacciones (nivel LLM)"""
     prompt_clasificador = [
         {
             "role": "system",
@@ -498,27 +919,112 @@ def clasificar_intencion_transacciones(user_input):
         }
     ]
     
-    try:
-        response = client.chat.completions.create(
-            model=MODELO_CHAT,
-            messages=prompt_clasificador
-        )
-        categoria = response.choices[0].message.content.strip().upper()
-        
-        if "TRANSFERENCIA" in categoria:
-            return "TRANSFERENCIA"
-        elif "REGISTRO" in categoria or "CONTACTO" in categoria:
-            return "REGISTRO_CONTACTO"
-        elif "PAGO" in categoria or "SERVICIO" in categoria:
-            return "PAGO_SERVICIO"
-        elif "MERCADO" in categoria:
-            return "MERCADO"
-        else:
-            return "CONSULTA"
-    except Exception as e:
-        print(f"Error clasificando intención: {e}")
+    response = await router.completar("transacciones.clasificacion", prompt_clasificador)
+    categoria = response.choices[0].message.content.strip().upper()
+    
+    if "TRANSFERENCIA" in categoria:
+        return "TRANSFERENCIA"
+    elif "REGISTRO" in categoria or "CONTACTO" in categoria:
+        return "REGISTRO_CONTACTO"
+    elif "PAGO" in categoria or "SERVICIO" in categoria:
+        return "PAGO_SERVICIO"
+    elif "MERCADO" in categoria:
+        return "MERCADO"
+    else:
         return "CONSULTA"
 
+clasificador_transacciones = ClasificadorEscalonado(
+    "transacciones", REGLAS_TRANSACCIONES, clasificar_intencion_transacciones_llm, "CONSULTA",
+    compartido=almacen_compartido,
+)
+
+async def clasificar_intencion_transacciones(user_input):
+    """Clasificador de intenciones específico para transacciones"""
+    return await clasificador_transacciones.clasificar(user_input)
+
+@app.get("/health")
+async def health():
+    """Liveness: el proceso responde"""
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness: 503 hasta que el worker calentó prompts e índices"""
+    if not estado_servicio["listo"]:
+        response.status_code = 503
+    return {**estado_servicio, "almacen_compartido": bool(almacen_compartido)}
+
+@app.get("/clasificacion/estadisticas")
+async def estadisticas_clasificacion():
+    """Aciertos por nivel (caché, reglas locales, LLM) de cada clasificador"""
+    return {
+        clasificador.nombre: clasificador.estadisticas()
+        for clasificador in (clasificador_chat, clasificador_transacciones)
+    }
+
+@app.get("/llm/estadisticas")
+async def estadisticas_llm():
+    """Completions ejecutadas, compartidas entre peticiones idénticas y en vuelo"""
+    return llm.vuelos.estadisticas()
+
+@app.get("/modelos/estadisticas")
+async def estadisticas_modelos():
+    """Rutas configuradas y latencia, tokens y costo por modelo"""
+    return router.estadisticas()
+
+@app.get("/resiliencia/estadisticas")
+async def estadisticas_resiliencia():
+    """Estado de los disyuntores, reintentos y coberturas por proveedor"""
+    return {**llm.estadisticas_resiliencia(), "coingecko": precios.resiliencia.estadisticas()}
+
+# Contadores que ya llevan los componentes, leídos al exponer /metrics
+REGISTRO.funcion(
+    "cache_respuestas_total", "Consultas a la caché de respuestas por resultado",
+    lambda: dict(cache_respuestas.conteos), ("resultado",), tipo="counter",
+)
+REGISTRO.funcion(
+    "clasificacion_total", "Clasificaciones por clasificador y nivel que resolvió",
+    lambda: {
+        (clasificador.nombre, nivel): n
+        for clasificador in (clasificador_chat, clasificador_transacciones)
+        for nivel, n in clasificador.aciertos.items()
+    },
+    ("clasificador", "nivel"), tipo="counter",
+)
+REGISTRO.funcion(
+    "vuelos_total", "Llamadas ejecutadas, compartidas y canceladas por grupo de single-flight",
+    lambda: {
+        (grupo.nombre, resultado): n
+        for grupo in (llm.vuelos, clasificador_chat.vuelos, clasificador_transacciones.vuelos)
+        for resultado, n in grupo.conteos.items()
+    },
+    ("grupo", "resultado"), tipo="counter",
+)
+REGISTRO.funcion(
+    "historial_tokens_ahorrados_total", "Tokens de historial que no se enviaron al modelo",
+    lambda: {(): gestor_historial.estadisticas["tokens_ahorrados"]}, tipo="counter",
+)
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(REGISTRO.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/mercado/estadisticas")
+async def estadisticas_mercado():
+    """Snapshot de mercado vigente (versión, tipo de cambio) y cuántas peticiones lo reutilizaron"""
+    return mercado.estadisticas()
+
+@app.get("/cache/estadisticas")
+async def estadisticas_cache():
+    """Aciertos (memoria/disco), fallos y omisiones de la caché de respuestas"""
+    return cache_respuestas.estadisticas()
+
+@app.get("/historial/estadisticas")
+async def estadisticas_historial():
+    """Peticiones compactadas, tokens ahorrados y resúmenes calculados o reutilizados"""
+    return gestor_historial.estadisticas
+
 # Base de conocimientos para RAG educativo
 FINANCIAL_KNOWLEDGE_BASE = """
 # Base de Conocimientos Financieros
@@ -607,62 +1113,90 @@ En tu caso, podrías comenzar identificando tus 3 gastos más frecuentes. Si red
 ¿Te gustaría que analicemos alguna categoría específica de gastos?"
 """
 
+registro_prompts.registrar("educacion", lambda: EDUCATION_SYSTEM_PROMPT)
+
+@lru_cache(maxsize=128)
+def _prompt_educativo(version, relevant_knowledge):
+    prefijo = registro_prompts.obtener("educacion").texto
+    return f"{prefijo}\n\n# CONOCIMIENTO RELEVANTE\n{relevant_knowledge}"
+
+def prompt_educativo(relevant_knowledge: str) -> str:
+    """Prompt educativo con prefijo fijo; se memoriza por versión y fragmento RAG"""
+    return _prompt_educativo(registro_prompts.obtener("educacion").version, relevant_knowledge)
+
+# Índices BM25 y vectorial sobre la base de conocimientos y los JSON educativos de public/
+DIRECTORIO_PUBLIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "public")
+indice_conocimiento = IndiceConocimiento(FINANCIAL_KNOWLEDGE_BASE, [
+    os.path.join(DIRECTORIO_PUBLIC, "bloky-educacion-financiera.json"),
+    os.path.join(DIRECTORIO_PUBLIC, "conocimiento-de-transacciones.json"),
+])
+
+SIN_CONOCIMIENTO = "Sin fragmentos específicos para esta consulta; responde con principios financieros generales."
+
 def extract_relevant_knowledge(query: str) -> str:
-    """Extrae conocimiento relevante de la base de datos usando RAG simple"""
-    query_lower = query.lower()
-    sections = FINANCIAL_KNOWLEDGE_BASE.split('\n## ')
+    """Extrae las secciones más relevantes (BM25 + vectores) dentro del presupuesto de tokens"""
+    return indice_conocimiento.contexto(query) or SIN_CONOCIMIENTO
+
+async def preparar_educacion(message, history, crono):
+    """Mensajes con contexto RAG, clave de caché y cabeceras de un turno de /education-chat"""
+    # RAG: Extraer conocimiento relevante
+    with crono.etapa("conocimiento"):
+        relevant_knowledge = extract_relevant_knowledge(message)
+    print("🔍 Conocimiento relevante extraído")
     
-    relevant_sections = [
-        section for section in sections
-        if any(keyword in section.lower() for keyword in [
-            'ahorro' if 'ahorro' in query_lower else '',
-            'gasto' if 'gasto' in query_lower else '',
-            'inversión' if 'inversión' in query_lower else '',
-            'deuda' if 'deuda' in query_lower else '',
-            'presupuesto' if 'presupuesto' in query_lower else '',
-            'crypto' if 'crypto' in query_lower else ''
-        ]) if any(keyword in section.lower() for keyword in ['ahorro', 'gasto', 'inversión', 'deuda', 'presupuesto', 'crypto'])
+    # Construir mensajes con contexto RAG
+    messages = [
+        {
+            "role": "system",
+            "content": prompt_educativo(relevant_knowledge)
+        }
     ]
+    history, info_historial = await crono.medir("historial", gestor_historial.compactar("educacion", history))
+    cabeceras = {"X-Historial-Tokens": cabecera_tokens(info_historial)}
+    messages.extend(history)
+    messages.append({"role": "user", "content": message})
+    clave_cache = clave_respuesta("educacion", router.ruta("educacion.respuesta").modelos, messages, temperature=0.7)
+    return messages, clave_cache, cabeceras
+
+async def completar_educacion(messages, clave_cache, crono):
+    """Respuesta educativa sin streaming, guardada en la caché"""
+    print("🤖 Llamando a OpenAI API con contexto educativo...")
     
-    return '## ' + '\n## '.join(relevant_sections) if relevant_sections else FINANCIAL_KNOWLEDGE_BASE
+    # Llamar a la API de OpenAI
+    completion = await crono.medir("completion", router.completar("educacion.respuesta", messages, temperature=0.7))
+    
+    assistant_message = completion.choices[0].message.content
+    print("✅ Respuesta educativa generada")
+    
+    return guardar_respuesta(clave_cache, {"response": assistant_message}, [])
 
 @app.post("/education-chat")
-async def education_chat_endpoint(request: dict):
+async def education_chat_endpoint(request: dict, response: Response):
     """Endpoint para chat educativo con RAG"""
+    crono = Cronometro("educacion")
     try:
         message = request.get("message", "")
         history = request.get("history", [])
         
         print(f"📚 Procesando consulta educativa: {message}")
         
-        # RAG: Extraer conocimiento relevante
-        relevant_knowledge = extract_relevant_knowledge(message)
-        print("🔍 Conocimiento relevante extraído")
+        messages, clave_cache, cabeceras = await preparar_educacion(message, history, crono)
         
-        # Construir mensajes con contexto RAG
-        messages = [
-            {
-                "role": "system",
-                "content": f"{EDUCATION_SYSTEM_PROMPT}\n\n# CONOCIMIENTO RELEVANTE\n{relevant_knowledge}"
-            }
-        ]
-        messages.extend(history)
-        messages.append({"role": "user", "content": message})
-        
-        print("🤖 Llamando a OpenAI API con contexto educativo...")
-        
-        # Llamar a la API de OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=800
-        )
+        # Preguntas repetidas con el mismo historial reutilizan la respuesta guardada
+        guardada = buscar_respuesta(clave_cache, cabeceras)
+        response.headers.update(cabeceras)
+        if guardada is not None:
+            print("⚡ Respuesta educativa desde caché")
+            return respuesta_sse(transmitir_fijo(guardada), crono, cabeceras) if request.get("stream") else guardada
         
-        assistant_message = response.choices[0].message.content
-        print("✅ Respuesta educativa generada")
+        if request.get("stream"):
+            print("🤖 Llamando a OpenAI API con contexto educativo (streaming)...")
+            return respuesta_sse(transmitir(
+                router.completar_stream("educacion.respuesta", messages, temperature=0.7),
+                lambda visible, _: guardar_respuesta(clave_cache, {"response": visible}, []),
+            ), crono, cabeceras)
         
-        return {"response": assistant_message}
+        return await completar_educacion(messages, clave_cache, crono)
         
     except Exception as e:
         print(f"❌ Error en education-chat: {str(e)}")
@@ -670,7 +1204,84 @@ async def education_chat_endpoint(request: dict):
             "error": str(e),
             "response": "Disculpa, hubo un error procesando tu consulta. Por favor intenta de nuevo."
         }
+    finally:
+        response.headers["Server-Timing"] = crono.server_timing()
+
+class ElementoLote(BaseModel):
+    id: Optional[str] = None
+    endpoint: Literal["chat", "educacion"] = "chat"
+    # chat
+    messages: list = []
+    userId: Optional[str] = None
+    # educacion
+    message: str = ""
+    history: list = []
+
+class LoteRequest(BaseModel):
+    items: list[ElementoLote]
+    concurrencia: Optional[int] = None
+
+async def procesar_elemento_lote(elemento, compartidos):
+    """Un elemento de /batch: el mismo flujo que /chat o /education-chat, sin streaming"""
+    crono = Cronometro("lote")
+    if elemento.endpoint == "educacion":
+        if not elemento.message:
+            raise ValueError("Falta message")
+        messages, clave_cache, cabeceras = await preparar_educacion(elemento.message, elemento.history, crono)
+        guardada = buscar_respuesta(clave_cache, cabeceras)
+        return guardada if guardada is not None else await completar_educacion(messages, clave_cache, crono)
+
+    # Un solo snapshot de mercado por lote y una clasificación por mensaje distinto
+    def clasificar(texto):
+        return compartidos.obtener(("clasificacion", normalizar(texto)), lambda: clasificar_intencion(texto))
+
+    cabeceras = {}
+    ai_messages, clave_cache = await preparar_chat(
+        elemento.messages, elemento.userId, crono, cabeceras, clasificar=clasificar,
+        contexto_mercado=lambda: compartidos.obtener("mercado", construir_contexto_mercado),
+    )
+    guardada = buscar_respuesta(clave_cache, cabeceras)
+    return guardada if guardada is not None else await completar_chat(ai_messages, clave_cache, crono)
+
+@app.post("/batch")
+async def batch(request: LoteRequest):
+    """Muchas conversaciones de /chat o /education-chat; cada resultado sale en NDJSON al terminar"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    if len(request.items) > LOTE_MAX_ELEMENTOS:
+        raise HTTPException(status_code=413, detail=f"Máximo {LOTE_MAX_ELEMENTOS} elementos por lote")
+    concurrencia = max(1, min(request.concurrencia or LOTE_CONCURRENCIA, LOTE_CONCURRENCIA))
+    compartidos = Compartidos()
+
+    async def lineas():
+        try:
+            async for linea in ejecutar_lote(
+                request.items,
+                lambda elemento: procesar_elemento_lote(elemento, compartidos),
+                concurrencia,
+                resumen=lambda: {"concurrencia": concurrencia, "compartidos": dict(compartidos.reutilizados)},
+            ):
+                yield linea
+        finally:
+            compartidos.cancelar()
+
+    return StreamingResponse(lineas(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Hasta aquí, sin I/O: solo definiciones y objetos que se construyen en su primer uso
+estado_servicio["arranque_ms"]["importacion"] = round((time.perf_counter() - _inicio_importacion) * 1000, 1)
 
 if __name__ == "__main__":
+    import tempfile
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        # Cada worker importa su propia copia de la app: lo que deba verse entre
+        # workers va al almacén compartido y los usuarios a SQLite. Los workers
+        # heredan estas variables.
+        os.environ.setdefault("CACHE_COMPARTIDA", os.path.join(tempfile.gettempdir(), "blocky_compartido.db"))
+        os.environ.setdefault("USUARIOS_BACKEND", "sqlite")
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,137 @@
+"""Snapshot de mercado versionado para los prompts.
+
+Todas las criptos seguidas, en USD y MXN y con su cambio 24h, salen de una
+sola consulta a `ServicioPrecios`. El tipo de cambio USD/MXN se deriva de
+esos mismos precios (mediana de mxn/usd entre los activos) en lugar de un
+valor fijo, así que nunca contradice a los precios que lo acompañan.
+
+Un snapshot vale `MERCADO_VENTANA_S` segundos: todas las peticiones de la
+ventana comparten el mismo objeto, y cada fragmento de prompt (uno por
+formato: chat, transacciones) se renderiza una sola vez por versión. Con el
+mismo texto en el prompt, la clave de la caché de respuestas también
+coincide. Las peticiones que llegan mientras se arma el siguiente esperan
+esa misma construcción.
+
+La versión es un hash de los datos: si los precios no cambiaron se
+conserva el snapshot anterior con sus fragmentos ya renderizados, y dos
+workers con los mismos precios producen la misma versión. La antigüedad de
+un precio obsoleto entra al hash (y al prompt) en minutos enteros, no en
+segundos: si no, cada construcción con precios viejos sería otra versión.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import statistics
+import time
+
+from vuelos import consumir_excepcion
+
+MERCADO_VENTANA_S = float(os.getenv("MERCADO_VENTANA_S", "15"))
+
+
+def minutos_antiguedad(segundos):
+    """Antigüedad en minutos enteros: la misma durante todo el minuto"""
+    return int(segundos // 60)
+
+
+def datos_canonicos(precios):
+    """Precios con `antiguedad_s` cambiada por minutos enteros, para el hash de versión"""
+    canonicos = {}
+    for activo, valor in precios.items():
+        valor = dict(valor)
+        if "antiguedad_s" in valor:
+            valor["antiguedad_min"] = minutos_antiguedad(valor.pop("antiguedad_s"))
+        canonicos[activo] = valor
+    return canonicos
+
+
+def derivar_usd_mxn(precios):
+    """Tipo de cambio implícito en los precios: mediana de mxn/usd entre los activos"""
+    tasas = [p["mxn"] / p["usd"] for p in precios.values() if p.get("usd") and p.get("mxn")]
+    return statistics.median(tasas) if tasas else None
+
+
+class SnapshotMercado:
+    def __init__(self, precios, renderizadores):
+        self.precios = precios
+        self.usd_mxn = derivar_usd_mxn(precios)
+        canonico = json.dumps(datos_canonicos(precios), sort_keys=True, separators=(",", ":"))
+        self.version = hashlib.sha256(canonico.encode("utf-8")).hexdigest()[:12]
+        self.creado_en = time.monotonic()
+        self._renderizadores = renderizadores
+        self._fragmentos = {}
+
+    def fragmento(self, formato):
+        """Texto para el prompt en el formato indicado, renderizado una vez por versión"""
+        texto = self._fragmentos.get(formato)
+        if texto is None:
+            texto = self._fragmentos[formato] = self._renderizadores[formato](self)
+        return texto
+
+    def antiguedad_obsoletos(self):
+        """Minutos enteros del precio más viejo servido como obsoleto, o None si todos están al día"""
+        antiguedades = [p["antiguedad_s"] for p in self.precios.values() if p.get("obsoleto")]
+        return minutos_antiguedad(max(antiguedades)) if antiguedades else None
+
+    def resumen(self):
+        return {
+            "version": self.version,
+            "edad_s": round(time.monotonic() - self.creado_en, 1),
+            "usd_mxn": round(self.usd_mxn, 4) if self.usd_mxn else None,
+            "activos": sorted(self.precios),
+            "fragmentos": sorted(self._fragmentos),
+        }
+
+
+class GestorMercado:
+    def __init__(self, precios, activos, renderizadores, monedas=("usd", "mxn"),
+                 ventana=MERCADO_VENTANA_S):
+        self.precios = precios
+        self.activos = sorted(activos)
+        self.monedas = list(monedas)
+        self.renderizadores = renderizadores
+        self.ventana = ventana
+        self._actual = None
+        self._vigente_desde = 0.0
+        self._construyendo = None
+        self.conteos = {"reutilizado": 0, "construido": 0, "sin_cambios": 0}
+
+    async def _construir(self):
+        data = await self.precios.obtener(self.activos, self.monedas)
+        nuevo = SnapshotMercado(data, self.renderizadores)
+        if self._actual is not None and self._actual.version == nuevo.version:
+            # Mismos precios: se conservan el objeto y sus fragmentos renderizados
+            self.conteos["sin_cambios"] += 1
+            nuevo = self._actual
+        else:
+            self.conteos["construido"] += 1
+        if data:
+            # Sin ningún precio no se fija la ventana: la siguiente petición vuelve a intentar
+            self._actual = nuevo
+            self._vigente_desde = time.monotonic()
+        return nuevo
+
+    def _terminar(self, tarea):
+        self._construyendo = None
+        consumir_excepcion(tarea)
+
+    async def snapshot(self):
+        """Snapshot vigente; si venció la ventana, uno nuevo compartido por quienes lo piden a la vez"""
+        if self._actual is not None and time.monotonic() - self._vigente_desde < self.ventana:
+            self.conteos["reutilizado"] += 1
+            return self._actual
+        if self._construyendo is None:
+            self._construyendo = asyncio.ensure_future(self._construir())
+            self._construyendo.add_done_callback(self._terminar)
+        else:
+            self.conteos["reutilizado"] += 1
+        # shield: si esta petición se cancela (prefetch descartado), la construcción sigue para las demás
+        return await asyncio.shield(self._construyendo)
+
+    def estadisticas(self):
+        return {
+            **self.conteos,
+            "ventana_s": self.ventana,
+            "actual": self._actual.resumen() if self._actual else None,
+        }
@@ -0,0 +1,202 @@
+"""Métricas en formato de texto de Prometheus y traza por petición.
+
+Sin dependencias: contadores e histogramas en memoria del proceso, más
+medidores que se calculan al momento de exponer (a partir de las
+estadísticas que ya llevan la caché, los clasificadores, etc.). Registrar
+un valor es un incremento en un dict, así que se puede dejar activo en
+producción.
+
+`MiddlewareMetricas` asigna a cada petición un id de traza (respeta
+`X-Trace-Id` si llega uno), lo devuelve en la cabecera de la respuesta,
+mide duración y estado por endpoint y, si la petición pasa de
+`METRICAS_LENTA_MS`, imprime sus etapas con el id de traza.
+"""
+import bisect
+import contextvars
+import os
+import time
+import uuid
+
+METRICAS_LENTA_MS = float(os.getenv("METRICAS_LENTA_MS", "5000"))
+PREFIJO = "blocky_"
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Traza de la petición en curso: {"id": ..., "etapas": {...}} o None fuera de una petición
+_traza = contextvars.ContextVar("traza", default=None)
+
+
+def traza_actual():
+    return _traza.get()
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=""):
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = PREFIJO + nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.valores = {}
+
+    def inc(self, *valores, cantidad=1):
+        self.valores[valores] = self.valores.get(valores, 0) + cantidad
+
+    def muestras(self):
+        for valores, total in self.valores.items():
+            yield self.nombre + _etiquetas(self.etiquetas, valores), total
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        self.nombre = PREFIJO + nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.limites = tuple(limites)
+        # valores de etiquetas -> [conteos por cubeta (no acumulados), suma, total]
+        self.series = {}
+
+    def observar(self, valor, *valores):
+        serie = self.series.get(valores)
+        if serie is None:
+            serie = self.series[valores] = [[0] * (len(self.limites) + 1), 0.0, 0]
+        serie[0][bisect.bisect_left(self.limites, valor)] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def muestras(self):
+        for valores, (cubetas, suma, total) in self.series.items():
+            acumulado = 0
+            for limite, conteo in zip(self.limites + (float("inf"),), cubetas):
+                acumulado += conteo
+                le = f'le="{_numero(limite)}"'
+                yield self.nombre + "_bucket" + _etiquetas(self.etiquetas, valores, le), acumulado
+            yield self.nombre + "_sum" + _etiquetas(self.etiquetas, valores), suma
+            yield self.nombre + "_count" + _etiquetas(self.etiquetas, valores), total
+
+
+class Funcion:
+    """Medidor (o contador) cuyo valor se lee al exponer: `funcion()` -> {valores_etiquetas: valor}"""
+
+    def __init__(self, nombre, ayuda, funcion, etiquetas=(), tipo="gauge"):
+        self.nombre = PREFIJO + nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.etiquetas = tuple(etiquetas)
+        self.tipo = tipo
+
+    def muestras(self):
+        try:
+            valores = self.funcion()
+        except Exception as e:
+            print(f"Error leyendo la métrica {self.nombre}: {e}")
+            return
+        for etiquetas, valor in valores.items():
+            if not isinstance(etiquetas, tuple):
+                etiquetas = (etiquetas,)
+            yield self.nombre + _etiquetas(self.etiquetas, etiquetas), valor
+
+
+class Registro:
+    def __init__(self):
+        self.metricas = {}
+
+    def _agregar(self, metrica):
+        # Los módulos se pueden recargar (ej. en benchmarks): la última definición gana
+        self.metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._agregar(Contador(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def funcion(self, nombre, ayuda, funcion, etiquetas=(), tipo="gauge"):
+        return self._agregar(Funcion(nombre, ayuda, funcion, etiquetas, tipo))
+
+    def exponer(self):
+        lineas = []
+        for metrica in self.metricas.values():
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(f"{serie} {_numero(valor)}" for serie, valor in metrica.muestras())
+        return "\n".join(lineas) + "\n"
+
+
+REGISTRO = Registro()
+
+PETICIONES = REGISTRO.contador("http_peticiones_total", "Peticiones HTTP por endpoint y estado",
+                               ("endpoint", "metodo", "estado"))
+DURACION_PETICION = REGISTRO.histograma("http_duracion_segundos",
+                                        "Duración de las peticiones HTTP (hasta el último byte)",
+                                        ("endpoint", "metodo"))
+ETAPAS = REGISTRO.histograma("etapa_duracion_segundos", "Duración de cada etapa de una petición",
+                             ("endpoint", "etapa"))
+_en_curso = {"total": 0}
+REGISTRO.funcion("http_en_curso", "Peticiones HTTP en curso", lambda: {(): _en_curso["total"]})
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI: id de traza, duración y estado por endpoint"""
+
+    def __init__(self, app, lenta_ms=METRICAS_LENTA_MS):
+        self.app = app
+        self.lenta_ms = lenta_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        id_traza = None
+        for nombre, valor in scope["headers"]:
+            if nombre == b"x-trace-id":
+                id_traza = valor.decode("latin-1")[:64]
+                break
+        traza = {"id": id_traza or uuid.uuid4().hex[:16], "etapas": {}}
+        token = _traza.set(traza)
+        inicio = time.perf_counter()
+        estado = [500]
+        _en_curso["total"] += 1
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [
+                    (b"x-trace-id", traza["id"].encode("latin-1"))
+                ]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _en_curso["total"] -= 1
+            _traza.reset(token)
+            segundos = time.perf_counter() - inicio
+            # Plantilla de la ruta (/usuarios/{user_id}), no la URL: cardinalidad acotada
+            ruta = scope.get("route")
+            endpoint = getattr(ruta, "path", None) or "sin_ruta"
+            PETICIONES.inc(endpoint, scope["method"], str(estado[0]))
+            DURACION_PETICION.observar(segundos, endpoint, scope["method"])
+            if segundos * 1000 > self.lenta_ms:
+                etapas = ", ".join(f"{n}={ms:.0f}ms" for n, ms in traza["etapas"].items())
+                print(f"🐢 [{traza['id']}] {scope['method']} {endpoint} {estado[0]} "
+                      f"en {segundos * 1000:.0f} ms ({etapas or 'sin etapas'})")
@@ -0,0 +1,222 @@
+"""Enrutamiento de modelos por endpoint y etapa.
+
+Cada llamada al modelo se hace por una ruta (`chat.respuesta`,
+`chat.clasificacion`, `historial.resumen`...) que define una cadena de
+modelos y un tope de `max_tokens`. Si un modelo falla por disponibilidad
+(circuito abierto, plazo, timeout, 429/5xx o modelo inexistente) se prueba
+el siguiente de la cadena; en streaming solo antes del primer fragmento.
+
+Las rutas se ajustan sin tocar código con variables de entorno:
+
+    MODELO_CHAT_CLASIFICACION="gpt-4o-mini,gemini-2.5-pro"   # cadena de respaldo
+    MAX_TOKENS_CHAT_RESPUESTA=1500                          # 0 = sin tope
+
+Por modelo se acumulan llamadas, errores, respaldos, latencia, tokens y
+costo estimado (`MODELOS_PRECIOS`, USD por millón de tokens de entrada y
+salida), y se guardan las últimas llamadas con su ruta.
+"""
+import json
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from conocimiento import estimar_tokens
+from metricas import REGISTRO
+from resiliencia import ProveedorNoDisponible, es_transitorio
+
+# ruta -> (cadena de modelos, max_tokens)
+RUTAS_DEFECTO = {
+    "chat.clasificacion": (["gpt-4o-mini"], 10),
+    "chat.respuesta": (["gemini-2.5-pro", "gpt-4o-mini"], None),
+    "transacciones.clasificacion": (["gpt-4o-mini"], 10),
+    "transacciones.respuesta": (["gemini-2.5-pro", "gpt-4o-mini"], None),
+    "educacion.respuesta": (["gpt-4o-mini", "gemini-2.5-pro"], 800),
+    "historial.resumen": (["gpt-4o-mini"], 300),
+}
+
+# USD por millón de tokens (entrada, salida)
+PRECIOS_DEFECTO = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gemini-2.5-pro": (1.25, 10.0),
+}
+MODELOS_PRECIOS = {
+    **PRECIOS_DEFECTO,
+    **{modelo: tuple(precio) for modelo, precio in json.loads(os.getenv("MODELOS_PRECIOS", "{}")).items()},
+}
+
+TOKENS = REGISTRO.contador("llm_tokens_total", "Tokens por ruta, modelo y tipo (entrada, salida)",
+                           ("ruta", "modelo", "tipo"))
+COSTO = REGISTRO.contador("llm_costo_usd_total", "Costo estimado en USD por ruta y modelo", ("ruta", "modelo"))
+LLAMADAS_MODELO = REGISTRO.contador("llm_llamadas_total", "Llamadas por ruta y modelo (respaldo: si/no)",
+                                    ("ruta", "modelo", "resultado", "respaldo"))
+
+
+@dataclass
+class Ruta:
+    nombre: str
+    modelos: list
+    max_tokens: Optional[int] = None
+
+    @property
+    def modelo(self):
+        """Modelo principal (el que identifica la ruta en la caché de respuestas)"""
+        return self.modelos[0]
+
+
+def variable_ruta(prefijo, ruta):
+    return f"{prefijo}_{ruta.replace('.', '_').upper()}"
+
+
+def cargar_rutas(defecto=RUTAS_DEFECTO):
+    """Rutas por defecto con los ajustes de las variables de entorno"""
+    rutas = {}
+    for nombre, (modelos, max_tokens) in defecto.items():
+        cadena = os.getenv(variable_ruta("MODELO", nombre))
+        if cadena:
+            modelos = [m.strip() for m in cadena.split(",") if m.strip()]
+        tope = os.getenv(variable_ruta("MAX_TOKENS", nombre))
+        if tope is not None:
+            max_tokens = int(tope) or None
+        rutas[nombre] = Ruta(nombre, list(modelos), max_tokens)
+    return rutas
+
+
+def es_falla_de_modelo(error):
+    """Errores tras los que conviene probar el siguiente modelo de la cadena"""
+    import openai
+
+    return isinstance(error, (ProveedorNoDisponible, openai.NotFoundError)) or es_transitorio(error)
+
+
+def costo(modelo, tokens_entrada, tokens_salida):
+    entrada, salida = MODELOS_PRECIOS.get(modelo, (0.0, 0.0))
+    return (tokens_entrada * entrada + tokens_salida * salida) / 1_000_000
+
+
+class RouterModelos:
+    def __init__(self, llm, rutas=None, historial=200):
+        self.llm = llm
+        self.rutas = rutas or cargar_rutas()
+        self.por_modelo = {}
+        self.recientes = deque(maxlen=historial)
+
+    def ruta(self, nombre):
+        return self.rutas[nombre]
+
+    def _parametros(self, ruta, kwargs):
+        if ruta.max_tokens:
+            kwargs["max_tokens"] = min(kwargs.get("max_tokens") or ruta.max_tokens, ruta.max_tokens)
+        return kwargs
+
+    def _registrar(self, ruta, modelo, inicio, error=None, respaldo=False,
+                   tokens_entrada=0, tokens_salida=0, estimado=False):
+        ms = (time.perf_counter() - inicio) * 1000
+        datos = self.por_modelo.setdefault(modelo, {
+            "llamadas": 0, "errores": 0, "respaldos": 0, "ms_total": 0.0,
+            "tokens_entrada": 0, "tokens_salida": 0, "costo_usd": 0.0,
+        })
+        datos["llamadas"] += 1
+        datos["respaldos"] += respaldo
+        LLAMADAS_MODELO.inc(ruta.nombre, modelo, "error" if error is not None else "exito",
+                            "si" if respaldo else "no")
+        if error is not None:
+            datos["errores"] += 1
+        else:
+            usd = costo(modelo, tokens_entrada, tokens_salida)
+            datos["ms_total"] += ms
+            datos["tokens_entrada"] += tokens_entrada
+            datos["tokens_salida"] += tokens_salida
+            datos["costo_usd"] += usd
+            TOKENS.inc(ruta.nombre, modelo, "entrada", cantidad=tokens_entrada)
+            TOKENS.inc(ruta.nombre, modelo, "salida", cantidad=tokens_salida)
+            COSTO.inc(ruta.nombre, modelo, cantidad=usd)
+        self.recientes.append({
+            "ruta": ruta.nombre, "modelo": modelo, "ms": round(ms, 1), "respaldo": respaldo,
+            "tokens_entrada": tokens_entrada, "tokens_salida": tokens_salida, "tokens_estimados": estimado,
+            "costo_usd": round(costo(modelo, tokens_entrada, tokens_salida), 6),
+            "error": type(error).__name__ if error is not None else None,
+        })
+
+    async def completar(self, nombre, messages, **kwargs):
+        """Completion por la cadena de modelos de la ruta `nombre`"""
+        ruta = self.ruta(nombre)
+        kwargs = self._parametros(ruta, kwargs)
+        for i, modelo in enumerate(ruta.modelos):
+            inicio = time.perf_counter()
+            try:
+                completion = await self.llm.completar(model=modelo, messages=messages, **kwargs)
+            except Exception as e:
+                self._registrar(ruta, modelo, inicio, error=e, respaldo=i > 0)
+                if i + 1 < len(ruta.modelos) and es_falla_de_modelo(e):
+                    print(f"⚠️  {nombre}: {modelo} falló ({type(e).__name__}), probando {ruta.modelos[i + 1]}")
+                    continue
+                raise
+            uso = getattr(completion, "usage", None)
+            self._registrar(
+                ruta, modelo, inicio, respaldo=i > 0,
+                tokens_entrada=getattr(uso, "prompt_tokens", 0) or 0,
+                tokens_salida=getattr(uso, "completion_tokens", 0) or 0,
+            )
+            return completion
+
+    async def completar_stream(self, nombre, messages, **kwargs):
+        """Fragmentos de texto por la cadena de la ruta; cambia de modelo solo antes del primero.
+
+        El uso de tokens de los streams se estima por caracteres.
+        """
+        ruta = self.ruta(nombre)
+        kwargs = self._parametros(ruta, kwargs)
+        for i, modelo in enumerate(ruta.modelos):
+            inicio = time.perf_counter()
+            fragmentos = self.llm.completar_stream(model=modelo, messages=messages, **kwargs)
+            try:
+                primero = await fragmentos.__anext__()
+            except StopAsyncIteration:
+                primero = ""
+            except Exception as e:
+                await fragmentos.aclose()
+                self._registrar(ruta, modelo, inicio, error=e, respaldo=i > 0)
+                if i + 1 < len(ruta.modelos) and es_falla_de_modelo(e):
+                    print(f"⚠️  {nombre}: {modelo} falló ({type(e).__name__}), probando {ruta.modelos[i + 1]}")
+                    continue
+                raise
+            salida = len(primero)
+            error = None
+            try:
+                if primero:
+                    yield primero
+                async for fragmento in fragmentos:
+                    salida += len(fragmento)
+                    yield fragmento
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                await fragmentos.aclose()
+                entrada = sum(estimar_tokens(str(m.get("content", ""))) for m in messages)
+                self._registrar(
+                    ruta, modelo, inicio, error=error, respaldo=i > 0,
+                    tokens_entrada=entrada, tokens_salida=salida // 4, estimado=True,
+                )
+            return
+
+    def estadisticas(self):
+        modelos = {}
+        for modelo, datos in self.por_modelo.items():
+            exitosas = datos["llamadas"] - datos["errores"]
+            modelos[modelo] = {
+                **datos,
+                "ms_promedio": round(datos["ms_total"] / exitosas, 1) if exitosas else 0.0,
+                "ms_total": round(datos["ms_total"], 1),
+                "costo_usd": round(datos["costo_usd"], 6),
+            }
+        return {
+            "rutas": {
+                nombre: {"modelos": ruta.modelos, "max_tokens": ruta.max_tokens}
+                for nombre, ruta in self.rutas.items()
+            },
+            "modelos": modelos,
+            "recientes": list(self.recientes)[-20:],
+        }
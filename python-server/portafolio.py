@@ -0,0 +1,96 @@
+"""Contexto del portafolio con recarga en caliente.
+
+`GestorPortafolio` vigila `portfolio-data.json` por mtime/tamaño, lo vuelve
+a parsear solo cuando cambia y sustituye de forma atómica el snapshot
+(datos + contexto renderizado). Cada petición toma un snapshot al inicio y
+lo usa completo, así que nunca mezcla datos de dos versiones. Si el archivo
+nuevo no se puede leer (ej. se está escribiendo), se conserva el anterior.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, NamedTuple
+
+from prompts import huella_archivos
+
+PORTAFOLIO_INTERVALO = float(os.getenv("PORTAFOLIO_INTERVALO", "2"))
+MENSAJE_SIN_PORTAFOLIO = "No se pudo cargar la información del portafolio dinámico."
+
+
+class SnapshotPortafolio(NamedTuple):
+    datos: Any
+    contexto: str
+    version: int
+    huella: tuple
+
+
+class GestorPortafolio:
+    def __init__(self, ruta, renderizar, intervalo=PORTAFOLIO_INTERVALO):
+        self.ruta = ruta
+        self.renderizar = renderizar
+        self.intervalo = intervalo
+        self.recargas = 0
+        self._snapshot = None
+        self._revisado_en = 0.0
+        # Huella del último archivo inválido, para no re-parsearlo en cada revisión
+        self._huella_fallida = None
+        self._lock = threading.Lock()
+        self._tarea = None
+
+    def _leer(self):
+        with open(self.ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def revisar(self):
+        """Recarga si el archivo cambió; devuelve True si hubo un snapshot nuevo"""
+        huella = huella_archivos([self.ruta])
+        actual = self._snapshot
+        if actual is not None and huella in (actual.huella, self._huella_fallida):
+            return False
+        with self._lock:
+            actual = self._snapshot
+            if actual is not None and actual.huella == huella:
+                return False
+            try:
+                datos = self._leer()
+                contexto = self.renderizar(datos)
+            except Exception as e:
+                print(f"Error leyendo portafolio dinámico: {e}")
+                self._huella_fallida = huella
+                if actual is not None:
+                    return False
+                datos, contexto = None, MENSAJE_SIN_PORTAFOLIO
+            version = actual.version + 1 if actual else 1
+            # Sustitución atómica: las peticiones en curso conservan su snapshot
+            self._snapshot = SnapshotPortafolio(datos, contexto, version, huella)
+            self.recargas += 1
+            return True
+
+    def snapshot(self):
+        """Snapshot vigente; sin vigilante activo revisa el archivo como mucho cada `intervalo`"""
+        ahora = time.monotonic()
+        if self._snapshot is None or (self._tarea is None and ahora - self._revisado_en >= self.intervalo):
+            self._revisado_en = ahora
+            self.revisar()
+        return self._snapshot
+
+    async def _vigilar(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            if await asyncio.to_thread(self.revisar):
+                print(f"🔄 Portafolio recargado (versión {self._snapshot.version})")
+
+    def iniciar(self):
+        self.revisar()
+        self._tarea = asyncio.create_task(self._vigilar())
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
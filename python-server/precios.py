@@ -0,0 +1,306 @@
+"""Servicio de precios de CoinGecko con lotes, caché TTL y single-flight.
+
+Todas las consultas de precios de una petición se agrupan en una sola
+llamada a `simple/price` (ids y vs_currencies separados por comas). Los
+resultados se guardan por par (activo, moneda) durante `PRECIOS_TTL`
+segundos y las peticiones concurrentes que necesitan el mismo par esperan
+a la misma llamada en vuelo en lugar de lanzar otra.
+
+Opcionalmente, `TickerPrecios` refresca en segundo plano los activos
+seguidos; mientras está activo, esos pares se sirven directo de la tabla en
+memoria sin I/O en la ruta de la petición. Si CoinGecko falla, se devuelve
+el último precio conocido marcado con `obsoleto: True` en lugar de nada.
+Las llamadas pasan por `resiliencia.Resiliente` (reintentos, disyuntor y
+cobertura opcional con `PRECIOS_COBERTURA`); con el circuito abierto se
+sirve directo el precio obsoleto.
+
+Con varios workers, el servicio recibe el almacén compartido
+(`compartido.AlmacenCompartido`): antes de ir a la red busca ahí lo que
+otro worker ya consultó, y publica ahí lo que consulta. Solo el worker que
+toma el liderazgo `ticker_precios` ejecuta el ticker; los demás leen sus
+precios del almacén.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+
+import httpx
+
+from resiliencia import Resiliente
+from vuelos import consumir_excepcion
+
+COINGECKO_URL = os.getenv("COINGECKO_URL", "https://api.coingecko.com/api/v3")
+PRECIOS_TTL = float(os.getenv("PRECIOS_TTL", "30"))
+PRECIOS_TIMEOUT = float(os.getenv("PRECIOS_TIMEOUT", "5"))
+PRECIOS_TICKER = os.getenv("PRECIOS_TICKER", "false").lower() in ("1", "true", "si", "yes")
+PRECIOS_TICKER_INTERVALO = float(os.getenv("PRECIOS_TICKER_INTERVALO", "15"))
+PRECIOS_COBERTURA = os.getenv("PRECIOS_COBERTURA", "false").lower() in ("1", "true", "si", "yes")
+# En el almacén compartido los precios se conservan más que el TTL, como respaldo obsoleto
+PRECIOS_COMPARTIDOS_MAX_S = float(os.getenv("PRECIOS_COMPARTIDOS_MAX_S", "3600"))
+ESPACIO = "precios"
+
+
+def clave_par(par):
+    return f"{par[0]}:{par[1]}"
+
+
+class ServicioPrecios:
+    """Precios por par (activo, moneda) con caché en proceso"""
+
+    def __init__(self, base_url=COINGECKO_URL, ttl=PRECIOS_TTL, timeout=PRECIOS_TIMEOUT, compartido=None):
+        self.base_url = base_url.rstrip("/")
+        self.ttl = ttl
+        self.timeout = timeout
+        self.compartido = compartido
+        # Se crea en el primer uso: el contexto TLS no se paga al importar
+        self._http = None
+        self.resiliencia = Resiliente("coingecko", cobertura=PRECIOS_COBERTURA)
+        # (activo, moneda) -> (actualizado_en, {"usd": 1.0, "usd_24h_change": 0.1})
+        self._cache = {}
+        # (activo, moneda) -> Future compartido por la llamada en vuelo
+        self._en_vuelo = {}
+        # Pares que mantiene al día el ticker; se leen sin ir a la red
+        self.pares_en_ticker = set()
+        self.llamadas_upstream = 0
+        self.aciertos_compartidos = 0
+
+    @property
+    def http(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=self.timeout)
+        return self._http
+
+    def iniciar(self):
+        """Crea el cliente HTTP por adelantado (calentamiento del worker)"""
+        return self.http
+
+    def _leer_compartido(self, pares):
+        """Trae del almacén compartido los pares más nuevos que los de la tabla local"""
+        try:
+            entradas = self.compartido.leer_varios(ESPACIO, [clave_par(par) for par in pares])
+        except sqlite3.Error as e:
+            print(f"Error leyendo precios compartidos: {e}")
+            return
+        # El almacén guarda tiempo de reloj; la tabla local, monotónico
+        desfase = time.monotonic() - time.time()
+        for par in pares:
+            entrada = entradas.get(clave_par(par))
+            if entrada is None:
+                continue
+            valor, actualizado = entrada
+            actualizado_en = actualizado + desfase
+            local = self._cache.get(par)
+            if local is None or local[0] < actualizado_en:
+                self._cache[par] = (actualizado_en, valor)
+
+    def _publicar(self, resultado):
+        try:
+            self.compartido.guardar_varios(
+                ESPACIO, {clave_par(par): valor for par, valor in resultado.items()},
+                max(PRECIOS_COMPARTIDOS_MAX_S, self.ttl),
+            )
+        except sqlite3.Error as e:
+            print(f"Error publicando precios compartidos: {e}")
+
+    def _leer_cache(self, par, ahora):
+        entrada = self._cache.get(par)
+        if entrada and ahora - entrada[0] < self.ttl:
+            return entrada[1]
+        return None
+
+    def _leer_obsoleto(self, par, ahora):
+        """Último valor conocido del par, marcado con su antigüedad"""
+        entrada = self._cache.get(par)
+        if not entrada:
+            return None
+        actualizado_en, valor = entrada
+        if ahora - actualizado_en < self.ttl:
+            return valor
+        return {**valor, "obsoleto": True, "antiguedad_s": round(ahora - actualizado_en, 1)}
+
+    async def _consultar(self, activos, monedas):
+        """Una sola llamada a simple/price para todos los activos y monedas"""
+        params = {
+            "ids": ",".join(sorted(activos)),
+            "vs_currencies": ",".join(sorted(monedas)),
+            "include_24hr_change": "true",
+        }
+
+        async def pedir(plazo):
+            self.llamadas_upstream += 1
+            resp = await self.http.get(f"{self.base_url}/simple/price", params=params, timeout=plazo)
+            resp.raise_for_status()
+            return resp.json()
+
+        data = await self.resiliencia.ejecutar(pedir, self.timeout)
+
+        actualizado_en = time.monotonic()
+        resultado = {}
+        for activo in activos:
+            precios = data.get(activo) or {}
+            for moneda in monedas:
+                if moneda not in precios:
+                    continue
+                valor = {moneda: precios[moneda]}
+                cambio = precios.get(f"{moneda}_24h_change")
+                if cambio is not None:
+                    valor[f"{moneda}_24h_change"] = cambio
+                self._cache[(activo, moneda)] = (actualizado_en, valor)
+                resultado[(activo, moneda)] = valor
+        if self.compartido and resultado:
+            self._publicar(resultado)
+        return resultado
+
+    async def _consultar_y_liberar(self, pares, activos, monedas):
+        try:
+            return await self._consultar(activos, monedas)
+        finally:
+            for par in pares:
+                self._en_vuelo.pop(par, None)
+
+    async def obtener(self, activos, monedas=("usd",)):
+        """Devuelve {activo: {moneda: precio, moneda_24h_change: cambio}} en el formato de CoinGecko.
+
+        Los pares que no se pudieron obtener simplemente no aparecen.
+        """
+        activos = [a.lower() for a in activos]
+        monedas = [m.lower() for m in monedas]
+        ahora = time.monotonic()
+
+        encontrados = {}
+        esperas = set()
+        faltantes = []
+        for activo in activos:
+            for moneda in monedas:
+                par = (activo, moneda)
+                if par in self.pares_en_ticker and par in self._cache:
+                    encontrados[par] = self._leer_obsoleto(par, ahora)
+                    continue
+                valor = self._leer_cache(par, ahora)
+                if valor is not None:
+                    encontrados[par] = valor
+                elif par in self._en_vuelo:
+                    esperas.add(self._en_vuelo[par])
+                else:
+                    faltantes.append(par)
+
+        if faltantes and self.compartido:
+            # Lo que otro worker (o el ticker del líder) ya consultó no se vuelve a pedir
+            self._leer_compartido(faltantes)
+            pendientes = []
+            for par in faltantes:
+                valor = self._leer_cache(par, ahora)
+                if valor is not None:
+                    encontrados[par] = valor
+                    self.aciertos_compartidos += 1
+                else:
+                    pendientes.append(par)
+            faltantes = pendientes
+
+        if faltantes:
+            tarea = asyncio.ensure_future(self._consultar_y_liberar(
+                faltantes,
+                {activo for activo, _ in faltantes},
+                {moneda for _, moneda in faltantes},
+            ))
+            # Si todos los que esperan se cancelan, el error no queda sin recoger
+            tarea.add_done_callback(consumir_excepcion)
+            for par in faltantes:
+                self._en_vuelo[par] = tarea
+            esperas.add(tarea)
+
+        if esperas:
+            # shield: si esta petición se cancela, la llamada compartida sigue viva
+            resultados = await asyncio.gather(
+                *(asyncio.shield(espera) for espera in esperas),
+                return_exceptions=True,
+            )
+            for resultado in resultados:
+                if isinstance(resultado, BaseException):
+                    print(f"Error al obtener precio: {resultado}")
+                    continue
+                encontrados.update(resultado)
+
+            # Si CoinGecko falló, mejor un precio viejo marcado que ninguno
+            for activo in activos:
+                for moneda in monedas:
+                    par = (activo, moneda)
+                    if par not in encontrados:
+                        obsoleto = self._leer_obsoleto(par, time.monotonic())
+                        if obsoleto is not None:
+                            encontrados[par] = obsoleto
+
+        respuesta = {}
+        for (activo, moneda), valor in encontrados.items():
+            if activo in activos and moneda in monedas:
+                respuesta.setdefault(activo, {}).update(valor)
+        return respuesta
+
+    async def refrescar(self, activos, monedas):
+        """Fuerza una consulta a CoinGecko ignorando la caché"""
+        return await self._consultar(set(activos), set(monedas))
+
+    async def cerrar(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+class TickerPrecios:
+    """Refresca periódicamente los activos seguidos en la tabla del servicio.
+
+    Con almacén compartido solo refresca el worker líder; los demás vuelven a
+    intentar tomar el liderazgo en cada ciclo (por si el líder terminó).
+    """
+
+    def __init__(self, servicio, activos, monedas=("usd", "mxn"),
+                 intervalo=PRECIOS_TICKER_INTERVALO):
+        self.servicio = servicio
+        self.activos = sorted({a.lower() for a in activos})
+        self.monedas = sorted({m.lower() for m in monedas})
+        self.intervalo = intervalo
+        self.fallos_consecutivos = 0
+        self._tarea = None
+
+    async def _refrescar(self):
+        try:
+            await self.servicio.refrescar(self.activos, self.monedas)
+            self.fallos_consecutivos = 0
+        except Exception as e:
+            self.fallos_consecutivos += 1
+            print(f"Error refrescando precios ({self.fallos_consecutivos} seguidos): {e}")
+
+    def es_lider(self):
+        compartido = self.servicio.compartido
+        return compartido is None or compartido.tomar_liderazgo("ticker_precios")
+
+    async def _ciclo(self):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            if self.servicio.pares_en_ticker:
+                await self._refrescar()
+            elif self.es_lider():
+                print("📈 Este worker toma el ticker de precios")
+                await self._activar()
+
+    async def _activar(self):
+        await self._refrescar()
+        self.servicio.pares_en_ticker = {
+            (activo, moneda) for activo in self.activos for moneda in self.monedas
+        }
+
+    async def iniciar(self):
+        """Carga la tabla una vez (si es el líder) y deja el ciclo corriendo en segundo plano"""
+        if self.es_lider():
+            await self._activar()
+        self._tarea = asyncio.create_task(self._ciclo())
+
+    async def detener(self):
+        self.servicio.pares_en_ticker = set()
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,96 @@
+"""Registro de system prompts compilados una sola vez.
+
+Cada prompt se construye la primera vez que se pide y se reutiliza hasta
+que cambia alguna de sus entradas: archivos (se compara mtime y tamaño,
+como mucho cada `PROMPTS_INTERVALO_REVISION` segundos) o funciones que
+devuelven una versión (ej. la del snapshot del portafolio). Cada versión lleva
+un hash estable del texto para usarlo en claves de caché.
+
+Las partes fijas de los prompts van siempre al principio y byte a byte
+idénticas entre peticiones, para que el proveedor pueda aplicar caché de
+prefijos.
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import NamedTuple
+
+PROMPTS_INTERVALO_REVISION = float(os.getenv("PROMPTS_INTERVALO_REVISION", "2"))
+
+
+class PromptCompilado(NamedTuple):
+    texto: str
+    version: str
+
+
+def huella_archivos(rutas):
+    """(ruta, mtime_ns, tamaño) de cada archivo; None si no existe"""
+    huella = []
+    for ruta in rutas:
+        try:
+            info = os.stat(ruta)
+            huella.append((ruta, info.st_mtime_ns, info.st_size))
+        except OSError:
+            huella.append((ruta, None, None))
+    return tuple(huella)
+
+
+def huella_dependencias(dependencias):
+    """Rutas -> huella de archivo; funciones -> el valor de versión que devuelven"""
+    return tuple(
+        dependencia() if callable(dependencia) else huella_archivos([dependencia])[0]
+        for dependencia in dependencias
+    )
+
+
+def compilar(texto):
+    return PromptCompilado(texto, hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16])
+
+
+class RegistroPrompts:
+    def __init__(self, intervalo_revision=PROMPTS_INTERVALO_REVISION):
+        self.intervalo_revision = intervalo_revision
+        self._constructores = {}
+        self._compilados = {}
+        self._lock = threading.Lock()
+        self.compilaciones = 0
+
+    def registrar(self, nombre, construir, dependencias=()):
+        """`construir()` devuelve el texto; `dependencias` son rutas o funciones de versión que lo invalidan"""
+        self._constructores[nombre] = (construir, tuple(dependencias))
+        self._compilados.pop(nombre, None)
+
+    def obtener(self, nombre):
+        """Prompt compilado vigente; se reconstruye solo si cambiaron sus archivos"""
+        ahora = time.monotonic()
+        entrada = self._compilados.get(nombre)
+        if entrada and ahora - entrada["revisado_en"] < self.intervalo_revision:
+            return entrada["prompt"]
+
+        construir, dependencias = self._constructores[nombre]
+        huella = huella_dependencias(dependencias)
+        if entrada and entrada["huella"] == huella:
+            entrada["revisado_en"] = ahora
+            return entrada["prompt"]
+
+        with self._lock:
+            entrada = self._compilados.get(nombre)
+            if entrada and entrada["huella"] == huella:
+                return entrada["prompt"]
+            prompt = compilar(construir())
+            self.compilaciones += 1
+            self._compilados[nombre] = {"prompt": prompt, "huella": huella, "revisado_en": ahora}
+            return prompt
+
+    def invalidar(self, nombre=None):
+        if nombre is None:
+            self._compilados.clear()
+        else:
+            self._compilados.pop(nombre, None)
+
+    def calentar(self):
+        """Compila todos los prompts registrados (antes de aceptar tráfico)"""
+        for nombre in list(self._constructores):
+            self.obtener(nombre)
+        return len(self._constructores)
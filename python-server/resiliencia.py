@@ -0,0 +1,339 @@
+"""Resiliencia frente a los proveedores externos (Hicap y CoinGecko).
+
+Cada llamada saliente pasa por un `Resiliente`:
+
+- Plazo: el timeout de cada intento es el menor entre el de la llamada y lo
+  que le queda al presupuesto de la petición (`PlazoPeticion` lo fija al
+  entrar cada petición HTTP). Sin tiempo restante no se llama.
+- Reintentos con espera exponencial y jitter completo, solo para errores
+  transitorios (timeouts, conexión, 429 y 5xx) y llamadas idempotentes.
+- Disyuntor: tras `fallos_para_abrir` fallos seguidos rechaza al instante
+  durante `enfriamiento` segundos; luego deja pasar una llamada de prueba.
+- Cobertura (hedging, opcional): si un intento tarda más que el p95 de las
+  latencias recientes se lanza uno idéntico en paralelo y gana el primero.
+"""
+import asyncio
+import contextvars
+import os
+import random
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+
+from metricas import REGISTRO
+
+PETICION_PLAZO_S = float(os.getenv("PETICION_PLAZO_S", "60"))
+PETICION_PLAZO_TRANSCRIPCION_S = float(os.getenv("PETICION_PLAZO_TRANSCRIPCION_S", "300"))
+# Un lote (/batch) no tiene plazo global propio: cada elemento lleva el suyo (`con_plazo`)
+PETICION_PLAZO_LOTE_S = float(os.getenv("PETICION_PLAZO_LOTE_S", "3600"))
+RESILIENCIA_REINTENTOS = int(os.getenv("RESILIENCIA_REINTENTOS", "2"))
+RESILIENCIA_ESPERA_BASE = float(os.getenv("RESILIENCIA_ESPERA_BASE", "0.2"))
+RESILIENCIA_ESPERA_MAX = float(os.getenv("RESILIENCIA_ESPERA_MAX", "2"))
+DISYUNTOR_FALLOS = int(os.getenv("DISYUNTOR_FALLOS", "5"))
+DISYUNTOR_ENFRIAMIENTO = float(os.getenv("DISYUNTOR_ENFRIAMIENTO", "30"))
+# Latencias exitosas necesarias antes de cubrir por p95
+MUESTRAS_COBERTURA = 20
+
+# Momento (time.monotonic) en que vence la petición en curso, o None
+_vence = contextvars.ContextVar("vence_peticion", default=None)
+
+UPSTREAM_LLAMADAS = REGISTRO.contador(
+    "upstream_llamadas_total", "Llamadas a proveedores por resultado (exito, error, rechazada, plazo)",
+    ("upstream", "resultado"),
+)
+UPSTREAM_DURACION = REGISTRO.histograma(
+    "upstream_duracion_segundos", "Duración de las llamadas a proveedores, con reintentos", ("upstream",)
+)
+UPSTREAM_REINTENTOS = REGISTRO.contador("upstream_reintentos_total", "Reintentos por proveedor", ("upstream",))
+UPSTREAM_COBERTURAS = REGISTRO.contador(
+    "upstream_coberturas_total", "Llamadas de cobertura lanzadas por proveedor", ("upstream",)
+)
+_instancias = weakref.WeakSet()
+CODIGOS_DISYUNTOR = {"cerrado": 0, "semiabierto": 1, "abierto": 2}
+REGISTRO.funcion(
+    "disyuntor_estado", "Estado del disyuntor por proveedor (0 cerrado, 1 semiabierto, 2 abierto)",
+    lambda: {r.nombre: CODIGOS_DISYUNTOR[r.disyuntor.estado] for r in list(_instancias)},
+    ("upstream",),
+)
+
+
+class ProveedorNoDisponible(Exception):
+    """El proveedor no se llamó o no respondió a tiempo"""
+
+
+class CircuitoAbierto(ProveedorNoDisponible):
+    def __init__(self, nombre, reintentar_en):
+        super().__init__(f"{nombre} no disponible (circuito abierto, reintento en {reintentar_en:.0f} s)")
+
+
+class PlazoAgotado(ProveedorNoDisponible):
+    def __init__(self, nombre):
+        super().__init__(f"Sin tiempo restante para llamar a {nombre}")
+
+
+def tiempo_restante():
+    vence = _vence.get()
+    return None if vence is None else vence - time.monotonic()
+
+
+@contextmanager
+def con_plazo(segundos):
+    """Presupuesto propio para un trabajo dentro de la petición (ej. cada elemento de un lote)"""
+    token = _vence.set(time.monotonic() + segundos)
+    try:
+        yield
+    finally:
+        _vence.reset(token)
+
+
+class PlazoPeticion:
+    """Middleware ASGI: fija el presupuesto de tiempo de cada petición HTTP.
+
+    Es ASGI puro (no BaseHTTPMiddleware) para que el plazo siga visible
+    mientras se genera una respuesta en streaming.
+    """
+
+    def __init__(self, app, plazo=PETICION_PLAZO_S, plazo_transcripcion=PETICION_PLAZO_TRANSCRIPCION_S,
+                 plazo_lote=PETICION_PLAZO_LOTE_S):
+        self.app = app
+        self.plazo = plazo
+        self.plazo_transcripcion = plazo_transcripcion
+        self.plazo_lote = plazo_lote
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if scope["path"].startswith("/transcribe"):
+            segundos = self.plazo_transcripcion
+        elif scope["path"].startswith("/batch"):
+            segundos = self.plazo_lote
+        else:
+            segundos = self.plazo
+        token = _vence.set(time.monotonic() + segundos)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _vence.reset(token)
+
+
+def es_transitorio(error):
+    """Errores que vale la pena reintentar y que cuentan para el disyuntor"""
+    # Importado aquí: el SDK tarda en cargar y solo hace falta cuando ya hubo un error
+    import openai
+
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError,
+                          openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        codigo = error.response.status_code
+    elif isinstance(error, openai.APIStatusError):
+        codigo = error.status_code
+    else:
+        return False
+    return codigo == 429 or codigo >= 500
+
+
+class Disyuntor:
+    def __init__(self, nombre, fallos_para_abrir=DISYUNTOR_FALLOS, enfriamiento=DISYUNTOR_ENFRIAMIENTO):
+        self.nombre = nombre
+        self.fallos_para_abrir = fallos_para_abrir
+        self.enfriamiento = enfriamiento
+        self.fallos_seguidos = 0
+        self.abierto_desde = None
+        self._prueba_en_curso = False
+        self.aperturas = 0
+        self.rechazos = 0
+
+    @property
+    def estado(self):
+        if self.abierto_desde is None:
+            return "cerrado"
+        if time.monotonic() - self.abierto_desde >= self.enfriamiento:
+            return "semiabierto"
+        return "abierto"
+
+    def permitir(self):
+        """Lanza CircuitoAbierto si no se debe llamar; en semiabierto deja pasar una sola prueba"""
+        estado = self.estado
+        if estado == "cerrado":
+            return
+        if estado == "semiabierto" and not self._prueba_en_curso:
+            self._prueba_en_curso = True
+            return
+        self.rechazos += 1
+        restante = max(self.enfriamiento - (time.monotonic() - self.abierto_desde), 0)
+        raise CircuitoAbierto(self.nombre, restante)
+
+    def exito(self):
+        self.fallos_seguidos = 0
+        self.abierto_desde = None
+        self._prueba_en_curso = False
+
+    def fallo(self):
+        self.fallos_seguidos += 1
+        if self._prueba_en_curso or self.fallos_seguidos >= self.fallos_para_abrir:
+            if self.abierto_desde is None or self._prueba_en_curso:
+                self.aperturas += 1
+            self.abierto_desde = time.monotonic()
+            self._prueba_en_curso = False
+
+    def liberar_prueba(self):
+        """La prueba terminó sin veredicto (ej. error no transitorio o cancelación)"""
+        self._prueba_en_curso = False
+
+
+class Resiliente:
+    def __init__(self, nombre, reintentos=RESILIENCIA_REINTENTOS, cobertura=False,
+                 espera_base=RESILIENCIA_ESPERA_BASE, espera_max=RESILIENCIA_ESPERA_MAX,
+                 disyuntor=None):
+        self.nombre = nombre
+        self.reintentos = reintentos
+        self.cobertura = cobertura
+        self.espera_base = espera_base
+        self.espera_max = espera_max
+        self.disyuntor = disyuntor or Disyuntor(nombre)
+        self._latencias = deque(maxlen=200)
+        self.conteos = {
+            "llamadas": 0, "intentos": 0, "reintentos": 0, "exitos": 0, "fallos": 0,
+            "plazo_agotado": 0, "coberturas": 0, "coberturas_ganadas": 0,
+        }
+        _instancias.add(self)
+
+    def p95(self):
+        if len(self._latencias) < MUESTRAS_COBERTURA:
+            return None
+        ordenadas = sorted(self._latencias)
+        return ordenadas[int(len(ordenadas) * 0.95) - 1]
+
+    def _timeout(self, timeout):
+        """Timeout del intento: el de la llamada recortado por el plazo de la petición"""
+        restante = tiempo_restante()
+        if restante is None:
+            return timeout
+        if restante <= 0:
+            self.conteos["plazo_agotado"] += 1
+            raise PlazoAgotado(self.nombre)
+        return min(timeout, restante) if timeout else restante
+
+    async def _intento(self, crear, timeout, cubrir):
+        """Un intento; con cobertura, una segunda copia si el primero pasa del p95"""
+        limite = self.p95() if cubrir else None
+        inicio = time.monotonic()
+        if limite is None:
+            resultado = await asyncio.wait_for(crear(timeout), timeout)
+            self._latencias.append(time.monotonic() - inicio)
+            return resultado
+
+        tareas = [asyncio.ensure_future(crear(timeout))]
+        try:
+            hechas, _ = await asyncio.wait(tareas, timeout=limite)
+            if not hechas:
+                self.conteos["coberturas"] += 1
+                UPSTREAM_COBERTURAS.inc(self.nombre)
+                tareas.append(asyncio.ensure_future(crear(max(timeout - limite, 0.001))))
+            pendientes = set(tareas)
+            error = None
+            while pendientes:
+                restante = timeout - (time.monotonic() - inicio)
+                hechas, pendientes = await asyncio.wait(
+                    pendientes, timeout=max(restante, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not hechas:
+                    raise asyncio.TimeoutError()
+                for tarea in hechas:
+                    if tarea.exception() is None:
+                        if tarea is not tareas[0]:
+                            self.conteos["coberturas_ganadas"] += 1
+                        self._latencias.append(time.monotonic() - inicio)
+                        return tarea.result()
+                    error = tarea.exception()
+            raise error
+        finally:
+            for tarea in tareas:
+                if not tarea.done():
+                    tarea.cancel()
+
+    async def ejecutar(self, crear, timeout, idempotente=True, cubrir=None):
+        """Resultado de `await crear(timeout_del_intento)` con plazo, reintentos, disyuntor y cobertura"""
+        inicio = time.perf_counter()
+        resultado = "error"
+        try:
+            respuesta = await self._ejecutar(crear, timeout, idempotente, cubrir)
+            resultado = "exito"
+            return respuesta
+        except CircuitoAbierto:
+            resultado = "rechazada"
+            raise
+        except PlazoAgotado:
+            resultado = "plazo"
+            raise
+        finally:
+            UPSTREAM_LLAMADAS.inc(self.nombre, resultado)
+            if resultado != "rechazada":
+                UPSTREAM_DURACION.observar(time.perf_counter() - inicio, self.nombre)
+
+    async def _ejecutar(self, crear, timeout, idempotente, cubrir):
+        self.conteos["llamadas"] += 1
+        cubrir = self.cobertura if cubrir is None else cubrir
+        reintentos = self.reintentos if idempotente else 0
+        intento = 0
+        while True:
+            self.disyuntor.permitir()
+            try:
+                plazo = self._timeout(timeout)
+                self.conteos["intentos"] += 1
+                resultado = await self._intento(crear, plazo, cubrir and idempotente)
+            except ProveedorNoDisponible:
+                self.disyuntor.liberar_prueba()
+                self.conteos["fallos"] += 1
+                raise
+            except Exception as e:
+                import openai
+
+                if plazo < timeout and isinstance(e, (asyncio.TimeoutError, openai.APITimeoutError)):
+                    # Venció el presupuesto de la petición, no el del proveedor: no cuenta como falla suya
+                    self.disyuntor.liberar_prueba()
+                    self.conteos["plazo_agotado"] += 1
+                    self.conteos["fallos"] += 1
+                    raise PlazoAgotado(self.nombre) from e
+                if not es_transitorio(e):
+                    # Error del pedido (4xx, validación): el proveedor sí respondió
+                    self.disyuntor.liberar_prueba()
+                    self.conteos["fallos"] += 1
+                    raise
+                self.disyuntor.fallo()
+                espera = random.uniform(0, min(self.espera_max, self.espera_base * 2 ** intento))
+                restante = tiempo_restante()
+                if intento >= reintentos or (restante is not None and restante <= espera):
+                    self.conteos["fallos"] += 1
+                    raise
+                intento += 1
+                self.conteos["reintentos"] += 1
+                UPSTREAM_REINTENTOS.inc(self.nombre)
+                print(f"⚠️  {self.nombre}: {type(e).__name__}, reintento {intento} en {espera:.2f} s")
+                await asyncio.sleep(espera)
+                continue
+            except BaseException:
+                # Cancelación: la prueba del disyuntor queda libre para otra llamada
+                self.disyuntor.liberar_prueba()
+                raise
+            self.disyuntor.exito()
+            self.conteos["exitos"] += 1
+            return resultado
+
+    def estadisticas(self):
+        p95 = self.p95()
+        return {
+            **self.conteos,
+            "disyuntor": {
+                "estado": self.disyuntor.estado,
+                "fallos_seguidos": self.disyuntor.fallos_seguidos,
+                "aperturas": self.disyuntor.aperturas,
+                "rechazos": self.disyuntor.rechazos,
+            },
+            "cobertura": self.cobertura,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
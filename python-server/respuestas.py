@@ -0,0 +1,125 @@
+"""Caché de respuestas del modelo para turnos repetidos.
+
+La clave es un hash de (endpoint, modelo, parámetros, mensajes del prompt
+normalizados). Los mensajes incluyen el contexto de mercado, así que un
+precio nuevo produce otra clave y nunca se sirve una respuesta con
+precios viejos. En el texto del usuario solo se ignoran mayúsculas, acentos
+y espacios repetidos: "Cuál es el precio de BITCOIN" y "cual es el precio
+de bitcoin" comparten entrada. La puntuación y los símbolos se conservan
+("$100" y "€100", "1.5" y "15" son preguntas distintas), por eso no se
+usa la normalización del clasificador, que los quita.
+
+Dos niveles:
+
+- Memoria: LRU con TTL, por proceso.
+- Disco (opcional, `CACHE_COMPARTIDA`): el almacén SQLite que comparten
+  todos los workers (`compartido.AlmacenCompartido`, espacio `respuestas`).
+
+Las respuestas que traen una acción o tarea no se guardan, y los endpoints
+ni siquiera consultan la caché para intenciones que producen acciones.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+RESPUESTAS_CACHE_TTL = float(os.getenv("RESPUESTAS_CACHE_TTL", "300"))
+RESPUESTAS_CACHE_MAX = int(os.getenv("RESPUESTAS_CACHE_MAX", "1000"))
+ESPACIO = "respuestas"
+
+
+def normalizar_usuario(texto):
+    """Minúsculas y sin acentos, con espacios colapsados; la puntuación se conserva"""
+    texto = unicodedata.normalize("NFKD", texto.casefold())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split())
+
+
+def normalizar_mensajes(mensajes):
+    """[(rol, contenido)] con espacios colapsados; el texto del usuario además sin mayúsculas ni acentos"""
+    resultado = []
+    for mensaje in mensajes:
+        contenido = str(mensaje.get("content") or "")
+        if mensaje.get("role") == "user":
+            contenido = normalizar_usuario(contenido)
+        else:
+            contenido = " ".join(contenido.split())
+        resultado.append((mensaje.get("role"), contenido))
+    return resultado
+
+
+def clave_respuesta(endpoint, modelo, mensajes, **parametros):
+    canonico = json.dumps(
+        [endpoint, modelo, sorted(parametros.items()), normalizar_mensajes(mensajes)],
+        ensure_ascii=False, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+class CacheRespuestas:
+    def __init__(self, ttl=RESPUESTAS_CACHE_TTL, max_entradas=RESPUESTAS_CACHE_MAX, compartido=None):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        # clave -> (expira, respuesta); `expira` es tiempo de reloj para coincidir entre procesos
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self.disco = compartido
+        self.conteos = {"acierto_memoria": 0, "acierto_disco": 0, "fallo": 0, "omitida": 0, "guardada": 0}
+
+    def _guardar_memoria(self, clave, expira, valor):
+        with self._lock:
+            self._memoria[clave] = (expira, valor)
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_entradas:
+                self._memoria.popitem(last=False)
+
+    def leer(self, clave):
+        """Respuesta guardada o None"""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada and entrada[0] > ahora:
+                self._memoria.move_to_end(clave)
+                self.conteos["acierto_memoria"] += 1
+                return entrada[1]
+        if self.disco:
+            try:
+                encontrada = self.disco.leer(ESPACIO, clave)
+            except sqlite3.Error as e:
+                print(f"Error leyendo caché de respuestas en disco: {e}")
+                encontrada = None
+            if encontrada:
+                valor, actualizado = encontrada
+                self._guardar_memoria(clave, actualizado + self.ttl, valor)
+                self.conteos["acierto_disco"] += 1
+                return valor
+        self.conteos["fallo"] += 1
+        return None
+
+    def guardar(self, clave, valor):
+        ahora = time.time()
+        self._guardar_memoria(clave, ahora + self.ttl, valor)
+        self.conteos["guardada"] += 1
+        if self.disco:
+            try:
+                self.disco.guardar(ESPACIO, clave, valor, self.ttl, actualizado=ahora)
+            except sqlite3.Error as e:
+                print(f"Error escribiendo caché de respuestas en disco: {e}")
+
+    def omitir(self):
+        """Cuenta una petición que no usa la caché (intención con acción)"""
+        self.conteos["omitida"] += 1
+
+    def estadisticas(self):
+        aciertos = self.conteos["acierto_memoria"] + self.conteos["acierto_disco"]
+        consultas = aciertos + self.conteos["fallo"]
+        return {
+            **self.conteos,
+            "entradas_memoria": len(self._memoria),
+            "disco_compartido": bool(self.disco),
+            "tasa_aciertos": round(aciertos / consultas, 4) if consultas else 0.0,
+        }
@@ -0,0 +1,133 @@
+"""Respuestas en streaming (server-sent events) para los endpoints de chat.
+
+Los tokens se reenvían en cuanto llegan del modelo. Las secciones entre
+marcadores (`###TASK_JSON###`, `###ACTION_JSON###`) se retienen del texto
+visible y se entregan al final en el evento `done`, con el mismo formato
+que la respuesta JSON sin streaming.
+
+Eventos:
+    event: token  data: {"text": "..."}
+    event: done   data: {"response": "...", ...}
+    event: error  data: {"detail": "..."}
+"""
+import json
+
+
+def evento_sse(evento, data):
+    return f"event: {evento}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class FiltroMarcadores:
+    """Separa incrementalmente el texto visible de las secciones entre marcadores.
+
+    Cada carácter se examina una sola vez: `_pendiente` nunca guarda más que
+    el último fragmento y un posible inicio de marcador.
+    """
+
+    def __init__(self, marcador):
+        self.marcador = marcador
+        self.secciones = []
+        self._pendiente = ""
+        self._dentro = False
+        # Partes de la sección abierta
+        self._seccion = []
+        # Último carácter visible y si hay que separar el texto que siga a una sección quitada
+        self._ultimo = ""
+        self._separar = False
+
+    def _prefijo_retenido(self):
+        """Largo del sufijo pendiente que podría ser el inicio de un marcador"""
+        # Solo se prueban las posiciones donde aparece el primer carácter del marcador
+        inicio = max(len(self._pendiente) - len(self.marcador) + 1, 0)
+        i = self._pendiente.find(self.marcador[0], inicio)
+        while i >= 0:
+            if self.marcador.startswith(self._pendiente[i:]):
+                return len(self._pendiente) - i
+            i = self._pendiente.find(self.marcador[0], i + 1)
+        return 0
+
+    def _visible(self, texto):
+        """Texto listo para mostrar; evita pegar las palabras de antes y después de una sección"""
+        if not texto:
+            return ""
+        if self._separar and self._ultimo and not self._ultimo.isspace() and not texto[0].isspace():
+            texto = " " + texto
+        self._separar = False
+        self._ultimo = texto[-1]
+        return texto
+
+    def alimentar(self, delta):
+        """Procesa un fragmento y devuelve la parte que ya se puede mostrar"""
+        self._pendiente += delta
+        visible = ""
+        while True:
+            indice = self._pendiente.find(self.marcador)
+            if indice < 0:
+                # Todo menos un posible inicio de marcador ya se puede clasificar
+                corte = len(self._pendiente) - self._prefijo_retenido()
+                if self._dentro:
+                    self._seccion.append(self._pendiente[:corte])
+                else:
+                    visible += self._visible(self._pendiente[:corte])
+                self._pendiente = self._pendiente[corte:]
+                return visible
+            if self._dentro:
+                self._seccion.append(self._pendiente[:indice])
+                self.secciones.append("".join(self._seccion))
+                self._seccion = []
+                self._pendiente = self._pendiente[indice + len(self.marcador):]
+                self._dentro = False
+                self._separar = True
+            else:
+                visible += self._visible(self._pendiente[:indice])
+                self._pendiente = self._pendiente[indice + len(self.marcador):]
+                self._dentro = True
+
+    def terminar(self):
+        """Devuelve el texto visible restante al cerrar el stream.
+
+        Una sección sin marcador de cierre (respuesta cortada) se descarta.
+        """
+        if self._dentro:
+            abierta = "".join(self._seccion) + self._pendiente
+            if abierta.strip():
+                print(f"Sección sin cerrar descartada ({len(abierta)} caracteres)")
+            self._seccion = []
+            restante = ""
+        else:
+            restante = self._visible(self._pendiente)
+        self._pendiente = ""
+        return restante
+
+
+async def transmitir(tokens, construir_final, extractor=None):
+    """Convierte un iterador asíncrono de tokens en eventos SSE.
+
+    `extractor` (ej. `acciones.ExtractorAcciones`) retiene los bloques entre
+    marcadores; `construir_final(texto_visible, bloques)` arma el cuerpo del
+    evento `done` con los bloques ya validados.
+    """
+    visible = []
+    try:
+        async for delta in tokens:
+            texto = extractor.alimentar(delta) if extractor else delta
+            if texto:
+                visible.append(texto)
+                yield evento_sse("token", {"text": texto})
+        if extractor:
+            resto = extractor.terminar()
+            if resto:
+                visible.append(resto)
+                yield evento_sse("token", {"text": resto})
+        bloques = extractor.bloques if extractor else []
+        yield evento_sse("done", construir_final("".join(visible).strip(), bloques))
+    except Exception as e:
+        print(f"Error en streaming: {e}")
+        yield evento_sse("error", {"detail": str(e)})
+
+
+async def transmitir_fijo(payload):
+    """Respuesta ya conocida (ej. saludo inicial) con el mismo protocolo de eventos"""
+    if payload.get("response"):
+        yield evento_sse("token", {"text": payload["response"]})
+    yield evento_sse("done", payload)
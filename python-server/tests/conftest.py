@@ -0,0 +1,46 @@
+"""Arranca el proveedor falso de bench/ antes de importar main: ninguna
+prueba llama a un servicio real."""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import fake_upstream  # noqa: E402
+
+fake_upstream.config.latencia = 0.01
+fake_upstream.config.latencia_precios = 0.01
+_, URL_FALSA = fake_upstream.iniciar()
+os.environ["HICAP_BASE_URL"] = URL_FALSA + "/v1"
+os.environ["COINGECKO_URL"] = URL_FALSA + "/api/v3"
+os.environ["CACHE_COMPARTIDA"] = ""
+os.environ["USUARIOS_BACKEND"] = "memoria"
+
+
+@pytest.fixture(scope="session")
+def main():
+    import main
+    return main
+
+
+@pytest.fixture
+def en_app(main):
+    """Corre `prueba(http)` contra la app en proceso (sin lifespan: todo se abre en su primer uso)"""
+    import httpx
+
+    def correr(prueba):
+        async def todo():
+            transporte = httpx.ASGITransport(app=main.app)
+            try:
+                async with httpx.AsyncClient(transport=transporte, base_url="http://app", timeout=30) as http:
+                    return await prueba(http)
+            finally:
+                # Los clientes HTTP quedan ligados a este event loop: se reabren en el siguiente
+                await main.llm.cerrar()
+                await main.precios.cerrar()
+
+        return asyncio.run(todo())
+
+    return correr
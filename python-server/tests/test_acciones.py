@@ -0,0 +1,26 @@
+"""Fuzzing del extractor de acciones (las mismas verificaciones que bench_acciones)"""
+import json
+import random
+
+import pytest
+
+from acciones import MARCADOR_ACCION
+from bench.bench_acciones import ACCION_VALIDA, respuesta_aleatoria, verificar
+
+
+@pytest.mark.parametrize("semilla", range(4))
+def test_fuzz(semilla):
+    rng = random.Random(semilla)
+    for _ in range(250):
+        respuesta, esperados = respuesta_aleatoria(rng)
+        verificar(respuesta, esperados, rng)
+
+
+def test_bloque_sin_cerrar_no_se_muestra():
+    respuesta = f"Listo, preparo el envío. {MARCADOR_ACCION}" + '{"id": "action-1", "type"'
+    verificar(respuesta, [], random.Random(0))
+
+
+def test_dos_bloques_validos():
+    bloque = f"{MARCADOR_ACCION}\n{json.dumps(ACCION_VALIDA)}\n{MARCADOR_ACCION}"
+    verificar(f"uno {bloque} dos {bloque} tres", [ACCION_VALIDA, ACCION_VALIDA], random.Random(0))
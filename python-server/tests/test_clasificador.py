@@ -0,0 +1,48 @@
+"""Clasificador escalonado: una sola palabra débil no decide sin el LLM"""
+import asyncio
+
+import pytest
+
+from clasificador import REGLAS_CHAT, REGLAS_TRANSACCIONES, ClasificadorEscalonado, normalizar, puntuar
+
+# Frases que el puntuador clasificaba mal con una sola coincidencia débil
+DEBILES = [
+    ("¿qué servicios ofreces?", REGLAS_TRANSACCIONES),
+    ("¿cuántos contactos tengo?", REGLAS_TRANSACCIONES),
+    ("paga 100 usdt a Ana", REGLAS_TRANSACCIONES),
+    ("¿hay algo nuevo en mi agenda?", REGLAS_TRANSACCIONES),
+    ("quiero vender mi casa", REGLAS_CHAT),
+    ("¿cuál es mi balance?", REGLAS_CHAT),
+]
+
+OBVIAS = [
+    ("envía 100 usdt a Ana", REGLAS_TRANSACCIONES, "TRANSFERENCIA"),
+    ("quiero pagar la luz", REGLAS_TRANSACCIONES, "PAGO_SERVICIO"),
+    ("registra un nuevo contacto", REGLAS_TRANSACCIONES, "REGISTRO_CONTACTO"),
+    ("¿cuál es el precio de bitcoin?", REGLAS_CHAT, "MERCADO"),
+    ("muéstrame mi portafolio", REGLAS_CHAT, "PORTAFOLIO"),
+]
+
+
+@pytest.mark.parametrize("texto, reglas", DEBILES)
+def test_palabra_debil_no_decide(texto, reglas):
+    assert puntuar(normalizar(texto), reglas) == (None, 0.0)
+
+
+@pytest.mark.parametrize("texto, reglas, categoria", OBVIAS)
+def test_casos_obvios_locales(texto, reglas, categoria):
+    assert puntuar(normalizar(texto), reglas)[0] == categoria
+
+
+@pytest.mark.parametrize("texto, reglas", DEBILES)
+def test_palabra_debil_va_al_llm(texto, reglas):
+    llamadas = []
+
+    async def llm(mensaje):
+        llamadas.append(mensaje)
+        return "OTRA"
+
+    clasificador = ClasificadorEscalonado("prueba", reglas, llm, "OTRA")
+    assert asyncio.run(clasificador.clasificar(texto)) == "OTRA"
+    assert llamadas == [texto]
+    assert clasificador.aciertos["llm"] == 1
@@ -0,0 +1,30 @@
+"""Precios contra el CoinGecko falso: peticiones simultáneas comparten una sola consulta"""
+import asyncio
+import os
+
+from bench import fake_upstream
+from precios import ServicioPrecios
+
+
+def test_una_consulta_para_peticiones_simultaneas():
+    servicio = ServicioPrecios(base_url=os.environ["COINGECKO_URL"], ttl=60)
+
+    async def prueba():
+        try:
+            antes = fake_upstream.config.llamadas_precios
+            resultados = await asyncio.gather(*(
+                servicio.obtener(["bitcoin", "ethereum"], ["usd", "mxn"]) for _ in range(10)
+            ))
+            simultaneas = fake_upstream.config.llamadas_precios - antes
+            # Dentro del TTL sale de la caché
+            await servicio.obtener(["bitcoin"], ["usd"])
+            return resultados, simultaneas, fake_upstream.config.llamadas_precios - antes
+        finally:
+            await servicio.cerrar()
+
+    resultados, simultaneas, total = asyncio.run(prueba())
+    assert simultaneas == 1
+    assert total == 1
+    for resultado in resultados:
+        assert resultado["bitcoin"]["usd"] == fake_upstream.PRECIOS_USD["bitcoin"]
+        assert set(resultado["ethereum"]) >= {"usd", "mxn"}
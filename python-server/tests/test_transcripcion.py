@@ -0,0 +1,49 @@
+"""Transcripción por segmentos: el texto unido es exactamente el del audio, sin repetir el solape"""
+import asyncio
+import io
+
+from bench import fake_upstream
+from transcripcion import abrir_wav, planear_segmentos, texto_completo, transcribir_segmentos, unir_textos
+
+SEGUNDOS = 100
+
+
+async def transcribir_falso(nombre, archivo):
+    await asyncio.sleep(0)
+    texto, _ = fake_upstream.transcribir_sintetico(archivo.read())
+    return texto
+
+
+def test_segmentos_unidos():
+    lector = abrir_wav(io.BytesIO(fake_upstream.wav_sintetico(SEGUNDOS)))
+    assert len(planear_segmentos(lector)) > 1
+
+    async def todos():
+        return [resultado async for resultado in transcribir_segmentos(lector, transcribir_falso)]
+
+    textos = [texto for _, _, texto in sorted(asyncio.run(todos()))]
+    assert texto_completo(textos) == fake_upstream.texto_sintetico(SEGUNDOS)
+
+
+def test_unir_textos_quita_solape():
+    assert unir_textos("hola como estas", "Estás bien gracias") == "hola como estas bien gracias"
+    assert unir_textos("uno dos", "tres cuatro") == "uno dos tres cuatro"
+
+
+def test_upload_segmentado(en_app):
+    fake_upstream.config.transcribir_wav = True
+    audio = fake_upstream.wav_sintetico(SEGUNDOS)
+
+    async def prueba(http):
+        llamadas = fake_upstream.config.llamadas
+        respuesta = await http.post("/transcribe/upload?segmentar=true", content=audio,
+                                    headers={"Content-Type": "audio/wav"})
+        return respuesta, fake_upstream.config.llamadas - llamadas
+
+    try:
+        respuesta, llamadas = en_app(prueba)
+    finally:
+        fake_upstream.config.transcribir_wav = False
+    assert respuesta.status_code == 200
+    assert respuesta.json()["text"] == fake_upstream.texto_sintetico(SEGUNDOS)
+    assert llamadas > 1
@@ -0,0 +1,73 @@
+"""Datos por usuario: sin datos del demo para desconocidos y portafolio validado en /usuarios"""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import usuarios
+from usuarios import AlmacenMemoria, AlmacenSQLite, ContextoUsuarios
+
+PERFIL_DEMO = {"nombre": "Demo"}
+TRANSACCIONES_DEMO = [{"tipo": "compra"}]
+PORTAFOLIO_DEMO = {"totalValue": 1, "distribution": []}
+
+
+class GestorFalso:
+    def snapshot(self):
+        return SimpleNamespace(version=1, datos=PORTAFOLIO_DEMO, contexto="contexto demo")
+
+
+def renderizar(portafolio, perfil, transacciones):
+    return (portafolio, perfil, transacciones)
+
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def contexto(request):
+    almacen = AlmacenMemoria() if request.param == "memoria" else AlmacenSQLite(":memory:")
+    return ContextoUsuarios(almacen, renderizar, GestorFalso(), PERFIL_DEMO, TRANSACCIONES_DEMO)
+
+
+def test_usuario_desconocido_sin_datos_demo(contexto):
+    assert contexto.datos(None)["perfil"] == PERFIL_DEMO
+    assert contexto.datos("nuevo") == {"perfil": {}, "transacciones": [], "portafolio": None}
+    assert contexto.contexto("nuevo") == (PORTAFOLIO_DEMO, {}, [])
+
+
+def test_lista_vacia_se_respeta(contexto):
+    contexto.actualizar("ana", perfil={"nombre": "Ana"}, transacciones=[])
+    assert contexto.datos("ana")["transacciones"] == []
+    assert contexto.contexto("ana") == (PORTAFOLIO_DEMO, {"nombre": "Ana"}, [])
+
+
+def test_ruta_sqlite_absoluta():
+    if "USUARIOS_SQLITE_PATH" not in os.environ:
+        assert os.path.isabs(usuarios.USUARIOS_SQLITE_PATH)
+
+
+def test_portafolio_invalido_responde_422(main, en_app):
+    async def prueba(http):
+        return await http.put("/usuarios/invalido", json={
+            "perfil": {"nombre": "Luis"},
+            "portafolio": {"totalValue": "mucho", "distribution": [{"name": "btc"}]},
+        })
+
+    assert en_app(prueba).status_code == 422
+    assert main.contexto_usuarios.almacen.leer("invalido") is None
+
+
+def test_portafolio_valido(main, en_app):
+    portafolio = {
+        "totalValue": 1500,
+        "distribution": [{"name": "Bitcoin", "value": 1000, "color": "#f7931a"},
+                         {"name": "USDT", "value": 500, "color": "#26a17b"}],
+    }
+
+    async def prueba(http):
+        return await http.put("/usuarios/valido", json={"portafolio": portafolio})
+
+    respuesta = en_app(prueba)
+    assert respuesta.status_code == 200
+    assert respuesta.json()["campos"] == ["portafolio"]
+    guardado = main.contexto_usuarios.datos("valido")["portafolio"]
+    assert guardado["distribution"][0]["color"] == "#f7931a"
+    assert "Valor total: $1500.00" in main.contexto_usuarios.contexto("valido")
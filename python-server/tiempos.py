@@ -0,0 +1,56 @@
+"""Medición de tiempo por etapa de cada petición.
+
+Los tiempos se exponen en la cabecera estándar `Server-Timing`, que el
+navegador muestra en la pestaña de red sin cambiar el contrato JSON, y en
+el histograma `etapa_duracion_segundos` de `/metrics`.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+
+from metricas import ETAPAS, traza_actual
+
+
+class Cronometro:
+    """Acumula la duración (ms) de cada etapa de una petición"""
+
+    def __init__(self, endpoint="otro"):
+        self.inicio = time.perf_counter()
+        self.endpoint = endpoint
+        self.etapas = {}
+        # Las etapas también quedan en la traza de la petición (log de peticiones lentas)
+        traza = traza_actual()
+        if traza is not None:
+            traza["etapas"] = self.etapas
+
+    def _registrar(self, nombre, desde):
+        ms = (time.perf_counter() - desde) * 1000
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + ms
+        ETAPAS.observar(ms / 1000, self.endpoint, nombre)
+
+    @contextmanager
+    def etapa(self, nombre):
+        desde = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._registrar(nombre, desde)
+
+    async def medir(self, nombre, coro):
+        """Espera `coro` registrando su duración; si se cancela se marca como descartada"""
+        desde = time.perf_counter()
+        try:
+            resultado = await coro
+        except asyncio.CancelledError:
+            self._registrar(f"{nombre}-descartado", desde)
+            raise
+        self._registrar(nombre, desde)
+        return resultado
+
+    def total_ms(self):
+        return (time.perf_counter() - self.inicio) * 1000
+
+    def server_timing(self):
+        partes = [f"{nombre};dur={ms:.1f}" for nombre, ms in self.etapas.items()]
+        partes.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(partes)
@@ -0,0 +1,141 @@
+"""Transcripción por segmentos para notas de voz largas.
+
+El audio se parte en segmentos de ~`TRANSCRIPCION_SEGMENTO_S` segundos
+que se solapan `TRANSCRIPCION_SOLAPE_S` segundos; cada corte se mueve al
+tramo más silencioso cercano para no partir palabras. Los segmentos se
+transcriben en paralelo (hasta `TRANSCRIPCION_PARALELO` a la vez) y los
+textos se unen quitando las palabras repetidas por el solape.
+
+Solo WAV/PCM se puede cortar sin decodificar (módulo `wave` de la
+biblioteca estándar); los formatos comprimidos (webm, ogg, mp3...) se
+transcriben completos. Buscar silencios requiere numpy; sin él los cortes
+son fijos.
+"""
+import asyncio
+import io
+import os
+import wave
+
+from clasificador import normalizar
+
+TRANSCRIPCION_SEGMENTO_S = float(os.getenv("TRANSCRIPCION_SEGMENTO_S", "30"))
+TRANSCRIPCION_SOLAPE_S = float(os.getenv("TRANSCRIPCION_SOLAPE_S", "1.5"))
+TRANSCRIPCION_PARALELO = int(os.getenv("TRANSCRIPCION_PARALELO", "4"))
+# Audios más cortos que esto van en una sola llamada
+TRANSCRIPCION_MIN_SEGMENTAR_S = float(os.getenv("TRANSCRIPCION_MIN_SEGMENTAR_S", "45"))
+# Cuánto puede moverse un corte buscando silencio, y tamaño de la ventana de energía
+BUSQUEDA_SILENCIO_S = 2.0
+VENTANA_ENERGIA_S = 0.02
+# Palabras máximas que se comparan al quitar el solape entre segmentos
+MAX_PALABRAS_SOLAPE = 15
+
+
+def abrir_wav(archivo):
+    """wave.Wave_read del archivo o None si no es WAV/PCM"""
+    archivo.seek(0)
+    try:
+        lector = wave.open(archivo, "rb")
+    except (wave.Error, EOFError):
+        archivo.seek(0)
+        return None
+    if lector.getcomptype() != "NONE":
+        archivo.seek(0)
+        return None
+    return lector
+
+
+def _mas_silencioso(lector, desde, hasta):
+    """Frame de menor energía en [desde, hasta), o None sin numpy / PCM de 16 bits"""
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    if lector.getsampwidth() != 2 or hasta <= desde:
+        return None
+    lector.setpos(desde)
+    muestras = np.frombuffer(lector.readframes(hasta - desde), dtype="<i2").astype(np.float32)
+    muestras = muestras.reshape(-1, lector.getnchannels()).mean(axis=1)
+    ventana = max(int(lector.getframerate() * VENTANA_ENERGIA_S), 1)
+    ventanas = len(muestras) // ventana
+    if ventanas == 0:
+        return None
+    energia = (muestras[:ventanas * ventana].reshape(ventanas, ventana) ** 2).mean(axis=1)
+    return desde + int(energia.argmin()) * ventana + ventana // 2
+
+
+def planear_segmentos(lector, segmento_s=TRANSCRIPCION_SEGMENTO_S, solape_s=TRANSCRIPCION_SOLAPE_S):
+    """[(inicio, fin)] en frames, con solape entre segmentos consecutivos"""
+    tasa = lector.getframerate()
+    total = lector.getnframes()
+    largo = int(segmento_s * tasa)
+    solape = int(solape_s * tasa)
+    margen = int(BUSQUEDA_SILENCIO_S * tasa)
+
+    cortes = [0]
+    while total - cortes[-1] > largo + margen:
+        objetivo = cortes[-1] + largo
+        silencio = _mas_silencioso(lector, objetivo - margen, min(objetivo + margen, total))
+        cortes.append(silencio if silencio is not None else objetivo)
+    cortes.append(total)
+    return [
+        (max(inicio - solape, 0) if i else inicio, fin)
+        for i, (inicio, fin) in enumerate(zip(cortes, cortes[1:]))
+    ]
+
+
+def extraer_segmento(lector, inicio, fin):
+    """WAV en memoria con los frames [inicio, fin)"""
+    lector.setpos(inicio)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as escritor:
+        escritor.setnchannels(lector.getnchannels())
+        escritor.setsampwidth(lector.getsampwidth())
+        escritor.setframerate(lector.getframerate())
+        escritor.writeframes(lector.readframes(fin - inicio))
+    buffer.seek(0)
+    return buffer
+
+
+def unir_textos(anterior, siguiente):
+    """Concatena quitando del inicio de `siguiente` las palabras que repite el final de `anterior`"""
+    palabras_a = anterior.split()
+    palabras_b = siguiente.split()
+    normal_a = [normalizar(p) for p in palabras_a[-MAX_PALABRAS_SOLAPE:]]
+    normal_b = [normalizar(p) for p in palabras_b[:MAX_PALABRAS_SOLAPE]]
+    for k in range(min(len(normal_a), len(normal_b)), 0, -1):
+        if normal_a[-k:] == normal_b[:k]:
+            palabras_b = palabras_b[k:]
+            break
+    return " ".join(palabras_a + palabras_b)
+
+
+async def transcribir_segmentos(lector, transcribir, paralelo=TRANSCRIPCION_PARALELO, segmentos=None):
+    """Itera (indice, inicio_s, texto) conforme termina cada segmento (no en orden).
+
+    `transcribir(nombre, archivo)` es una corrutina que devuelve el texto.
+    """
+    segmentos = segmentos or planear_segmentos(lector)
+    tasa = lector.getframerate()
+    semaforo = asyncio.Semaphore(paralelo)
+
+    async def uno(indice, inicio, fin):
+        async with semaforo:
+            # Leer del WAV no cede el event loop: no hay dos lecturas intercaladas
+            archivo = extraer_segmento(lector, inicio, fin)
+            return indice, inicio / tasa, await transcribir(f"segmento-{indice}.wav", archivo)
+
+    tareas = [asyncio.ensure_future(uno(i, inicio, fin)) for i, (inicio, fin) in enumerate(segmentos)]
+    try:
+        for siguiente in asyncio.as_completed(tareas):
+            yield await siguiente
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+
+def texto_completo(textos):
+    """Une los textos de todos los segmentos, en orden"""
+    resultado = ""
+    for texto in textos:
+        resultado = unir_textos(resultado, texto) if resultado else texto.strip()
+    return resultado
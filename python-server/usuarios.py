@@ -0,0 +1,211 @@
+"""Perfil, portafolio y transacciones por usuario.
+
+Los datos de cada usuario viven en un almacén intercambiable:
+
+- `AlmacenMemoria`: en proceso, con expulsión LRU.
+- `AlmacenSQLite`: persistente en un archivo (o `:memory:` para pruebas);
+  en modo WAL para que varios workers lo compartan. Las lecturas corren en
+  el event loop con una espera corta (`USUARIOS_ESPERA_S`; en WAL leer no
+  espera a quien escribe); las escrituras usan su propia conexión, que sí
+  espera su turno, y `/usuarios` las ejecuta en un hilo.
+
+`ContextoUsuarios` renderiza el contexto fijo de cada usuario una sola vez
+y lo reutiliza hasta que se escriben sus datos o cambia el portafolio
+compartido que usa por defecto. Cada escritura en SQLite sube la versión
+del usuario, así un worker se entera de lo que escribió otro y re-renderiza.
+"""
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+USUARIOS_BACKEND = os.getenv("USUARIOS_BACKEND", "memoria")
+# Ruta absoluta: no depende del directorio desde el que se arranque el servidor
+USUARIOS_SQLITE_PATH = os.getenv(
+    "USUARIOS_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "usuarios.db"),
+)
+USUARIOS_MAX = int(os.getenv("USUARIOS_MAX", "10000"))
+# Espera máxima de una lectura (event loop) y de una escritura (hilo) si el archivo está ocupado
+USUARIOS_ESPERA_S = float(os.getenv("USUARIOS_ESPERA_S", "0.05"))
+USUARIOS_ESPERA_ESCRITURA_S = float(os.getenv("USUARIOS_ESPERA_ESCRITURA_S", "5"))
+
+CAMPOS = ("perfil", "transacciones", "portafolio")
+
+
+class AlmacenMemoria:
+    def __init__(self, max_usuarios=USUARIOS_MAX):
+        self.max_usuarios = max_usuarios
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def leer(self, user_id):
+        with self._lock:
+            datos = self._datos.get(user_id)
+            if datos is not None:
+                self._datos.move_to_end(user_id)
+            return datos
+
+    def guardar(self, user_id, datos):
+        with self._lock:
+            self._datos[user_id] = datos
+            self._datos.move_to_end(user_id)
+            while len(self._datos) > self.max_usuarios:
+                self._datos.popitem(last=False)
+
+    def abrir(self):
+        pass
+
+    def version(self, user_id):
+        """En memoria nadie más escribe: basta con la invalidación local"""
+        return 0
+
+
+class AlmacenSQLite:
+    """El archivo se abre en el primer uso (no al importar) y se reabre tras un fork"""
+
+    def __init__(self, ruta=USUARIOS_SQLITE_PATH, espera=USUARIOS_ESPERA_S,
+                 espera_escritura=USUARIOS_ESPERA_ESCRITURA_S):
+        self.ruta = ruta
+        self.espera = espera
+        self.espera_escritura = espera_escritura
+        self._conexion = None
+        self._conexion_escritura = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._lock_escritura = threading.Lock()
+
+    def _abrir(self):
+        """Conexiones (lectura, escritura) del proceso actual (llamar con el lock tomado)"""
+        if self._conexion is not None and self._pid == os.getpid():
+            return self._conexion
+        escritura = sqlite3.connect(self.ruta, check_same_thread=False, timeout=self.espera_escritura)
+        with escritura:
+            if self.ruta != ":memory:":
+                escritura.execute("PRAGMA journal_mode=WAL")
+            escritura.execute(
+                "CREATE TABLE IF NOT EXISTS usuarios ("
+                "id TEXT PRIMARY KEY, perfil TEXT, transacciones TEXT, portafolio TEXT, "
+                "version INTEGER DEFAULT 0)"
+            )
+            columnas = {fila[1] for fila in escritura.execute("PRAGMA table_info(usuarios)")}
+            if "version" not in columnas:
+                # Archivos creados antes de que hubiera versión por usuario
+                escritura.execute("ALTER TABLE usuarios ADD COLUMN version INTEGER DEFAULT 0")
+        if self.ruta == ":memory:":
+            # Cada conexión a :memory: es otra base: lectura y escritura comparten la misma (y su lock)
+            lectura = escritura
+            self._lock_escritura = self._lock
+        else:
+            lectura = sqlite3.connect(self.ruta, check_same_thread=False, timeout=self.espera)
+        self._conexion, self._conexion_escritura, self._pid = lectura, escritura, os.getpid()
+        return lectura
+
+    def abrir(self):
+        with self._lock:
+            self._abrir()
+
+    def leer(self, user_id):
+        with self._lock:
+            fila = self._abrir().execute(
+                "SELECT perfil, transacciones, portafolio FROM usuarios WHERE id = ?", (user_id,)
+            ).fetchone()
+        if fila is None:
+            return None
+        return {campo: json.loads(valor) if valor else None for campo, valor in zip(CAMPOS, fila)}
+
+    def guardar(self, user_id, datos):
+        """Puede esperar a otro worker hasta `espera_escritura`: llamar fuera del event loop"""
+        valores = [json.dumps(datos.get(campo)) if datos.get(campo) is not None else None for campo in CAMPOS]
+        with self._lock:
+            self._abrir()
+            conexion = self._conexion_escritura
+        with self._lock_escritura, conexion:
+            conexion.execute(
+                "INSERT INTO usuarios (id, perfil, transacciones, portafolio) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET perfil = excluded.perfil, "
+                "transacciones = excluded.transacciones, portafolio = excluded.portafolio, "
+                "version = version + 1",
+                (user_id, *valores),
+            )
+
+    def version(self, user_id):
+        with self._lock:
+            fila = self._abrir().execute("SELECT version FROM usuarios WHERE id = ?", (user_id,)).fetchone()
+        return fila[0] if fila else None
+
+
+def crear_almacen(backend=USUARIOS_BACKEND):
+    if backend == "sqlite":
+        return AlmacenSQLite()
+    return AlmacenMemoria()
+
+
+class ContextoUsuarios:
+    """Contexto renderizado por usuario, invalidado al escribir sus datos"""
+
+    def __init__(self, almacen, renderizar, gestor_portafolio, perfil_defecto,
+                 transacciones_defecto, max_renders=USUARIOS_MAX):
+        self.almacen = almacen
+        self.renderizar = renderizar
+        self.gestor_portafolio = gestor_portafolio
+        self.perfil_defecto = perfil_defecto
+        self.transacciones_defecto = transacciones_defecto
+        self.max_renders = max_renders
+        # user_id -> ((version del portafolio compartido, version del usuario), contexto)
+        self._renders = OrderedDict()
+        self.renderizados = 0
+
+    def datos(self, user_id):
+        """Datos efectivos del usuario.
+
+        Sin userId son los del usuario demo. Con userId solo lo guardado: un
+        usuario desconocido recibe un perfil vacío y sin transacciones, y una
+        lista vacía guardada se respeta.
+        """
+        if not user_id:
+            return {"perfil": self.perfil_defecto, "transacciones": self.transacciones_defecto, "portafolio": None}
+        guardado = self.almacen.leer(user_id) or {}
+        perfil = guardado.get("perfil")
+        transacciones = guardado.get("transacciones")
+        return {
+            "perfil": {} if perfil is None else perfil,
+            "transacciones": [] if transacciones is None else transacciones,
+            "portafolio": guardado.get("portafolio"),
+        }
+
+    def perfil(self, user_id):
+        return self.datos(user_id)["perfil"]
+
+    def contexto(self, user_id):
+        snapshot = self.gestor_portafolio.snapshot()
+        if not user_id:
+            # Usuario demo: el gestor ya tiene su contexto renderizado
+            return snapshot.contexto
+
+        version = (snapshot.version, self.almacen.version(user_id))
+        entrada = self._renders.get(user_id)
+        if entrada and entrada[0] == version:
+            self._renders.move_to_end(user_id)
+            return entrada[1]
+
+        datos = self.datos(user_id)
+        contexto = self.renderizar(
+            snapshot.datos if datos["portafolio"] is None else datos["portafolio"],
+            datos["perfil"],
+            datos["transacciones"],
+        )
+        self.renderizados += 1
+        self._renders[user_id] = (version, contexto)
+        while len(self._renders) > self.max_renders:
+            self._renders.popitem(last=False)
+        return contexto
+
+    def actualizar(self, user_id, **cambios):
+        """Escribe los campos indicados (perfil, transacciones, portafolio) e invalida el render"""
+        guardado = dict(self.almacen.leer(user_id) or {})
+        guardado.update({campo: valor for campo, valor in cambios.items() if campo in CAMPOS and valor is not None})
+        self.almacen.guardar(user_id, guardado)
+        self._renders.pop(user_id, None)
+        return guardado
@@ -0,0 +1,193 @@
+"""Índice vectorial local para el conocimiento educativo y de transacciones.
+
+Los embeddings salen de una función determinista sin modelo externo:
+cada palabra se lleva primero a su concepto (un pequeño léxico financiero
+de sinónimos, así "juntar dinero" cae cerca de "ahorro"; las siglas y
+palabras cortas solo cuentan completas) y luego palabra,
+concepto y trigramas de caracteres se proyectan con hashing a un vector
+normalizado.
+
+Como el embedding de una consulta corta tiene muy pocas dimensiones no
+nulas, la matriz se guarda por dimensión (forma `dimension x fragmentos`):
+la similitud coseno solo lee las filas de esas dimensiones, una fracción
+de la matriz, y el top-k sale de `argpartition`.
+
+El índice se construye offline y se guarda como `.npy` + `.json`; los
+workers lo abren con `mmap_mode="r"`, así que arrancar no recalcula nada y
+todas las instancias comparten las mismas páginas en memoria.
+
+Construir el índice (desde python-server/):
+    python -m vectores
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from clasificador import normalizar
+from conocimiento import PALABRAS_VACIAS
+
+VECTORES_DIMENSION = int(os.getenv("VECTORES_DIMENSION", "256"))
+VECTORES_RUTA = os.getenv(
+    "VECTORES_RUTA",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "indices", "conocimiento"),
+)
+# Por debajo de esta similitud el parecido es ruido de las colisiones del hashing
+VECTORES_SIMILITUD_MIN = float(os.getenv("VECTORES_SIMILITUD_MIN", "0.25"))
+TIPO_EMBEDDING = "hash-conceptos-v2"
+
+# Palabra (normalizada, o su prefijo) -> concepto compartido por sus sinónimos
+CONCEPTOS = {
+    "ahorr": "ahorro", "junt": "ahorro", "guard": "ahorro", "apart": "ahorro",
+    "reserv": "ahorro", "alcancia": "ahorro", "colchon": "ahorro",
+    "gast": "gasto", "compra": "gasto", "consum": "gasto", "despilf": "gasto",
+    "presup": "presupuesto", "planif": "presupuesto", "organiz": "presupuesto", "quincen": "presupuesto",
+    "deud": "deuda", "prest": "deuda", "credit": "deuda", "tarjet": "deuda", "adeud": "deuda",
+    "invers": "inversion", "invert": "inversion", "rendim": "inversion", "rentab": "inversion",
+    "cript": "cripto", "bitco": "cripto", "ether": "cripto",
+    "token": "cripto", "moned": "cripto",
+    "comis": "comision", "cobr": "comision",
+    "envi": "transferencia", "mand": "transferencia", "transf": "transferencia",
+    "segur": "seguridad", "estaf": "seguridad", "fraud": "seguridad", "clave": "seguridad",
+    "seed": "seguridad", "phras": "seguridad", "hacke": "seguridad", "roba": "seguridad",
+    "riesg": "riesgo", "volat": "riesgo", "perd": "riesgo",
+    "diversif": "diversificacion", "repart": "diversificacion",
+    "stak": "staking", "recomp": "staking",
+    "dinero": "dinero", "pesos": "dinero", "sueld": "dinero",
+    "ingres": "dinero",
+}
+# Palabra completa -> concepto: como prefijo atraparían otras palabras
+# ("apr" en "aprender", "robo" en "robusto", "plata" en "plataforma", "compre" en "comprender")
+CONCEPTOS_EXACTOS = {
+    "compre": "gasto", "compro": "gasto",
+    "btc": "cripto", "eth": "cripto",
+    "fee": "comision", "fees": "comision", "gas": "comision",
+    "robo": "seguridad", "robos": "seguridad",
+    "apr": "staking", "apy": "staking",
+    "lana": "dinero", "plata": "dinero",
+}
+_PREFIJOS = sorted(CONCEPTOS, key=len, reverse=True)
+
+
+def concepto(palabra):
+    if palabra in CONCEPTOS_EXACTOS:
+        return CONCEPTOS_EXACTOS[palabra]
+    for prefijo in _PREFIJOS:
+        if palabra.startswith(prefijo):
+            return CONCEPTOS[prefijo]
+    return None
+
+
+def _cubeta(caracteristica, dimension):
+    digest = hashlib.blake2b(caracteristica.encode("utf-8"), digest_size=8).digest()
+    valor = int.from_bytes(digest, "little")
+    return valor % dimension, 1.0 if (valor >> 63) & 1 else -1.0
+
+
+def embeber(texto, dimension=VECTORES_DIMENSION):
+    """Vector float32 normalizado (L2) del texto"""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for palabra in normalizar(texto).split():
+        if palabra in PALABRAS_VACIAS or len(palabra) < 2:
+            continue
+        caracteristicas = [("p:" + palabra[:5], 1.0)]
+        idea = concepto(palabra)
+        if idea:
+            caracteristicas.append(("c:" + idea, 2.0))
+        marcada = f"#{palabra}#"
+        caracteristicas.extend(("t:" + marcada[i:i + 3], 0.3) for i in range(len(marcada) - 2))
+        for caracteristica, peso in caracteristicas:
+            indice, signo = _cubeta(caracteristica, dimension)
+            vector[indice] += signo * peso
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma else vector
+
+
+def huella_textos(textos):
+    h = hashlib.sha256()
+    for texto in textos:
+        h.update(texto.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class IndiceVectorial:
+    def __init__(self, matriz_t, metadatos):
+        # matriz_t[d, i] = componente d del embedding del fragmento i
+        self.matriz_t = matriz_t
+        self.metadatos = metadatos
+        self.dimension = matriz_t.shape[0]
+
+    @classmethod
+    def construir(cls, textos, dimension=VECTORES_DIMENSION):
+        matriz_t = np.zeros((dimension, len(textos)), dtype=np.float32)
+        for i, texto in enumerate(textos):
+            matriz_t[:, i] = embeber(texto, dimension)
+        return cls(matriz_t, {
+            "tipo": TIPO_EMBEDDING,
+            "dimension": dimension,
+            "total": len(textos),
+            "huella": huella_textos(textos),
+        })
+
+    def guardar(self, ruta=VECTORES_RUTA):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        np.save(ruta + ".npy", np.ascontiguousarray(self.matriz_t, dtype=np.float32))
+        with open(ruta + ".json", "w", encoding="utf-8") as f:
+            json.dump(self.metadatos, f)
+
+    @classmethod
+    def abrir(cls, ruta=VECTORES_RUTA):
+        """Abre el índice guardado con mmap (sin copiarlo a memoria)"""
+        with open(ruta + ".json", "r", encoding="utf-8") as f:
+            metadatos = json.load(f)
+        matriz_t = np.load(ruta + ".npy", mmap_mode="r")
+        return cls(matriz_t, metadatos)
+
+    def buscar(self, consulta, top_k=4, minimo=VECTORES_SIMILITUD_MIN):
+        """[(similitud coseno, id)] de mayor a menor, solo por encima de `minimo`"""
+        total = self.matriz_t.shape[1]
+        q = embeber(consulta, self.dimension)
+        activas = np.flatnonzero(q)
+        if total == 0 or len(activas) == 0:
+            return []
+        similitudes = q[activas] @ self.matriz_t[activas]
+        k = min(top_k, total)
+        candidatos = np.argpartition(similitudes, total - k)[total - k:]
+        orden = candidatos[np.argsort(-similitudes[candidatos])]
+        return [(float(similitudes[i]), int(i)) for i in orden if similitudes[i] >= minimo]
+
+
+def cargar_o_construir(textos, ruta=VECTORES_RUTA):
+    """Usa el índice en disco si corresponde a estos textos; si no, lo calcula en memoria"""
+    try:
+        indice = IndiceVectorial.abrir(ruta)
+        if (indice.metadatos.get("huella") == huella_textos(textos)
+                and indice.metadatos.get("tipo") == TIPO_EMBEDDING):
+            return indice
+        print("⚠️  Índice vectorial en disco desactualizado; se recalcula en memoria")
+    except FileNotFoundError:
+        pass
+    except (ValueError, OSError, json.JSONDecodeError) as e:
+        # Archivo truncado o corrupto (ej. una escritura interrumpida): se ignora y se recalcula
+        print(f"⚠️  Índice vectorial en disco ilegible ({e}); se recalcula en memoria")
+    return IndiceVectorial.construir(textos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye el índice vectorial de conocimiento")
+    parser.add_argument("--ruta", default=VECTORES_RUTA)
+    parser.add_argument("--dimension", type=int, default=VECTORES_DIMENSION)
+    args = parser.parse_args()
+
+    from main import indice_conocimiento
+    secciones = indice_conocimiento.construir().secciones
+    indice = IndiceVectorial.construir([s.texto for s in secciones], args.dimension)
+    indice.guardar(args.ruta)
+    print(f"Índice guardado en {args.ruta}.npy ({len(secciones)} fragmentos, dimensión {args.dimension})")
+
+
+if __name__ == "__main__":
+    main()
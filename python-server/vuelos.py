@@ -0,0 +1,71 @@
+"""Single-flight: llamadas idénticas simultáneas comparten una sola ejecución.
+
+Si llega una llamada con la misma clave que otra todavía en vuelo, no se
+lanza otra: espera el resultado de la primera. Cada llamador espera a
+través de `asyncio.shield`, así que si un cliente se desconecta solo se
+cancela su espera y la llamada compartida sigue para los demás. Cuando ya
+no queda nadie esperando, la llamada se cancela.
+"""
+import asyncio
+import hashlib
+import json
+
+
+def clave_canonica(*partes, **parametros):
+    """Hash estable de los argumentos (dicts con llaves ordenadas)"""
+    canonico = json.dumps([partes, parametros], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+def consumir_excepcion(tarea):
+    """Evita 'Task exception was never retrieved' si nadie quedó esperando"""
+    if not tarea.cancelled():
+        tarea.exception()
+
+
+class GrupoVuelos:
+    def __init__(self, nombre):
+        self.nombre = nombre
+        # clave -> [tarea, llamadores esperando]
+        self._en_vuelo = {}
+        self.conteos = {"ejecutadas": 0, "compartidas": 0, "canceladas": 0}
+        self.max_esperando = 0
+
+    def _terminar(self, clave, tarea):
+        entrada = self._en_vuelo.get(clave)
+        if entrada and entrada[0] is tarea:
+            del self._en_vuelo[clave]
+        consumir_excepcion(tarea)
+
+    async def ejecutar(self, clave, crear):
+        """Resultado de `crear()` (una corrutina nueva), compartido con las llamadas iguales en vuelo"""
+        entrada = self._en_vuelo.get(clave)
+        if entrada is None:
+            tarea = asyncio.ensure_future(crear())
+            entrada = self._en_vuelo[clave] = [tarea, 0]
+            tarea.add_done_callback(lambda t: self._terminar(clave, t))
+            self.conteos["ejecutadas"] += 1
+        else:
+            self.conteos["compartidas"] += 1
+        tarea = entrada[0]
+        entrada[1] += 1
+        self.max_esperando = max(self.max_esperando, entrada[1])
+        try:
+            return await asyncio.shield(tarea)
+        finally:
+            entrada[1] -= 1
+            if entrada[1] == 0 and not tarea.done():
+                # El último llamador se fue: nadie usará el resultado. Se saca del
+                # mapa antes de cancelar para que una llamada igual lance otra tarea
+                if self._en_vuelo.get(clave) is entrada:
+                    del self._en_vuelo[clave]
+                tarea.cancel()
+                self.conteos["canceladas"] += 1
+
+    def estadisticas(self):
+        return {
+            **self.conteos,
+            "en_vuelo": len(self._en_vuelo),
+            "esperando": sum(entrada[1] for entrada in self._en_vuelo.values()),
+            "max_esperando": self.max_esperando,
+        }